@@ -0,0 +1,272 @@
+"""
+RFModel benchmark suite.
+
+Runs the main stages (read_profile, geod_profile, calc_path_loss_lonlat, calc_path_loss_lonlat_multi)
+on a generated synthetic DEM with a deterministic stand-in model (no TIREM license is needed),
+and writes the timings to a json file.
+
+    python benchmarks/bench_rfmodel.py run --out results.json [--dem-size 2048] [--links 200]
+    python benchmarks/bench_rfmodel.py compare baseline.json results.json [--threshold 0.1]
+
+compare exits with 1 if any stage got slower than the baseline by more than threshold,
+run exits with 1 if importing the startup modules takes longer than --import-budget.
+
+Each stage records its own memory peak (peak_traced_mb, of the Python and NumPy allocations, by tracemalloc,
+in an extra untimed run); the process-wide peak RSS is recorded once, for the whole run.
+"""
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from rfmodel.rfmodel_types import RFModelReturn
+
+default_del_s_values = (30.0, 100.0, 1000.0)
+startup_modules = ('rfmodel.rfmodel', 'rfmodel.read_profile')
+default_import_budget = 0.5  # [s]
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """ :return: the peak RSS of the process so far [MB], it is cumulative so it can't tell the stages apart """
+    try:
+        import resource
+    except ImportError:  # i.e. on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def stand_in_loss(tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                  profile_elevation, profile_distance, **kwargs) -> RFModelReturn:
+    """ free space loss and a single knife edge (the highest obstruction above the direct ray) """
+    n = num_profile_points
+    elevation = np.asarray(profile_elevation[:n], dtype=np.float64)
+    distance = np.asarray(profile_distance[:n], dtype=np.float64)
+    d = max(float(distance[-1]), 1.0)
+    free_space_loss = 20 * math.log10(d / 1000) + 20 * math.log10(frequency) + 32.45
+    ray = tx_antenna_height + (rx_antenna_height - tx_antenna_height) * distance / d
+    h = elevation - ray
+    i = int(np.argmax(h[1:-1])) + 1 if n > 2 else 0
+    wavelength = 299.792458 / frequency
+    d1, d2 = max(distance[i], 1.0), max(d - distance[i], 1.0)
+    v = h[i] * math.sqrt(2 * d / (wavelength * d1 * d2))
+    diffraction_loss = 6.9 + 20 * math.log10(math.sqrt((v - 0.1) ** 2 + 1) + v - 0.1) if v > -0.78 else 0.0
+    return RFModelReturn(-v, free_space_loss + diffraction_loss, free_space_loss, 'STANDIN',
+                         'LOS' if v <= -0.78 else 'DIF')
+
+
+def synthetic_terrain(size: int, seed: int = 0) -> np.ndarray:
+    """ deterministic hilly terrain of shape (size, size) [m] """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    terrain = np.zeros((size, size), dtype=np.float64)
+    for octave in range(1, 6):
+        fx, fy = rng.uniform(1, 4, 2) * octave * 2
+        phase = rng.uniform(0, 2 * np.pi)
+        terrain += np.sin(2 * np.pi * fx * x + phase) * np.cos(2 * np.pi * fy * y - phase) * 600 / octave
+    terrain += rng.normal(0, 5, terrain.shape)
+    return np.clip(terrain + 400, 0, None).astype(np.float32)
+
+
+def create_synthetic_dem(path: Path, size: int, dem_format: str, extent: float = 2.0,
+                         lon: float = 34.0, lat: float = 33.0):
+    """ creates a synthetic geographic DEM of extent x extent degrees at (lon, lat) as its top left corner """
+    terrain = synthetic_terrain(size)
+    pixel_size = extent / size
+    geotransform = (lon, pixel_size, 0.0, lat, 0.0, -pixel_size)
+    if dem_format == 'mmap':
+        from rfmodel.dem.mmap_dem import MMapDEM
+        return MMapDEM.from_array(path / 'dem.raw', terrain, geotransform)
+    from osgeo import gdal, osr
+    filename = str(path / 'dem.tif')
+    ds = gdal.GetDriverByName('GTiff').Create(filename, size, size, 1, gdal.GDT_Float32,
+                                              options=['TILED=YES', 'COMPRESS=DEFLATE'])
+    ds.SetGeoTransform(geotransform)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    ds.SetSpatialRef(srs)
+    ds.GetRasterBand(1).WriteArray(terrain)
+    ds = None
+    return filename
+
+
+def write_synthetic_profile(filename: Path, count: int, del_s: float = 30.0):
+    elevation = synthetic_terrain(math.isqrt(count - 1) + 1, seed=1).ravel()[:count]
+    with open(filename, 'w') as f:
+        f.write(f'{count}\n')
+        for i, e in enumerate(elevation):
+            f.write(f'{i * del_s:.1f} {e:.1f}\n')
+
+
+def time_stage(func: Callable[[], None], repeat: int) -> float:
+    """ :return: the best time of repeat runs [s] """
+    best = math.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def trace_stage_peak_mb(func: Callable[[], None]) -> float:
+    """ :return: the peak memory allocated by func (above what was allocated before it) [MB] """
+    tracemalloc.start()
+    try:
+        base, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - base) / 1024 ** 2
+
+
+def time_import(modules: Sequence[str], repeat: int) -> float:
+    """ :return: the best time of importing modules in a fresh interpreter [s] """
+    code = (f'import time; t = time.perf_counter(); import {", ".join(modules)}; '
+            f'print(time.perf_counter() - t)')
+    return min(float(subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                                    text=True).stdout) for _ in range(repeat))
+
+
+def run_benchmarks(dem_size: int = 2048, links: int = 200, profile_points: int = 100_000,
+                   del_s_values=default_del_s_values, link_del_s: float = 100.0,
+                   dem_format: str = 'gtiff', repeat: int = 3, seed: int = 0,
+                   import_budget: float = default_import_budget) -> dict:
+    from rfmodel.geod.geod_profile import geod_profile
+    from rfmodel.read_profile import read_profile
+    from rfmodel.rfmodel import calc_path_loss_lonlat, calc_path_loss_lonlat_multi
+
+    stages: Dict[str, dict] = {}
+
+    def add_stage(name: str, func: Callable[[], None], count: Optional[int] = None, unit: str = 'links'):
+        seconds = time_stage(func, repeat)
+        stage = dict(seconds=seconds)
+        if count is not None:
+            stage[f'{unit}_per_second'] = count / seconds if seconds else math.inf
+        stage['peak_traced_mb'] = trace_stage_peak_mb(func)
+        stages[name] = stage
+        print(f'{name:40} {seconds:10.4f} s')
+
+    rng = np.random.default_rng(seed)
+    lon1, lon2 = rng.uniform(34.1, 35.9, (2, links))
+    lat1, lat2 = rng.uniform(31.1, 32.9, (2, links))
+    tx_antenna_height = rng.uniform(10, 100, links)
+    rfmodel_options = dict(frequency=1000.0)
+
+    # the startup of a short lived worker, that only reads profiles and calls the model
+    seconds = time_import(startup_modules, repeat)
+    stages['import'] = dict(seconds=seconds, budget=import_budget)
+    print(f'{"import":40} {seconds:10.4f} s (budget: {import_budget} s)')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        profile_filename = tmp / 'profile.dat'
+        write_synthetic_profile(profile_filename, profile_points)
+        add_stage('read_profile', lambda: read_profile(str(profile_filename)), profile_points, unit='points')
+
+        dem = create_synthetic_dem(tmp, dem_size, dem_format)
+        for del_s in del_s_values:
+            def run_geod_profile():
+                for i in range(links):
+                    geod_profile(dem, lon1=lon1[i], lat1=lat1[i], lon2=lon2[i], lat2=lat2[i], del_s=del_s)
+            add_stage(f'geod_profile[del_s={del_s:g}]', run_geod_profile, links)
+
+        def run_calc_path_loss_lonlat():
+            for i in range(links):
+                calc_path_loss_lonlat(
+                    stand_in_loss, dem,
+                    profile_options=dict(lon1=lon1[i], lat1=lat1[i], lon2=lon2[i], lat2=lat2[i], del_s=link_del_s),
+                    rfmodel_options=rfmodel_options,
+                    tx_antenna_height=tx_antenna_height[i], rx_antenna_height=2.0)
+        add_stage('calc_path_loss_lonlat', run_calc_path_loss_lonlat, links)
+
+        def run_calc_path_loss_lonlat_multi():
+            calc_path_loss_lonlat_multi(
+                stand_in_loss, dem, count=links,
+                main_options=dict(tx_antenna_height=tx_antenna_height, rx_antenna_height=2.0),
+                profile_options=dict(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2, del_s=link_del_s),
+                rfmodel_options=rfmodel_options)
+        add_stage('calc_path_loss_lonlat_multi', run_calc_path_loss_lonlat_multi, links)
+        del dem
+
+    return dict(
+        config=dict(dem_size=dem_size, links=links, profile_points=profile_points, del_s_values=list(del_s_values),
+                    link_del_s=link_del_s, dem_format=dem_format, repeat=repeat, seed=seed,
+                    import_budget=import_budget),
+        environment=dict(python=platform.python_version(), numpy=np.__version__, platform=platform.platform()),
+        peak_rss_mb=get_peak_rss_mb(),
+        stages=stages)
+
+
+def compare_results(baseline: dict, results: dict, threshold: float = 0.1) -> list:
+    """ :return: the names of the stages that are slower than the baseline by more than threshold """
+    regressions = []
+    if baseline.get('config') != results.get('config'):
+        print('warning: the benchmark configurations differ')
+    for name, stage in results['stages'].items():
+        base_stage = baseline['stages'].get(name)
+        if base_stage is None:
+            print(f'{name:40} {"":>10} {stage["seconds"]:10.4f} s (new)')
+            continue
+        ratio = stage['seconds'] / base_stage['seconds'] if base_stage['seconds'] else math.inf
+        regression = ratio > 1 + threshold
+        if regression:
+            regressions.append(name)
+        print(f'{name:40} {base_stage["seconds"]:10.4f} {stage["seconds"]:10.4f} s '
+              f'x{ratio:6.2f}{"  REGRESSION" if regression else ""}')
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='RFModel benchmark suite')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--out', default='bench_results.json')
+    run_parser.add_argument('--dem-size', type=int, default=2048)
+    run_parser.add_argument('--dem-format', choices=('gtiff', 'mmap'), default='gtiff')
+    run_parser.add_argument('--links', type=int, default=200)
+    run_parser.add_argument('--profile-points', type=int, default=100_000)
+    run_parser.add_argument('--del-s', type=float, nargs='+', default=list(default_del_s_values))
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--import-budget', type=float, default=default_import_budget,
+                            help='the allowed import time of the startup modules [s]')
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown ratio')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_benchmarks(dem_size=args.dem_size, links=args.links, profile_points=args.profile_points,
+                                 del_s_values=args.del_s, dem_format=args.dem_format, repeat=args.repeat,
+                                 import_budget=args.import_budget)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results written to {args.out}')
+        if results['stages']['import']['seconds'] > args.import_budget:
+            print('the import time is over budget')
+            return 1
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+    regressions = compare_results(baseline, results, threshold=args.threshold)
+    if regressions:
+        print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
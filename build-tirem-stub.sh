@@ -0,0 +1,7 @@
+#!/bin/sh
+# Builds the tirem3 extension on Linux against a stand-in (stub) of the licensed TIREM library.
+# The stub is meant only for building and testing the Python API, its results are NOT TIREM's.
+set -e
+gcc -shared -fPIC -O2 -o src/tirem/libtirem3.so src/tirem/stub/tirem3_stub.c -lm
+python setup_tirem_pyd.py build_ext --inplace
+mv tirem3.*.so src/tirem/
@@ -1,3 +1,4 @@
+import sys
 from distutils.core import setup
 from distutils.extension import Extension
 
@@ -19,13 +20,19 @@ packages = [__package_name__]
 package_dir = {'': package_root}
 src_root = 'src/tirem'
 
+if sys.platform == 'win32':
+    library_options = dict(libraries=["libtirem3"])
+else:
+    # i.e. libtirem3.so built from the stub by build-tirem-stub.sh, next to the extension
+    library_options = dict(libraries=["tirem3"], runtime_library_dirs=["$ORIGIN"])
+
 ext_modules = Extension(
     name='tirem3',
     sources=[src_root + "/tirem3.pyx"],
     language="c",
-    libraries=["libtirem3"],
     library_dirs=[src_root],
-    include_dirs=[src_root, numpy.get_include()]
+    include_dirs=[src_root, numpy.get_include()],
+    **library_options
 )
 
 setup(
@@ -0,0 +1,551 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource, sample_dem
+from rfmodel.model_registry import get_model_capabilities
+from rfmodel.rfmodel_types import RFModelReturn
+
+if TYPE_CHECKING:
+    # GDAL and pyproj are imported on first use (by geod_profile), so a DEMSource is covered without GDAL
+    from osgeo_utils.auxiliary.util import PathOrDS
+    from rfmodel.geod.geod_profile import Geod
+
+deg_to_meters = 111_111
+
+
+class RadialProfiles(NamedTuple):
+    """
+    lon, lat: the origin (Tx) of the radials
+    azimuths: the azimuth of each radial [deg]
+    del_s: the distance increment along the radials [m]
+    distance: the distance of each step from the origin [m], shape (steps,)
+    elevation: the terrain elevation along each radial, shape (num_radials, steps)
+    """
+    lon: float
+    lat: float
+    azimuths: np.ndarray
+    del_s: float
+    distance: np.ndarray
+    elevation: np.ndarray
+
+
+class CoverageReturn(NamedTuple):
+    """
+    loss: the total path loss of each cell [dB] (nan outside the coverage radius), shape (rows, cols)
+    geotransform: the GDAL geotransform of the loss grid
+    srs: the srs of the loss grid
+    """
+    loss: np.ndarray
+    geotransform: Tuple[float, float, float, float, float, float]
+    srs: Any
+
+
+def radial_profiles(filename_or_ds: PathOrDS, lon: float, lat: float, radius: float,
+                    num_radials: int = 360, del_s: float = 0,
+                    band_nums=None, srs=4326, ovr_idx: Optional[Union[int, float, str]] = None,
+                    g: Geod = None) -> RadialProfiles:
+    """
+    Samples the terrain along num_radials equally spaced azimuths out from (lon, lat), in one vectorized read
+
+    :param ovr_idx: the overview to sample, 'auto' - the one that matches del_s
+    """
+    from rfmodel.geod.geod_profile import get_default_geod, get_resolution_meters, get_ovr_idx_by_del_s
+
+    if g is None:
+        g = get_default_geod()
+    if del_s == 0:
+        del_s = get_resolution_meters(filename_or_ds, None if ovr_idx == 'auto' else ovr_idx)
+    if ovr_idx == 'auto':
+        ovr_idx = get_ovr_idx_by_del_s(filename_or_ds, del_s)
+    steps = int(radius // del_s) + 1
+    azimuths = np.arange(num_radials, dtype=np.float64) * (360 / num_radials)
+    distance = np.arange(steps, dtype=np.float64) * del_s
+
+    lons, lats = get_radial_points(lon, lat, azimuths, distance, g=g)
+    elevation = sample_dem(filename_or_ds, x=lons.ravel(), y=lats.ravel(), srs=srs,
+                           band_nums=band_nums, ovr_idx=ovr_idx)[0]
+    elevation = np.ascontiguousarray(elevation, dtype=np.float32).reshape(num_radials, steps)
+    return RadialProfiles(lon, lat, azimuths, del_s, distance.astype(np.float32), elevation)
+
+
+def get_radial_points(lon: float, lat: float, azimuths: np.ndarray, distance: np.ndarray,
+                      g: Geod = None) -> Tuple[np.ndarray, np.ndarray]:
+    """ :return: (lons, lats) of the steps along the radials, of shape (len(azimuths), len(distance)) """
+    if g is None:
+        from rfmodel.geod.geod_profile import get_default_geod
+        g = get_default_geod()
+    az, dist = np.meshgrid(np.asarray(azimuths, dtype=np.float64), np.asarray(distance, dtype=np.float64),
+                           indexing='ij')
+    lons, lats, _azis = g.fwd(np.full(az.size, lon), np.full(az.size, lat), az.ravel(), dist.ravel())
+    return np.asarray(lons).reshape(az.shape), np.asarray(lats).reshape(az.shape)
+
+
+def get_prefix_profiles(steps: int, min_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: (prefix_idx, offsets) of the growing profiles along a radial, of min_points to steps points:
+        the points of profile i are radial[prefix_idx[offsets[i]:offsets[i+1]]]
+    """
+    npts = np.arange(min_points, steps + 1, dtype=np.int64)
+    offsets = np.zeros(len(npts) + 1, dtype=np.int64)
+    np.cumsum(npts, out=offsets[1:])
+    prefix_idx = np.arange(offsets[-1]) - np.repeat(offsets[:-1], npts)
+    return prefix_idx, offsets
+
+
+def get_prefix_groups(steps: int, min_points: int, max_points: int) -> List[Tuple[int, int]]:
+    """
+    :return: [(first, last), ...] - groups of the growing profiles along a radial, of first to last points,
+        of at most max_points points in all (or of a single profile)
+    """
+    groups = []
+    first = min_points
+    while first <= steps:
+        last = first
+        points = first
+        while last < steps and points + last + 1 <= max_points:
+            last += 1
+            points += last
+        groups.append((first, last))
+        first = last + 1
+    return groups
+
+
+def calc_radial_loss(calc_loss: Callable[[Any], RFModelReturn], profiles: RadialProfiles,
+                     tx_antenna_height: float, rx_antenna_height: float, rfmodel_options: dict,
+                     tx_msl: bool = False, rx_msl: bool = False,
+                     min_points: int = 3, use_extension: bool = True,
+                     radials: Optional[Sequence[int]] = None,
+                     out: Optional[np.ndarray] = None,
+                     executor: Optional[Executor] = None, chunk_size: int = 8,
+                     workers: Optional[int] = None, max_batch_points: int = 1 << 20) -> np.ndarray:
+    """
+    Calculates the total loss to every step along the radials.
+    Each radial is grown step by step; with use_extension each step after the first is passed to the model with
+    extension=True, so a model that supports it (i.e. TIREM) reuses the already computed prefix of the radial.
+
+    The execution is chosen by the model capabilities (see model_registry):
+    a model that supports extension is called for each step, on views of the radial, so it reuses the prefix;
+    otherwise, a model with a batch form gets the growing profiles of a radial in calls of up to max_batch_points
+    points (all the prefixes of a radial are steps * (steps + 1) / 2 points);
+    a thread safe model that releases the GIL is run on a pool of workers threads (default: the cpu count);
+    otherwise the model is called for each step.
+
+    :param min_points: the number of points of the first (shortest) profile along each radial
+    :param radials: the indices of the radials to calculate (default: all)
+    :param executor: if given (i.e. rfmodel.parallel.create_process_pool), chunks of chunk_size radials are
+        calculated by its workers. calc_loss should be picklable.
+    :return: float32 array of shape (num_radials, steps), nan for steps shorter than min_points
+    """
+    num_radials, steps = profiles.elevation.shape
+    if out is None:
+        out = np.full((num_radials, steps), np.nan, dtype=np.float32)
+    if radials is None:
+        radials = range(num_radials)
+    if executor is not None:
+        radials = np.asarray(radials, dtype=np.int64)
+        futures = []
+        for start in range(0, len(radials), chunk_size):
+            chunk = radials[start:start + chunk_size]
+            chunk_profiles = profiles._replace(azimuths=profiles.azimuths[chunk], elevation=profiles.elevation[chunk])
+            futures.append((chunk, executor.submit(
+                calc_radial_loss, calc_loss, chunk_profiles,
+                tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+                rfmodel_options=rfmodel_options, tx_msl=tx_msl, rx_msl=rx_msl,
+                min_points=min_points, use_extension=use_extension, workers=1,
+                max_batch_points=max_batch_points)))
+        for chunk, future in futures:
+            out[chunk] = future.result()
+        return out
+    if not tx_msl:
+        tx_antenna_height += float(profiles.elevation[0, 0])
+    capabilities = get_model_capabilities(calc_loss)
+    extension = use_extension and capabilities.extension
+    if capabilities.batch is not None and not extension:
+        # the prefixes of the radials are built a group at a time, each group is reused for all the radials
+        for first, last in get_prefix_groups(steps, min_points, max_batch_points):
+            prefix_idx, offsets = get_prefix_profiles(last, first)
+            profile_distance = np.ascontiguousarray(profiles.distance[prefix_idx])
+            ends = offsets[1:] - 1
+            res = tuple(np.empty(len(ends), dtype=dtype) for dtype in (np.float32, np.float32, np.float32, np.uint8))
+            for r in radials:
+                profile_elevation = np.ascontiguousarray(profiles.elevation[r][prefix_idx])
+                rx = rx_antenna_height if rx_msl else rx_antenna_height + profile_elevation[ends]
+                capabilities.batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx, res,
+                                   **rfmodel_options)
+                out[r, first - 1:last] = res[1]
+        return out
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if capabilities.thread_safe and capabilities.releases_gil and workers > 1 and len(radials) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as thread_executor:
+            for future in [thread_executor.submit(
+                    calc_radial_loss, calc_loss, profiles,
+                    tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+                    rfmodel_options=rfmodel_options, tx_msl=True, rx_msl=rx_msl,
+                    min_points=min_points, use_extension=use_extension, radials=[r], out=out, workers=1)
+                    for r in radials]:
+                future.result()
+        return out
+    extension_options = {}
+    for r in radials:
+        elevation = profiles.elevation[r]
+        for n in range(min_points, steps + 1):
+            if extension:
+                extension_options['extension'] = n > min_points
+            rx = rx_antenna_height if rx_msl else rx_antenna_height + float(elevation[n - 1])
+            res = calc_loss(tx_antenna_height=tx_antenna_height, rx_antenna_height=rx,
+                            num_profile_points=n, profile_elevation=elevation[:n],
+                            profile_distance=profiles.distance[:n],
+                            **extension_options, **rfmodel_options)
+            out[r, n - 1] = res[1]
+    return out
+
+
+def coverage_grid(lon: float, lat: float, radius: float, pixel_size: float) -> \
+        Tuple[Tuple[float, float, float, float, float, float], Tuple[int, int]]:
+    """ returns the geotransform and the shape (rows, cols) of a geographic grid that covers radius around lon, lat """
+    half_height = radius / deg_to_meters
+    half_width = radius / (deg_to_meters * max(math.cos(math.radians(lat)), 1e-6))
+    cols = max(1, math.ceil(2 * half_width / pixel_size))
+    rows = max(1, math.ceil(2 * half_height / pixel_size))
+    geotransform = (lon - cols * pixel_size / 2, pixel_size, 0.0, lat + rows * pixel_size / 2, 0.0, -pixel_size)
+    return geotransform, (rows, cols)
+
+
+def rasterize_radials(radial_values: np.ndarray, profiles: RadialProfiles,
+                      geotransform, shape: Tuple[int, int], row_offset: int = 0, col_offset: int = 0,
+                      g: Geod = None) -> np.ndarray:
+    """
+    Assigns to each cell of the grid the value of the nearest radial step.
+    row_offset, col_offset and shape may describe a window of the full grid.
+    """
+    radial_idx, step_idx = get_cell_radial_steps(profiles, geotransform, shape, row_offset, col_offset, g=g)
+    valid = radial_idx >= 0
+    res = np.full(radial_idx.size, np.nan, dtype=np.float32)
+    res[valid] = radial_values[radial_idx[valid], step_idx[valid]]
+    return res.reshape(shape)
+
+
+def get_cell_radial_steps(profiles: RadialProfiles, geotransform, shape: Tuple[int, int],
+                          row_offset: int = 0, col_offset: int = 0,
+                          g: Geod = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: (radial_idx, step_idx) - the nearest radial step of each cell of the grid, flat arrays of rows * cols,
+        radial_idx is -1 for cells beyond the last step
+    """
+    if g is None:
+        from rfmodel.geod.geod_profile import get_default_geod
+        g = get_default_geod()
+    rows, cols = shape
+    x = geotransform[0] + (np.arange(col_offset, col_offset + cols) + 0.5) * geotransform[1]
+    y = geotransform[3] + (np.arange(row_offset, row_offset + rows) + 0.5) * geotransform[5]
+    x, y = np.meshgrid(x, y)
+    az, _az21, dist = g.inv(np.full(x.size, profiles.lon), np.full(x.size, profiles.lat), x.ravel(), y.ravel())
+    num_radials, steps = profiles.elevation.shape
+    radial_idx = np.rint(np.mod(az, 360) * (num_radials / 360)).astype(np.int64) % num_radials
+    step_idx = np.rint(np.asarray(dist) / profiles.del_s).astype(np.int64)
+    radial_idx[step_idx >= steps] = -1
+    return radial_idx, step_idx
+
+
+def write_coverage_geotiff(filename: str, coverage: CoverageReturn) -> None:
+    from osgeo import gdal
+    from osgeo_utils.auxiliary.osr_util import get_srs
+
+    rows, cols = coverage.loss.shape
+    ds = gdal.GetDriverByName('GTiff').Create(
+        str(filename), cols, rows, 1, gdal.GDT_Float32, options=['TILED=YES', 'COMPRESS=DEFLATE'])
+    ds.SetGeoTransform(coverage.geotransform)
+    ds.SetSpatialRef(get_srs(coverage.srs))
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(float('nan'))
+    band.WriteArray(coverage.loss)
+    ds = None
+
+
+def calc_coverage_radial(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: PathOrDS,
+        lon: float, lat: float, radius: float,
+        tx_antenna_height: float, rx_antenna_height: float, rfmodel_options: dict,
+        tx_msl: bool = False, rx_msl: bool = False,
+        num_radials: int = 360, del_s: float = 0, pixel_size: float = 0,
+        min_points: int = 3, use_extension: bool = True,
+        out_filename: Optional[str] = None,
+        executor: Optional[Executor] = None,
+        workers: Optional[int] = None,
+        g: Geod = None,
+        **profile_options) -> CoverageReturn:
+    """
+    Calculates the coverage of a transmitter at (lon, lat) up to radius [m].
+    The loss is calculated along num_radials radials (see calc_radial_loss),
+    then rasterized onto a geographic grid (EPSG:4326) with pixel_size [deg] (default: del_s).
+
+    :param out_filename: if given, the coverage is also written to this GeoTIFF file
+    """
+    profiles = radial_profiles(filename_or_ds, lon=lon, lat=lat, radius=radius, num_radials=num_radials,
+                               del_s=del_s, g=g, **profile_options)
+    radial_loss = calc_radial_loss(
+        calc_loss, profiles, tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+        rfmodel_options=rfmodel_options, tx_msl=tx_msl, rx_msl=rx_msl,
+        min_points=min_points, use_extension=use_extension, executor=executor, workers=workers)
+    if not pixel_size:
+        pixel_size = profiles.del_s / deg_to_meters
+    geotransform, shape = coverage_grid(lon, lat, radius, pixel_size)
+    loss = rasterize_radials(radial_loss, profiles, geotransform, shape, g=g)
+    coverage = CoverageReturn(loss, geotransform, 4326)
+    if out_filename:
+        write_coverage_geotiff(out_filename, coverage)
+    return coverage
+
+
+def write_coverage_blocks(filename: str, radial_values: np.ndarray, profiles: RadialProfiles,
+                          geotransform, shape: Tuple[int, int], block_size: int = 256,
+                          overview_levels: Sequence[int] = (2, 4, 8, 16), overview_resampling: str = 'NEAREST',
+                          resume: bool = True, g: Geod = None) -> int:
+    """
+    Rasterizes radial_values onto the grid (see rasterize_radials) block by block, aligned with the internal tiling
+    of the output GeoTIFF, and writes each block as soon as it is done, so only a block of the grid is in memory.
+    Blocks beyond the last radial step aren't written (the file is sparse, they read as nodata).
+
+    The progress is recorded after each row of blocks in filename + '.progress';
+    with resume, an interrupted run on the same grid continues from its last completed row of blocks.
+    The overviews are built at the end, then the progress file is removed.
+
+    :return: the number of rows of blocks written by this call
+    """
+    from osgeo import gdal
+    from osgeo_utils.auxiliary.osr_util import get_srs
+
+    filename = str(filename)
+    progress_filename = filename + '.progress'
+    rows, cols = shape
+    config = dict(geotransform=list(geotransform), shape=[rows, cols], block_size=block_size)
+    block_rows = -(-rows // block_size)
+    start_row = 0
+    ds = None
+    if resume and os.path.exists(progress_filename) and os.path.exists(filename):
+        with open(progress_filename) as f:
+            progress = json.load(f)
+        if progress['config'] == config:
+            ds = gdal.Open(filename, gdal.GA_Update)
+            start_row = progress['completed_rows']
+    if ds is None:
+        ds = gdal.GetDriverByName('GTiff').Create(
+            filename, cols, rows, 1, gdal.GDT_Float32,
+            options=['TILED=YES', f'BLOCKXSIZE={block_size}', f'BLOCKYSIZE={block_size}',
+                     'COMPRESS=DEFLATE', 'SPARSE_OK=TRUE', 'BIGTIFF=IF_SAFER'])
+        ds.SetGeoTransform(geotransform)
+        ds.SetSpatialRef(get_srs(4326))
+        ds.GetRasterBand(1).SetNoDataValue(float('nan'))
+    band = ds.GetRasterBand(1)
+
+    def write_progress(completed_rows: int):
+        with open(progress_filename + '.tmp', 'w') as f:
+            json.dump(dict(config=config, completed_rows=completed_rows), f)
+        os.replace(progress_filename + '.tmp', progress_filename)
+
+    for block_row in range(start_row, block_rows):
+        row_offset = block_row * block_size
+        for col_offset in range(0, cols, block_size):
+            block_shape = (min(block_size, rows - row_offset), min(block_size, cols - col_offset))
+            block = rasterize_radials(radial_values, profiles, geotransform, block_shape,
+                                      row_offset=row_offset, col_offset=col_offset, g=g)
+            if not np.isnan(block).all():
+                band.WriteArray(block, col_offset, row_offset)
+        ds.FlushCache()
+        write_progress(block_row + 1)
+    if overview_levels:
+        ds.BuildOverviews(overview_resampling, list(overview_levels))
+    ds = None
+    os.remove(progress_filename)
+    return block_rows - start_row
+
+
+def calc_coverage_radial_blocks(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: PathOrDS, out_filename: str,
+        lon: float, lat: float, radius: float,
+        tx_antenna_height: float, rx_antenna_height: float, rfmodel_options: dict,
+        tx_msl: bool = False, rx_msl: bool = False,
+        num_radials: int = 360, del_s: float = 0, pixel_size: float = 0,
+        min_points: int = 3, use_extension: bool = True,
+        block_size: int = 256, overview_levels: Sequence[int] = (2, 4, 8, 16),
+        resume: bool = True,
+        executor: Optional[Executor] = None,
+        workers: Optional[int] = None,
+        g: Geod = None,
+        **profile_options) -> Tuple[Tuple[float, float, float, float, float, float], Tuple[int, int]]:
+    """
+    The streaming version of calc_coverage_radial, for grids that don't fit in memory:
+    the coverage is written to the GeoTIFF out_filename block by block (see write_coverage_blocks).
+
+    The radial loss is kept in out_filename + '.radials.npz' until the grid is complete,
+    so with resume an interrupted run skips the model as well as the completed blocks.
+
+    :return: (geotransform, shape) of the written grid
+    """
+    profiles = radial_profiles(filename_or_ds, lon=lon, lat=lat, radius=radius, num_radials=num_radials,
+                               del_s=del_s, g=g, **profile_options)
+    radials_filename = str(out_filename) + '.radials.npz'
+    radials_key = repr((lon, lat, radius, tx_antenna_height, rx_antenna_height, sorted(rfmodel_options.items()),
+                        tx_msl, rx_msl, num_radials, profiles.del_s, min_points))
+    radial_loss = None
+    if resume and os.path.exists(radials_filename):
+        with np.load(radials_filename, allow_pickle=False) as f:
+            if str(f['key']) == radials_key:
+                radial_loss = f['loss']
+    if radial_loss is None:
+        # the blocks of a previous run were rasterized from other radials
+        resume = False
+        radial_loss = calc_radial_loss(
+            calc_loss, profiles, tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+            rfmodel_options=rfmodel_options, tx_msl=tx_msl, rx_msl=rx_msl,
+            min_points=min_points, use_extension=use_extension, executor=executor, workers=workers)
+        with open(radials_filename, 'wb') as f:
+            np.savez(f, key=radials_key, loss=radial_loss)
+    if not pixel_size:
+        pixel_size = profiles.del_s / deg_to_meters
+    geotransform, shape = coverage_grid(lon, lat, radius, pixel_size)
+    write_coverage_blocks(out_filename, radial_loss, profiles, geotransform, shape, block_size=block_size,
+                          overview_levels=overview_levels, resume=resume, g=g)
+    os.remove(radials_filename)
+    return geotransform, shape
+
+
+class IncrementalCoverage:
+    """
+    A radial coverage (see calc_coverage_radial) that is kept up to date with edits of its inputs,
+    recalculating only what an edit invalidates.
+
+    It keeps the sampled radial profiles, the points of the radial steps, the loss along the radials
+    and the radial step of each output cell, so that:
+    changing the antenna heights, msl flags or rfmodel_options recalculates the radials from the kept profiles,
+    without reading the DEM or recomputing geodesics (see update);
+    patching a window of the DEM re-samples and recalculates only the radials that pass through it (see update_dem);
+    in both cases only the cells of the recalculated radials are rewritten.
+    Moving the transmitter invalidates all the radials (they all start at it), so it rebuilds the coverage.
+    """
+
+    def __init__(self, calc_loss: Callable[[Any], RFModelReturn], filename_or_ds: Union[PathOrDS, DEMSource],
+                 lon: float, lat: float, radius: float,
+                 tx_antenna_height: float, rx_antenna_height: float, rfmodel_options: dict,
+                 tx_msl: bool = False, rx_msl: bool = False,
+                 num_radials: int = 360, del_s: float = 0, pixel_size: float = 0,
+                 min_points: int = 3, use_extension: bool = True,
+                 workers: Optional[int] = None,
+                 band_nums=None, srs=4326, ovr_idx: Optional[Union[int, float, str]] = None,
+                 g: Geod = None):
+        self.calc_loss = calc_loss
+        self.filename_or_ds = filename_or_ds
+        self.radius = radius
+        self.tx_antenna_height = tx_antenna_height
+        self.rx_antenna_height = rx_antenna_height
+        self.rfmodel_options = dict(rfmodel_options)
+        self.tx_msl = tx_msl
+        self.rx_msl = rx_msl
+        self.num_radials = num_radials
+        self.min_points = min_points
+        self.use_extension = use_extension
+        self.workers = workers
+        self.band_nums = band_nums
+        self.srs = srs
+        from rfmodel.geod.geod_profile import get_default_geod, get_resolution_meters, get_ovr_idx_by_del_s
+        self.g = get_default_geod() if g is None else g
+        if del_s == 0:
+            del_s = get_resolution_meters(filename_or_ds, None if ovr_idx == 'auto' else ovr_idx)
+        if ovr_idx == 'auto':
+            ovr_idx = get_ovr_idx_by_del_s(filename_or_ds, del_s)
+        self.del_s = del_s
+        self.ovr_idx = ovr_idx
+        self.pixel_size = pixel_size or del_s / deg_to_meters
+        self.recalculated_radials = 0
+        self._build(lon, lat)
+
+    def _build(self, lon: float, lat: float):
+        self.profiles = radial_profiles(self.filename_or_ds, lon=lon, lat=lat, radius=self.radius,
+                                        num_radials=self.num_radials, del_s=self.del_s, band_nums=self.band_nums,
+                                        srs=self.srs, ovr_idx=self.ovr_idx, g=self.g)
+        self.lons, self.lats = get_radial_points(lon, lat, self.profiles.azimuths, self.profiles.distance, g=self.g)
+        self.geotransform, self.shape = coverage_grid(lon, lat, self.radius, self.pixel_size)
+        self.cell_radial, self.cell_step = get_cell_radial_steps(self.profiles, self.geotransform, self.shape, g=self.g)
+        self.radial_loss = np.full(self.profiles.elevation.shape, np.nan, dtype=np.float32)
+        self.loss = np.full(self.shape, np.nan, dtype=np.float32)
+        self._calc_radials(np.arange(self.num_radials))
+
+    def _calc_radials(self, radials: np.ndarray):
+        calc_radial_loss(
+            self.calc_loss, self.profiles, tx_antenna_height=self.tx_antenna_height,
+            rx_antenna_height=self.rx_antenna_height, rfmodel_options=self.rfmodel_options,
+            tx_msl=self.tx_msl, rx_msl=self.rx_msl, min_points=self.min_points, use_extension=self.use_extension,
+            radials=radials, out=self.radial_loss, workers=self.workers)
+        self.recalculated_radials += len(radials)
+        if len(radials) == self.num_radials:
+            cells = np.flatnonzero(self.cell_radial >= 0)
+        else:
+            cells = np.flatnonzero(np.isin(self.cell_radial, radials))
+        self.loss.flat[cells] = self.radial_loss[self.cell_radial[cells], self.cell_step[cells]]
+
+    @property
+    def coverage(self) -> CoverageReturn:
+        return CoverageReturn(self.loss, self.geotransform, 4326)
+
+    def update(self, tx_antenna_height: Optional[float] = None, rx_antenna_height: Optional[float] = None,
+               rfmodel_options: Optional[dict] = None, tx_msl: Optional[bool] = None, rx_msl: Optional[bool] = None,
+               lon: Optional[float] = None, lat: Optional[float] = None) -> np.ndarray:
+        """
+        Applies the given changes (None - unchanged) and recalculates what they invalidate.
+
+        :return: the indices of the recalculated radials
+        """
+        changes = dict(tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+                       rfmodel_options=rfmodel_options, tx_msl=tx_msl, rx_msl=rx_msl)
+        changes = {k: v for k, v in changes.items() if v is not None and v != getattr(self, k)}
+        for k, v in changes.items():
+            setattr(self, k, dict(v) if k == 'rfmodel_options' else v)
+        lon = self.profiles.lon if lon is None else lon
+        lat = self.profiles.lat if lat is None else lat
+        if (lon, lat) != (self.profiles.lon, self.profiles.lat):
+            self._build(lon, lat)
+        elif changes:
+            self._calc_radials(np.arange(self.num_radials))
+        else:
+            return np.arange(0)
+        return np.arange(self.num_radials)
+
+    def update_dem(self, min_x: float, min_y: float, max_x: float, max_y: float) -> np.ndarray:
+        """
+        Re-samples and recalculates the radials that pass through the given window (lon, lat) of the DEM,
+        after the DEM was modified in place.
+        The window is extended by a pixel of the DEM, to include the neighbours of interpolated samples.
+
+        :return: the indices of the recalculated radials
+        """
+        from rfmodel.geod.geod_profile import get_resolution_meters
+
+        if not isinstance(self.filename_or_ds, DEMSource):
+            from rfmodel.dem.block_cache import block_cache, get_ds_key
+            ds = block_cache.open_ds(self.filename_or_ds)
+            # drops GDAL's cached blocks of a handle of the caller; a cached handle is also reopened
+            ds.FlushCache()
+            block_cache.invalidate(get_ds_key(ds))
+            ds = None
+        margin = get_resolution_meters(self.filename_or_ds, self.ovr_idx) / deg_to_meters
+        inside = ((self.lons >= min_x - margin) & (self.lons <= max_x + margin) &
+                  (self.lats >= min_y - margin) & (self.lats <= max_y + margin))
+        radials = np.flatnonzero(inside.any(axis=1))
+        if len(radials):
+            elevation = sample_dem(self.filename_or_ds, x=self.lons[radials].ravel(),
+                                   y=self.lats[radials].ravel(), srs=self.srs,
+                                   band_nums=self.band_nums, ovr_idx=self.ovr_idx)[0]
+            # (if the transmitter is in the window, so is the first step of every radial)
+            self.profiles.elevation[radials] = elevation.reshape(len(radials), -1)
+            self._calc_radials(radials)
+        return radials
@@ -0,0 +1,160 @@
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+from typing import NamedTuple, Tuple, Hashable, Optional
+
+import numpy as np
+from osgeo import gdal, gdal_array
+from osgeo_utils.auxiliary.util import PathOrDS, open_ds
+
+from rfmodel.metrics import metrics
+
+BlockKey = Tuple[Hashable, int, int, int, int]  # (dataset, overview, band, block x, block y)
+
+
+class BlockCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    count: int
+    nbytes: int
+    max_bytes: int
+
+
+_anonymous_ds_keys: 'weakref.WeakKeyDictionary[gdal.Dataset, Hashable]' = weakref.WeakKeyDictionary()
+_anonymous_ds_counter = itertools.count()
+_anonymous_ds_lock = threading.Lock()
+
+
+def get_ds_key(ds: gdal.Dataset) -> Hashable:
+    """
+    datasets opened from the same file share their cached blocks;
+    a dataset without a description (i.e. in memory) gets a key of its own, which isn't reused after it is collected
+    """
+    description = ds.GetDescription()
+    if description:
+        return description
+    with _anonymous_ds_lock:
+        key = _anonymous_ds_keys.get(ds)
+        if key is None:
+            key = _anonymous_ds_keys[ds] = ('anonymous', next(_anonymous_ds_counter))
+        return key
+
+
+class BlockCache:
+    """
+    A process-wide cache of raster blocks, keyed by (dataset, overview, band, block x, block y),
+    bounded by a byte budget with LRU eviction.
+    It also keeps up to max_datasets opened dataset handles (the least recently used are closed),
+    so each file is opened only once while it is in use.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_datasets: int = 64):
+        self.max_bytes = max_bytes
+        self.max_datasets = max_datasets
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._blocks: 'OrderedDict[BlockKey, np.ndarray]' = OrderedDict()
+        self._datasets: 'OrderedDict[str, gdal.Dataset]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    def open_ds(self, filename_or_ds: PathOrDS) -> gdal.Dataset:
+        if isinstance(filename_or_ds, gdal.Dataset):
+            return filename_or_ds
+        filename = str(filename_or_ds)
+        with self._lock:
+            ds = self._datasets.get(filename)
+            if ds is not None:
+                self._datasets.move_to_end(filename)
+                return ds
+            ds = open_ds(filename)
+            self._datasets[filename] = ds
+            # the blocks are keyed by filename, so they remain valid for the dataset when it is opened again
+            while len(self._datasets) > self.max_datasets:
+                self._datasets.popitem(last=False)
+        return ds
+
+    def get_block(self, band: gdal.Band, key: BlockKey) -> np.ndarray:
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return block
+            self.misses += 1
+        _ds_key, _ovr_idx, _band_num, bx, by = key
+        block_xsize, block_ysize = band.GetBlockSize()
+        xoff, yoff = bx * block_xsize, by * block_ysize
+        block = band.ReadAsArray(xoff, yoff, min(block_xsize, band.XSize - xoff), min(block_ysize, band.YSize - yoff))
+        with self._lock:
+            if key not in self._blocks:
+                self._blocks[key] = block
+                self.nbytes += block.nbytes
+                self._evict()
+        return block
+
+    def read_pixels(self, band: gdal.Band, ds_key: Hashable, ovr_idx: int, band_num: int,
+                    cols: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """ reads the values of the given (integer, in extent) pixels through the cache, one lookup per block """
+        block_xsize, block_ysize = band.GetBlockSize()
+        block_x = cols // block_xsize
+        block_y = rows // block_ysize
+        keys = block_y.astype(np.int64) * (band.XSize // block_xsize + 1) + block_x
+        order = np.argsort(keys, kind='stable')
+        splits = np.flatnonzero(np.diff(keys[order])) + 1
+        res = np.empty(len(cols), dtype=gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+        for idx in np.split(order, splits) if len(order) else ():
+            bx, by = int(block_x[idx[0]]), int(block_y[idx[0]])
+            block = self.get_block(band, (ds_key, ovr_idx, band_num, bx, by))
+            res[idx] = block[rows[idx] - by * block_ysize, cols[idx] - bx * block_xsize]
+        return res
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._blocks:
+            _key, block = self._blocks.popitem(last=False)
+            self.nbytes -= block.nbytes
+            self.evictions += 1
+
+    def set_max_bytes(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self, ds_key: Optional[Hashable] = None):
+        """
+        drops the cached blocks of the given dataset (default: all) e.g. after the dataset was modified;
+        its cached handle is closed too, so it is opened again without GDAL's own cached blocks
+        """
+        with self._lock:
+            if ds_key is None:
+                self._blocks.clear()
+                self._datasets.clear()
+                self.nbytes = 0
+                return
+            for key in [key for key in self._blocks if key[0] == ds_key]:
+                self.nbytes -= self._blocks.pop(key).nbytes
+            for filename in [filename for filename, ds in self._datasets.items() if get_ds_key(ds) == ds_key]:
+                del self._datasets[filename]
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._datasets.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> BlockCacheStats:
+        with self._lock:
+            return BlockCacheStats(self.hits, self.misses, self.evictions,
+                                   len(self._blocks), self.nbytes, self.max_bytes)
+
+
+block_cache = BlockCache()
+metrics.add_collector('block_cache', block_cache)
+
+
+def set_block_cache_max_bytes(max_bytes: int):
+    block_cache.set_max_bytes(max_bytes)
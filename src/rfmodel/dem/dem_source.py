@@ -0,0 +1,28 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+
+class DEMSource(ABC):
+    """
+    A terrain source that may be used in place of filename_or_ds (i.e. in geod_profile and get_resolution_meters)
+    """
+
+    @abstractmethod
+    def sample(self, x: np.ndarray, y: np.ndarray, srs=4326,
+               band_nums: Optional[Union[int, Sequence[int]]] = None,
+               ovr_idx: Optional[Union[int, float]] = None) -> np.ndarray:
+        """ :return: array of shape (band_count, point_count) """
+
+    @abstractmethod
+    def get_resolution_meters(self) -> float:
+        ...
+
+
+def sample_dem(filename_or_ds, x: np.ndarray, y: np.ndarray, **kwargs) -> np.ndarray:
+    """ sample_raster, that doesn't import GDAL for a DEMSource """
+    if isinstance(filename_or_ds, DEMSource):
+        return filename_or_ds.sample(x, y, **kwargs)
+    from rfmodel.dem.sample import sample_raster
+    return sample_raster(filename_or_ds, x, y, **kwargs)
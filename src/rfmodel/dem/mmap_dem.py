@@ -0,0 +1,158 @@
+import json
+from pathlib import Path
+from typing import Optional, Sequence, Union, Dict, Any
+
+import numpy as np
+import pyproj
+
+from rfmodel.dem.dem_source import DEMSource
+
+sidecar_suffix = '.json'
+
+
+class MMapDEM(DEMSource):
+    """
+    A DEM stored as a raw, memory-mapped array of shape (bands, rows, cols)
+    with a json sidecar (raw filename + '.json') holding the shape, dtype, geotransform and srs.
+
+    Sampling is done with NumPy indexing on the memory map, without GDAL, so processes that open the same file
+    share a single page-cached copy of it. Instances are pickled by filename.
+    """
+
+    def __init__(self, filename: Union[str, Path], interpolation: str = 'nearest'):
+        self.filename = str(filename)
+        self.interpolation = interpolation
+        with open(self.filename + sidecar_suffix, 'r') as f:
+            meta = json.load(f)
+        self.geotransform = tuple(meta['geotransform'])
+        self.srs = meta['srs']
+        self.nodata = meta.get('nodata')
+        self.data = np.memmap(self.filename, dtype=np.dtype(meta['dtype']), mode='r', shape=tuple(meta['shape']))
+        self.crs = pyproj.CRS.from_user_input(self.srs)
+        a, b, c, d, e, f = self.geotransform
+        det = b * f - c * e
+        self._inv_geotransform = (
+            (c * d - a * f) / det, f / det, -c / det,
+            (a * e - b * d) / det, -e / det, b / det)
+        self._transformers: Dict[Any, Optional[pyproj.Transformer]] = {}
+
+    def __reduce__(self):
+        return self.__class__, (self.filename, self.interpolation)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @staticmethod
+    def write_sidecar(filename: Union[str, Path], shape, dtype, geotransform, srs, nodata=None):
+        meta = dict(shape=list(shape), dtype=np.dtype(dtype).str, geotransform=list(geotransform),
+                    srs=pyproj.CRS.from_user_input(srs).to_wkt(), nodata=nodata)
+        with open(str(filename) + sidecar_suffix, 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def from_array(cls, filename: Union[str, Path], array: np.ndarray, geotransform, srs=4326, nodata=None,
+                   **kwargs) -> 'MMapDEM':
+        """ writes array (of shape (rows, cols) or (bands, rows, cols)) as a raw DEM and opens it """
+        if array.ndim == 2:
+            array = array[np.newaxis]
+        np.ascontiguousarray(array).tofile(str(filename))
+        cls.write_sidecar(filename, array.shape, array.dtype, geotransform, srs, nodata)
+        return cls(filename, **kwargs)
+
+    @classmethod
+    def create(cls, filename_or_ds, filename: Union[str, Path],
+               band_nums: Optional[Union[int, Sequence[int]]] = None, **kwargs) -> 'MMapDEM':
+        """
+        converts a GDAL raster (i.e. a GeoTIFF) into a raw DEM, strip by strip, and opens it.
+        The scale and offset of scaled bands are applied, so the raw DEM holds their elevations (as sample_raster).
+        """
+        # GDAL is needed only for the one time conversion
+        from osgeo import gdal_array
+        from osgeo_utils.auxiliary.util import open_ds, get_bands, get_scales_and_offsets
+
+        ds = open_ds(filename_or_ds)
+        bands = get_bands(ds, band_nums)
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(bands[0].DataType)
+        is_scaled, scales, offsets = get_scales_and_offsets(bands)
+        nodata = bands[0].GetNoDataValue()
+        if is_scaled:
+            dtype = np.result_type(dtype, np.float32)
+            if nodata is not None:
+                nodata = nodata * scales[0] + offsets[0]
+        shape = (len(bands), ds.RasterYSize, ds.RasterXSize)
+        data = np.memmap(str(filename), dtype=dtype, mode='w+', shape=shape)
+        _block_xsize, block_ysize = bands[0].GetBlockSize()
+        strip_ysize = max(block_ysize, 1)
+        for i, band in enumerate(bands):
+            for yoff in range(0, ds.RasterYSize, strip_ysize):
+                ysize = min(strip_ysize, ds.RasterYSize - yoff)
+                strip = band.ReadAsArray(0, yoff, ds.RasterXSize, ysize)
+                if is_scaled:
+                    strip = strip * scales[i] + offsets[i]
+                data[i, yoff:yoff + ysize] = strip
+        data.flush()
+        del data
+        cls.write_sidecar(filename, shape, dtype, ds.GetGeoTransform(), ds.GetSpatialRef().ExportToWkt(), nodata)
+        return cls(filename, **kwargs)
+
+    def _get_transformer(self, srs) -> Optional[pyproj.Transformer]:
+        if srs not in self._transformers:
+            crs = pyproj.CRS.from_user_input(srs)
+            self._transformers[srs] = None if crs == self.crs else \
+                pyproj.Transformer.from_crs(crs, self.crs, always_xy=True)
+        return self._transformers[srs]
+
+    def get_pixel_line(self, x: np.ndarray, y: np.ndarray, srs=4326):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if srs is not None:
+            transformer = self._get_transformer(srs)
+            if transformer is not None:
+                x, y = transformer.transform(x, y)
+        inv_gt = self._inv_geotransform
+        pixels = inv_gt[0] + inv_gt[1] * x + inv_gt[2] * y
+        lines = inv_gt[3] + inv_gt[4] * x + inv_gt[5] * y
+        return pixels, lines
+
+    def sample(self, x: np.ndarray, y: np.ndarray, srs=4326,
+               band_nums: Optional[Union[int, Sequence[int]]] = None,
+               ovr_idx: Optional[Union[int, float]] = None,
+               interpolation: Optional[str] = None) -> np.ndarray:
+        """
+        :param interpolation: 'nearest' (compatible with gdallocationinfo) or 'bilinear' (default: self.interpolation)
+        :return: array of shape (band_count, point_count)
+        """
+        if ovr_idx:
+            raise ValueError('MMapDEM has no overviews')
+        if interpolation is None:
+            interpolation = self.interpolation
+        data = self.data
+        # index the bands together with the pixels, so only the sampled pixels are read
+        b = slice(None) if band_nums is None else (np.atleast_1d(band_nums) - 1)[:, np.newaxis]
+        _band_count, rows, cols = data.shape
+        pixels, lines = self.get_pixel_line(x, y, srs=srs)
+        if interpolation == 'nearest':
+            c = np.clip(np.floor(pixels), 0, cols - 1).astype(np.intp)
+            r = np.clip(np.floor(lines), 0, rows - 1).astype(np.intp)
+            return np.asarray(data[b, r, c])
+        elif interpolation == 'bilinear':
+            pixels = np.clip(pixels - 0.5, 0, cols - 1)
+            lines = np.clip(lines - 0.5, 0, rows - 1)
+            c0 = np.minimum(np.floor(pixels).astype(np.intp), max(cols - 2, 0))
+            r0 = np.minimum(np.floor(lines).astype(np.intp), max(rows - 2, 0))
+            c1 = np.minimum(c0 + 1, cols - 1)
+            r1 = np.minimum(r0 + 1, rows - 1)
+            wx = (pixels - c0).astype(np.float32)
+            wy = (lines - r0).astype(np.float32)
+            top = data[b, r0, c0] * (1 - wx) + data[b, r0, c1] * wx
+            bottom = data[b, r1, c0] * (1 - wx) + data[b, r1, c1] * wx
+            return np.asarray(top * (1 - wy) + bottom * wy)
+        else:
+            raise ValueError(f'unknown interpolation: {interpolation}')
+
+    def get_resolution_meters(self) -> float:
+        resolution = self.geotransform[1]
+        if self.crs.is_geographic:
+            resolution *= 111_111  # deg to meter
+        return resolution
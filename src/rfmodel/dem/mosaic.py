@@ -0,0 +1,234 @@
+import glob
+import json
+import math
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.dem.mmap_dem import MMapDEM, sidecar_suffix
+
+
+class TileFootprint(NamedTuple):
+    """ the geographic extent of a tile [deg] """
+    min_x: float
+    min_y: float
+    max_x: float
+    max_y: float
+
+
+class MosaicStats(NamedTuple):
+    opens: int
+    evictions: int
+    open_tiles: int
+    max_open: int
+    reads: int
+
+
+def _footprint_of_geotransform(geotransform, cols: int, rows: int) -> TileFootprint:
+    x0, dx, _, y0, _, dy = geotransform
+    x1, y1 = x0 + dx * cols, y0 + dy * rows
+    return TileFootprint(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+
+def get_tile_footprint(filename: Union[str, Path]) -> TileFootprint:
+    """ :return: the footprint of a geographic tile, a raw DEM (see MMapDEM) or a GDAL raster """
+    filename = str(filename)
+    if Path(filename + sidecar_suffix).exists():
+        with open(filename + sidecar_suffix) as f:
+            meta = json.load(f)
+        _bands, rows, cols = meta['shape']
+        return _footprint_of_geotransform(meta['geotransform'], cols, rows)
+    from osgeo import gdal
+    ds = gdal.Open(filename)
+    if ds is None:
+        raise FileNotFoundError(filename)
+    return _footprint_of_geotransform(ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize)
+
+
+class _GDALTile(DEMSource):
+    """ a GDAL tile of a mosaic, its handle is owned by the tile, so closing the tile closes the file """
+
+    def __init__(self, filename: str):
+        from osgeo import gdal
+        self.ds = gdal.Open(filename)
+        if self.ds is None:
+            raise FileNotFoundError(filename)
+
+    def sample(self, x, y, srs=4326, band_nums=None, ovr_idx=None) -> np.ndarray:
+        from rfmodel.dem.sample import sample_raster
+        return sample_raster(self.ds, x, y, srs=srs, band_nums=band_nums, ovr_idx=ovr_idx)
+
+    def get_resolution_meters(self) -> float:
+        from rfmodel.geod.geod_profile import get_resolution_meters
+        return get_resolution_meters(self.ds)
+
+
+def open_tile(filename: str) -> DEMSource:
+    """ opens a raw DEM (see MMapDEM) by its sidecar, otherwise with GDAL """
+    if Path(filename + sidecar_suffix).exists():
+        return MMapDEM(filename)
+    return _GDALTile(filename)
+
+
+class MosaicDEM(DEMSource):
+    """
+    A DEM made of many geographic tiles (i.e. 1x1 deg SRTM or DTED tiles), without building a VRT.
+
+    The tile footprints are kept in a grid index of cell_size degrees cells.
+    The tiles are opened on first use, at most max_open are kept open (the least recently used are closed).
+    Each sample call groups its points by tile, so each tile gets a single vectorized read;
+    the result has the promoted dtype of the tiles read (np.result_type), so tiles of mixed dtypes can be mosaicked.
+    Longitudes are wrapped, so profiles that cross the antimeridian find the tiles on both sides of it;
+    points that are not in any tile get fill_value (i.e. the sea, where there are no SRTM tiles).
+    Instances are pickled by their tile list and footprints.
+    """
+
+    def __init__(self, filenames: Sequence[Union[str, Path]], footprints: Optional[Sequence[Sequence[float]]] = None,
+                 max_open: int = 64, cell_size: float = 1.0, fill_value: float = 0.0,
+                 resolution: Optional[float] = None):
+        """
+        :param footprints: (min_x, min_y, max_x, max_y) of each tile [deg] (default: read from each tile once)
+        :param resolution: the resolution of the tiles [m] (default: of the first tile)
+        """
+        self.filenames = [str(filename) for filename in filenames]
+        if footprints is None:
+            footprints = [get_tile_footprint(filename) for filename in self.filenames]
+        self.footprints = np.array(footprints, dtype=np.float64).reshape(len(self.filenames), 4)
+        self.max_open = max_open
+        self.cell_size = cell_size
+        self.fill_value = fill_value
+        self.resolution = resolution
+        self.opens = 0
+        self.evictions = 0
+        self.reads = 0
+        self._tiles: 'OrderedDict[int, DEMSource]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._index: Dict[Tuple[int, int], List[int]] = {}
+        for i, (min_x, min_y, max_x, max_y) in enumerate(self.footprints):
+            for cx in range(math.floor(min_x / cell_size), math.floor(max_x / cell_size) + 1):
+                for cy in range(math.floor(min_y / cell_size), math.floor(max_y / cell_size) + 1):
+                    # tiles that extend beyond the antimeridian are indexed on both sides of it
+                    key = (self._wrap_cell(cx), cy)
+                    self._index.setdefault(key, []).append(i)
+
+    def __reduce__(self):
+        return self.__class__, (self.filenames, self.footprints.tolist(), self.max_open, self.cell_size,
+                                self.fill_value, self.resolution)
+
+    @classmethod
+    def from_glob(cls, pattern: str, **kwargs) -> 'MosaicDEM':
+        return cls(sorted(glob.glob(pattern)), **kwargs)
+
+    def save_index(self, filename: Union[str, Path]):
+        """ saves the tile list and footprints, so the tiles needn't be opened again to build the index """
+        with open(filename, 'w') as f:
+            json.dump(dict(filenames=self.filenames, footprints=self.footprints.tolist()), f)
+
+    @classmethod
+    def from_index(cls, filename: Union[str, Path], **kwargs) -> 'MosaicDEM':
+        with open(filename) as f:
+            index = json.load(f)
+        return cls(index['filenames'], index['footprints'], **kwargs)
+
+    def _wrap_cell(self, cx: int) -> int:
+        cells_around = round(360 / self.cell_size)
+        return (cx + cells_around // 2) % cells_around - cells_around // 2
+
+    def get_tile(self, i: int) -> DEMSource:
+        with self._lock:
+            tile = self._tiles.get(i)
+            if tile is not None:
+                self._tiles.move_to_end(i)
+                return tile
+            tile = open_tile(self.filenames[i])
+            self.opens += 1
+            self._tiles[i] = tile
+            while len(self._tiles) > self.max_open:
+                self._tiles.popitem(last=False)
+                self.evictions += 1
+            return tile
+
+    def find_tiles(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param x, y: longitudes and latitudes [deg]
+        :return: (tile_idx, tile_x) - the index of the tile of each point (-1 for none),
+            and its longitude in the coordinates of the tile (i.e. 180.5 rather than -179.5 for a tile that
+            extends beyond the antimeridian)
+        """
+        x = np.mod(np.asarray(x, dtype=np.float64) + 180, 360) - 180
+        y = np.asarray(y, dtype=np.float64)
+        tile_idx = np.full(len(x), -1, dtype=np.int64)
+        tile_x = x.copy()
+        cells_around = round(360 / self.cell_size)
+        cx = np.floor(x / self.cell_size).astype(np.int64)
+        cx = (cx + cells_around // 2) % cells_around - cells_around // 2
+        cy = np.floor(y / self.cell_size).astype(np.int64)
+        keys, inverse = np.unique(np.stack([cx, cy]), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        for k, (key_x, key_y) in enumerate(keys.T.tolist()):
+            idx = np.flatnonzero(inverse == k)
+            # a point on a seam belongs to the tile east/south of it (as a pixel does), on the outer edges to any
+            for seam in (True, False):
+                for i in self._index.get((key_x, key_y), ()):
+                    if not len(idx):
+                        break
+                    min_x, min_y, max_x, max_y = self.footprints[i]
+                    for shift in (0, 360, -360):
+                        px = x[idx] + shift
+                        py = y[idx]
+                        if seam:
+                            inside = (px >= min_x) & (px < max_x) & (py > min_y) & (py <= max_y)
+                        else:
+                            inside = (px >= min_x) & (px <= max_x) & (py >= min_y) & (py <= max_y)
+                        tile_idx[idx[inside]] = i
+                        tile_x[idx[inside]] = px[inside]
+                        idx = idx[~inside]
+        return tile_idx, tile_x
+
+    def sample(self, x: np.ndarray, y: np.ndarray, srs=4326,
+               band_nums: Optional[Union[int, Sequence[int]]] = None,
+               ovr_idx: Optional[Union[int, float]] = None) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if srs is not None and srs != 4326:
+            import pyproj
+            x, y = pyproj.Transformer.from_crs(srs, 4326, always_xy=True).transform(x, y)
+        tile_idx, tile_x = self.find_tiles(x, y)
+        order = np.argsort(tile_idx, kind='stable')
+        splits = np.flatnonzero(np.diff(tile_idx[order])) + 1
+        band_count = 1 if band_nums is None else len(np.atleast_1d(band_nums))
+        res = None
+        for idx in np.split(order, splits):
+            if not len(idx) or tile_idx[idx[0]] < 0:
+                continue
+            values = self.get_tile(int(tile_idx[idx[0]])).sample(
+                tile_x[idx], y[idx], srs=4326, band_nums=band_nums, ovr_idx=ovr_idx)
+            with self._lock:
+                self.reads += 1
+            if res is None:
+                band_count = len(values)
+                res = np.full((band_count, len(x)), self.fill_value, dtype=values.dtype)
+            elif np.result_type(res.dtype, values.dtype) != res.dtype:
+                # i.e. an Int16 tile and a Float32 tile, the float values mustn't be truncated
+                res = res.astype(np.result_type(res.dtype, values.dtype))
+            res[:, idx] = values
+        if res is None:
+            res = np.full((band_count, len(x)), self.fill_value, dtype=np.float32)
+        return res
+
+    def get_resolution_meters(self) -> float:
+        if self.resolution is None:
+            self.resolution = self.get_tile(0).get_resolution_meters()
+        return self.resolution
+
+    def stats(self) -> MosaicStats:
+        with self._lock:
+            return MosaicStats(self.opens, self.evictions, len(self._tiles), self.max_open, self.reads)
+
+    def close(self):
+        with self._lock:
+            self._tiles.clear()
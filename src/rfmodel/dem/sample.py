@@ -0,0 +1,104 @@
+from typing import Optional, Tuple, Sequence, Union
+
+import numpy as np
+from osgeo import gdal, gdal_array, osr
+from osgeo_utils.auxiliary.osr_util import get_transform, get_srs, transform_points
+from osgeo_utils.auxiliary.util import PathOrDS, get_bands, get_ovr_idx, get_scales_and_offsets
+
+from rfmodel.dem.block_cache import BlockCache, block_cache, get_ds_key
+from rfmodel.dem.dem_source import DEMSource
+
+# bounding windows larger than this (in pixels) are read block by block
+max_window_size = 4096 * 4096
+
+
+def get_pixel_line(ds: gdal.Dataset, x: np.ndarray, y: np.ndarray, srs=4326,
+                   axis_order=osr.OAMS_TRADITIONAL_GIS_ORDER) -> Tuple[np.ndarray, np.ndarray]:
+    """ returns the (fractional) pixel and line coordinates of the given points in the base resolution of ds """
+    x = np.array(x, dtype=np.float64)
+    y = np.array(y, dtype=np.float64)
+    if srs is not None:
+        points_srs = get_srs(srs, axis_order=axis_order)
+        ct = get_transform(points_srs, ds.GetSpatialRef())
+        if ct is not None:
+            transform_points(ct, x, y)
+    inv_gt = gdal.InvGeoTransform(ds.GetGeoTransform())
+    if inv_gt is None:
+        raise Exception("Failed InvGeoTransform()")
+    pixels = inv_gt[0] + inv_gt[1] * x + inv_gt[2] * y
+    lines = inv_gt[3] + inv_gt[4] * x + inv_gt[5] * y
+    return pixels, lines
+
+
+def read_pixels(band: gdal.Band, cols: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    reads the values of the given (integer, in extent) pixels from the band.
+    Nearby points are read with a single ReadAsArray of their bounding window,
+    otherwise each touched block is read once.
+    """
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+    if len(cols) == 0:
+        return np.empty(0, dtype=dtype)
+    x0, x1 = int(cols.min()), int(cols.max()) + 1
+    y0, y1 = int(rows.min()), int(rows.max()) + 1
+    if (x1 - x0) * (y1 - y0) <= max_window_size:
+        window = band.ReadAsArray(x0, y0, x1 - x0, y1 - y0)
+        return window[rows - y0, cols - x0]
+
+    block_xsize, block_ysize = band.GetBlockSize()
+    block_x = cols // block_xsize
+    block_y = rows // block_ysize
+    keys = block_y.astype(np.int64) * (band.XSize // block_xsize + 1) + block_x
+    order = np.argsort(keys, kind='stable')
+    splits = np.flatnonzero(np.diff(keys[order])) + 1
+    res = np.empty(len(cols), dtype=dtype)
+    for idx in np.split(order, splits):
+        xoff = int(block_x[idx[0]]) * block_xsize
+        yoff = int(block_y[idx[0]]) * block_ysize
+        win_xsize = min(block_xsize, band.XSize - xoff)
+        win_ysize = min(block_ysize, band.YSize - yoff)
+        block = band.ReadAsArray(xoff, yoff, win_xsize, win_ysize)
+        res[idx] = block[rows[idx] - yoff, cols[idx] - xoff]
+    return res
+
+
+def sample_raster(filename_or_ds: Union[PathOrDS, DEMSource], x: np.ndarray, y: np.ndarray, srs=4326,
+                  band_nums: Optional[Union[int, Sequence[int]]] = None,
+                  ovr_idx: Optional[Union[int, float]] = None,
+                  axis_order=osr.OAMS_TRADITIONAL_GIS_ORDER,
+                  cache: Optional[BlockCache] = block_cache) -> np.ndarray:
+    """
+    Vectorized nearest neighbour sampling of a raster, compatible with the results of gdallocationinfo.
+    Points outside the raster extent are clamped to the nearest edge pixel.
+
+    :param cache: the blocks are read through this cache (default: the process-wide cache);
+        if None the bounding window of the points is read directly
+    :return: array of shape (band_count, point_count)
+    """
+    if isinstance(filename_or_ds, DEMSource):
+        return filename_or_ds.sample(x, y, srs=srs, band_nums=band_nums, ovr_idx=ovr_idx)
+    ds = (cache or block_cache).open_ds(filename_or_ds)
+    pixels, lines = get_pixel_line(ds, x, y, srs=srs, axis_order=axis_order)
+    ovr_idx = get_ovr_idx(ds, ovr_idx)
+    if band_nums is None:
+        band_nums = range(1, ds.RasterCount + 1)
+    elif isinstance(band_nums, int):
+        band_nums = [band_nums]
+    bands = get_bands(ds, band_nums, ovr_idx=ovr_idx)
+    ovr_xsize, ovr_ysize = bands[0].XSize, bands[0].YSize
+    if ovr_idx:
+        pixels *= ovr_xsize / ds.RasterXSize
+        lines *= ovr_ysize / ds.RasterYSize
+    cols = np.clip(np.floor(pixels), 0, ovr_xsize - 1).astype(np.int64)
+    rows = np.clip(np.floor(lines), 0, ovr_ysize - 1).astype(np.int64)
+
+    if cache is None:
+        values = [read_pixels(band, cols, rows) for band in bands]
+    else:
+        ds_key = get_ds_key(ds)
+        values = [cache.read_pixels(band, ds_key, ovr_idx, band_num, cols, rows)
+                  for band, band_num in zip(bands, band_nums)]
+    is_scaled, scales, offsets = get_scales_and_offsets(bands)
+    if is_scaled:
+        values = [v * scale + offset for v, scale, offset in zip(values, scales, offsets)]
+    return np.stack(values)
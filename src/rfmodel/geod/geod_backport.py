@@ -5,13 +5,21 @@ from enum import IntFlag
 from typing import Union, List, Tuple, Sequence, Any
 import numpy as np
 from pyproj import Geod as OldGeod
-from numpy.testing import assert_almost_equal
 
 
 GeodIntermediateReturn = namedtuple(
     "GeodIntermediateReturn", ["npts", "del_s", "dist", "lons", "lats", "azis"]
 )
 
+GeodIntermediateMultiReturn = namedtuple(
+    "GeodIntermediateMultiReturn", ["npts", "del_s", "dist", "lons", "lats", "azis", "offsets"]
+)
+GeodIntermediateMultiReturn.__doc__ = """
+The return value of inv_intermediate_multi, with an item per pair in npts, del_s, dist (arrays),
+and the intermediate points of all the pairs concatenated in lons, lats, azis (flat arrays).
+The points of pair i are [offsets[i]:offsets[i+1]].
+"""
+
 
 class GeodIntermediateFlag(IntFlag):
     """
@@ -52,20 +60,17 @@ class Geod(OldGeod):
 
         include_initial = bool(not initial_idx)
         include_terminus = bool(not terminus_idx)
-        lons, lats = super()._npts(lon1, lat1, lon2, lat2,
-                                   npts - int(include_terminus) - int(include_initial), radians=radians)
+        lons = np.empty(npts)
+        lats = np.empty(npts)
+        start = int(include_initial)
+        end = npts - int(include_terminus)
+        lons[start:end], lats[start:end] = super()._npts(lon1, lat1, lon2, lat2, end - start, radians=radians)
         if include_initial:
-            if include_terminus:
-                lons = (lon1, *lons, lon2)
-                lats = (lat1, *lats, lat2)
-            else:
-                lons = (lon1, *lons)
-                lats = (lat1, *lats)
-        elif include_terminus:
-            lons = (*lons, lon2)
-            lats = (*lats, lat2)
-
-        return list(zip(lons, lats)) if return_points else (lons, lats)
+            lons[0], lats[0] = lon1, lat1
+        if include_terminus:
+            lons[-1], lats[-1] = lon2, lat2
+
+        return list(zip(lons.tolist(), lats.tolist())) if return_points else (lons, lats)
 
     def inv_intermediate(
         self,
@@ -109,20 +114,36 @@ class Geod(OldGeod):
         if del_s == 0:
             _az12, _az21, del_s = self.inv(lons1=lons[0], lats1=lats[0], lons2=lons[1], lats2=lats[1], radians=radians)
 
-        ind = list(range(npts))
         if out_lons is None:
-            out_lons = np.array(lons)
+            out_lons = lons
         else:
-            np.put(out_lons, ind=ind, v=lons)
+            out_lons[:npts] = lons
         if out_lats is None:
-            out_lats = np.array(lats)
+            out_lats = lats
         else:
-            np.put(out_lats, ind=ind, v=lats)
+            out_lats[:npts] = lats
 
         # _az12, _az21, del_s = self.inv(lons1=lons[0], lats1=lats[0], lons2=lons[1], lats2=lats[1], radians=radians)
 
         return GeodIntermediateReturn(len(lons), del_s, s13, out_lons, out_lats, None)
 
+    def inv_intermediate_multi(
+        self,
+        lons1: Any,
+        lats1: Any,
+        lons2: Any,
+        lats2: Any,
+        npts: Any = 0,
+        del_s: Any = 0,
+        initial_idx: int = 1,
+        terminus_idx: int = 1,
+        radians: bool = False,
+        flags: GeodIntermediateFlag = GeodIntermediateFlag.DEFAULT,
+    ) -> GeodIntermediateMultiReturn:
+        return inv_intermediate_multi(
+            self, lons1=lons1, lats1=lats1, lons2=lons2, lats2=lats2, npts=npts, del_s=del_s,
+            initial_idx=initial_idx, terminus_idx=terminus_idx, radians=radians, flags=flags)
+
     def fwd_intermediate(
         self,
         lon1: float,
@@ -148,7 +169,83 @@ class Geod(OldGeod):
             flags=flags, out_lons=out_lons, out_lats=out_lats, out_azis=out_azis)
 
 
+def inv_intermediate_multi(
+    g: OldGeod,
+    lons1: Any,
+    lats1: Any,
+    lons2: Any,
+    lats2: Any,
+    npts: Any = 0,
+    del_s: Any = 0,
+    initial_idx: int = 1,
+    terminus_idx: int = 1,
+    radians: bool = False,
+    flags: GeodIntermediateFlag = GeodIntermediateFlag.DEFAULT,
+) -> GeodIntermediateMultiReturn:
+    """
+    The many pairs version of Geod.inv_intermediate, for the backport and for any pyproj Geod.
+    All the intermediate points are computed with a single vectorized Geod.fwd call.
+
+    lons1, lats1, lons2, lats2, npts and del_s may be arrays (one item per pair) or scalars.
+    initial_idx, terminus_idx and flags (NPTS_* and DEL_S_* and AZIS_*) have the same meaning as in inv_intermediate.
+    """
+    flags = int(flags)
+    lons1, lats1, lons2, lats2 = (
+        np.atleast_1d(v).ravel() for v in np.broadcast_arrays(*(np.asarray(v, dtype=np.float64)
+                                                                 for v in (lons1, lats1, lons2, lats2))))
+    count = len(lons1)
+    az12, _az21, dist = g.inv(lons1, lats1, lons2, lats2, radians=radians)
+    az12 = np.asarray(az12, dtype=np.float64)
+    dist = np.asarray(dist, dtype=np.float64)
+
+    npts = np.array(np.broadcast_to(npts, count), dtype=np.int64)
+    del_s = np.array(np.broadcast_to(del_s, count), dtype=np.float64)
+    by_del_s = npts == 0
+    if by_del_s.any():
+        # calc the number of required points by the distance increment
+        s12 = dist[by_del_s] / del_s[by_del_s] - initial_idx - terminus_idx + 1
+        if (flags & GeodIntermediateFlag.NPTS_MASK) == GeodIntermediateFlag.NPTS_ROUND:
+            s12 = np.round(s12)
+        elif (flags & GeodIntermediateFlag.NPTS_MASK) == GeodIntermediateFlag.NPTS_CEIL:
+            s12 = np.ceil(s12)
+        npts[by_del_s] = np.maximum(np.trunc(s12), 0)
+    intervals = npts + initial_idx + terminus_idx - 1
+    if (flags & GeodIntermediateFlag.DEL_S_MASK) == GeodIntermediateFlag.DEL_S_RECALC:
+        # calc the distance increment by the number of required points
+        np.divide(dist, intervals, out=del_s, where=intervals > 0)
+    else:
+        no_del_s = del_s == 0
+        np.divide(dist, intervals, out=del_s, where=no_del_s & (intervals > 0))
+
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(npts, out=offsets[1:])
+    pair_idx = np.repeat(np.arange(count), npts)
+    point_idx = np.arange(offsets[-1]) - offsets[pair_idx] + initial_idx
+    lons, lats, back_azis = g.fwd(lons1[pair_idx], lats1[pair_idx], az12[pair_idx],
+                                  point_idx * del_s[pair_idx], radians=radians)
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+
+    # keep the exact end points, as inv_intermediate does
+    # (with DEL_S_NO_RECALC the last point is not necessarily the terminus)
+    has_points = npts > 0
+    if not initial_idx:
+        lons[offsets[:-1][has_points]] = lons1[has_points]
+        lats[offsets[:-1][has_points]] = lats1[has_points]
+    if not terminus_idx and (flags & GeodIntermediateFlag.DEL_S_MASK) == GeodIntermediateFlag.DEL_S_RECALC:
+        lons[offsets[1:][has_points] - 1] = lons2[has_points]
+        lats[offsets[1:][has_points] - 1] = lats2[has_points]
+
+    azis = None
+    if (flags & GeodIntermediateFlag.AZIS_MASK) == GeodIntermediateFlag.AZIS_KEEP:
+        # the azimuths as returned by Geod.fwd (and by pyproj's inv_intermediate)
+        azis = np.asarray(back_azis, dtype=np.float64)
+    return GeodIntermediateMultiReturn(npts, del_s, dist, lons, lats, azis, offsets)
+
+
 def test_geod_inverse_transform():
+    from numpy.testing import assert_almost_equal
+
     gg = Geod(ellps="clrk66")
     lat1pt = 42.0 + (15.0 / 60.0)
     lon1pt = -71.0 - (7.0 / 60.0)
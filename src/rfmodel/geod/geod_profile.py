@@ -1,52 +1,147 @@
-from typing import Tuple, Optional, Union
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Tuple, Optional, Union
 
 import numpy as np
 import pyproj
-from osgeo import osr
-from osgeo_utils.auxiliary.osr_util import get_srs
 
 from rfmodel.util import version_tuple
 
 pyproj_version = version_tuple(pyproj.__version__)
 if pyproj_version >= (3, 1):
     from pyproj.geod import Geod, GeodIntermediateReturn
+    from pyproj.enums import GeodIntermediateFlag
 else:
-    from rfmodel.geod.geod_backport import Geod, GeodIntermediateReturn
+    from rfmodel.geod.geod_backport import Geod, GeodIntermediateReturn, GeodIntermediateFlag
+from rfmodel.geod.geod_backport import GeodIntermediateMultiReturn, inv_intermediate_multi
+
+from rfmodel.dem.dem_source import DEMSource, sample_dem
+from rfmodel.metrics import metrics
+
+if TYPE_CHECKING:
+    # GDAL is imported on first use, so a DEMSource is sampled without it
+    from osgeo_utils.auxiliary.util import PathOrDS
+
+
+@lru_cache(maxsize=None)
+def get_default_geod() -> Geod:
+    """ the WGS84 Geod, created on first use """
+    return Geod(ellps='WGS84')
 
-from osgeo_utils.auxiliary.util import PathOrDS, open_ds, get_pixel_size
-from osgeo_utils.samples.gdallocationinfo import gdallocationinfo
 
-g_wgs84 = Geod(ellps='WGS84')
+def __getattr__(name: str):
+    # g_wgs84 is kept for compatibility, without creating a Geod on import
+    if name == 'g_wgs84':
+        return get_default_geod()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
-def get_resolution_meters(filename_or_ds: PathOrDS):
-    ds = open_ds(filename_or_ds)
+def get_overview_factors(filename_or_ds: Union[PathOrDS, DEMSource]) -> List[float]:
+    """ :return: the downsampling factor of each overview of the raster (DEMSource has no overviews) """
+    if isinstance(filename_or_ds, DEMSource):
+        return []
+    from rfmodel.dem.block_cache import block_cache
+    ds = block_cache.open_ds(filename_or_ds)
+    band = ds.GetRasterBand(1)
+    return [ds.RasterXSize / band.GetOverview(i).XSize for i in range(band.GetOverviewCount())]
+
+
+def get_resolution_meters(filename_or_ds: Union[PathOrDS, DEMSource], ovr_idx: Optional[Union[int, float]] = None):
+    if isinstance(filename_or_ds, DEMSource):
+        return filename_or_ds.get_resolution_meters()
+    from osgeo_utils.auxiliary.osr_util import get_srs
+    from osgeo_utils.auxiliary.util import get_pixel_size, get_ovr_idx
+    from rfmodel.dem.block_cache import block_cache
+    ds = block_cache.open_ds(filename_or_ds)
     resolution, _ = get_pixel_size(ds)
     srs = get_srs(ds)
     if srs.IsGeographic():
         resolution *= 111_111  # deg to meter
+    if ovr_idx:
+        ovr_idx = get_ovr_idx(ds, ovr_idx)
+        if ovr_idx:
+            resolution *= get_overview_factors(ds)[ovr_idx - 1]
     return resolution
 
 
-def geod_profile(filename_or_ds: PathOrDS, band_nums=None, srs=4326, ovr_idx: Optional[Union[int, float]] = None,
+def get_ovr_idx_by_del_s(filename_or_ds: Union[PathOrDS, DEMSource], del_s: float) -> int:
+    """
+    :return: the ovr_idx of the coarsest overview whose resolution is not coarser than del_s [m]
+        (0 - the full resolution), so sampling every del_s doesn't skip the overview pixels
+    """
+    resolution = get_resolution_meters(filename_or_ds)
+    best_idx, best_factor = 0, 1.0
+    for i, factor in enumerate(get_overview_factors(filename_or_ds)):
+        if best_factor < factor and resolution * factor <= del_s * (1 + 1e-6):
+            best_idx, best_factor = i + 1, factor
+    return best_idx
+
+
+def geod_profile(filename_or_ds: Union[PathOrDS, DEMSource], band_nums=None, srs=4326,
+                 ovr_idx: Optional[Union[int, float, str]] = None,
                  g: Geod = None, only_geod: bool = False,
                  npts: int = 0, del_s: float = 0,
                  initial_idx: int = 0, terminus_idx: int = 0,
                  **kwargs) -> \
         Tuple[GeodIntermediateReturn, Optional[np.ndarray]]:
+    """
+    :param ovr_idx: the overview to sample, 'auto' - the one that matches the profile del_s (see get_ovr_idx_by_del_s)
+    :param del_s: the distance between the profile points [m] (default: the resolution of the sampled overview)
+    """
     if g is None:
-        g = g_wgs84
+        g = get_default_geod()
     if npts == del_s == 0:
-        filename_or_ds = open_ds(filename_or_ds)
-        del_s = get_resolution_meters(filename_or_ds)
-    geod_res = g.inv_intermediate(npts=npts, del_s=del_s,
-                                  initial_idx=initial_idx, terminus_idx=terminus_idx, **kwargs)
+        del_s = get_resolution_meters(filename_or_ds, None if ovr_idx == 'auto' else ovr_idx)
+    with metrics.stage('geodesic'):
+        geod_res = g.inv_intermediate(npts=npts, del_s=del_s,
+                                      initial_idx=initial_idx, terminus_idx=terminus_idx, **kwargs)
     lons, lats = geod_res.lons, geod_res.lats
+    metrics.inc('profile_points', geod_res.npts)
+    if only_geod:
+        raster_values = None
+    else:
+        if ovr_idx == 'auto':
+            ovr_idx = get_ovr_idx_by_del_s(filename_or_ds, geod_res.del_s)
+        with metrics.stage('raster_sampling', geod_res.npts):
+            raster_values = sample_dem(
+                filename_or_ds, x=np.asarray(lons), y=np.asarray(lats), srs=srs, band_nums=band_nums,
+                ovr_idx=ovr_idx)
+    return geod_res, raster_values
+
+
+def geod_profile_multi(filename_or_ds: Union[PathOrDS, DEMSource], lon1, lat1, lon2, lat2,
+                       band_nums=None, srs=4326, ovr_idx: Optional[Union[int, float, str]] = None,
+                       g: Geod = None, only_geod: bool = False,
+                       npts=0, del_s=0,
+                       initial_idx: int = 0, terminus_idx: int = 0,
+                       flags: GeodIntermediateFlag = GeodIntermediateFlag.DEFAULT) -> \
+        Tuple[GeodIntermediateMultiReturn, Optional[np.ndarray]]:
+    """
+    The columnar version of geod_profile.
+    Computes all the geodesics at once and samples the raster with a single vectorized read.
+    lon1, lat1, lon2, lat2, npts, del_s may be arrays (one item per profile) or scalars.
+    ovr_idx may be 'auto', see geod_profile.
+
+    :return: (geod_res, raster_values) where raster_values is of shape (band_count, total point count)
+    """
+    if g is None:
+        g = get_default_geod()
+    if np.any((np.asarray(npts) == 0) & (np.asarray(del_s) == 0)):
+        del_s = np.where(np.asarray(del_s) == 0,
+                         get_resolution_meters(filename_or_ds, None if ovr_idx == 'auto' else ovr_idx), del_s)
+    with metrics.stage('geodesic', np.size(lon1)):
+        geod_res = inv_intermediate_multi(g, lon1, lat1, lon2, lat2, npts=npts, del_s=del_s,
+                                          initial_idx=initial_idx, terminus_idx=terminus_idx, flags=flags)
+    total = int(geod_res.offsets[-1])
+    metrics.inc('profile_points', total)
     if only_geod:
         raster_values = None
     else:
-        pixels, lines, raster_values = gdallocationinfo(
-            filename_or_ds, band_nums=band_nums, x=lons, y=lats, srs=srs,
-            inline_xy_replacement=False, ovr_idx=ovr_idx,
-            axis_order=osr.OAMS_TRADITIONAL_GIS_ORDER)
+        if ovr_idx == 'auto':
+            # the finest profile decides, so no profile skips pixels
+            ovr_idx = get_ovr_idx_by_del_s(filename_or_ds, float(np.min(geod_res.del_s))) if total else 0
+        with metrics.stage('raster_sampling', total):
+            raster_values = sample_dem(
+                filename_or_ds, x=geod_res.lons, y=geod_res.lats, srs=srs, band_nums=band_nums, ovr_idx=ovr_idx)
     return geod_res, raster_values
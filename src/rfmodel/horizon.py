@@ -0,0 +1,110 @@
+from typing import TYPE_CHECKING, NamedTuple, Optional, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.reference_model import earth_radius, get_k_factor
+
+if TYPE_CHECKING:
+    from osgeo_utils.auxiliary.util import PathOrDS
+    from rfmodel.geod.geod_profile import Geod
+
+
+class HorizonQueryReturn(NamedTuple):
+    """
+    los: True for receivers above the horizon of the transmitter
+    clearance: the height of the receiver above the horizon ray (negative below it) [m], nan beyond the index radius
+    distance: the distance from the transmitter [m]
+    """
+    los: np.ndarray
+    clearance: np.ndarray
+    distance: np.ndarray
+
+
+class HorizonIndex(NamedTuple):
+    """
+    The horizon of a transmitter along num_radials radials.
+
+    lon, lat: the transmitter
+    tx_height: the height of the transmitter antenna [m above mean sea level]
+    del_s: the distance between the steps along the radials [m]
+    k_factor: the effective earth radius factor of the elevation angles
+    horizon: float32 array of shape (num_radials, steps), the maximal elevation angle (with the earth curvature)
+        of the terrain before each step, as seen from the transmitter [rad] (-inf for the first two steps)
+    elevation: float32 array of shape (num_radials, steps), the terrain elevation at each step [m]
+    """
+    lon: float
+    lat: float
+    tx_height: float
+    del_s: float
+    k_factor: float
+    horizon: np.ndarray
+    elevation: np.ndarray
+
+    def query(self, lons, lats, rx_antenna_height, rx_msl: bool = False, g: 'Geod' = None) -> HorizonQueryReturn:
+        """
+        Decides the line of sight of many receivers at once, in O(1) per receiver:
+        the elevation angle of the receiver is compared with the horizon of the nearest radial at its distance.
+
+        :param rx_antenna_height: [m above ground], or above mean sea level with rx_msl;
+            the ground is the elevation of the nearest step of the index
+        """
+        if g is None:
+            from rfmodel.geod.geod_profile import get_default_geod
+            g = get_default_geod()
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        shape = lons.shape
+        az, _az21, distance = g.inv(np.full(lons.size, self.lon), np.full(lons.size, self.lat),
+                                    lons.ravel(), lats.ravel())
+        distance = np.asarray(distance)
+        num_radials, steps = self.horizon.shape
+        radial_idx = np.rint(np.mod(az, 360) * (num_radials / 360)).astype(np.int64) % num_radials
+        # the horizon over the steps closer than the receiver
+        step_idx = np.ceil(distance / self.del_s - 1e-9).astype(np.int64)
+        inside = step_idx < steps
+        step_idx = np.minimum(step_idx, steps - 1)
+
+        rx_height = np.broadcast_to(rx_antenna_height, lons.shape).ravel().astype(np.float64)
+        ground = self.elevation[radial_idx, np.minimum(np.rint(distance / self.del_s).astype(np.int64), steps - 1)]
+        rx_height = rx_height + np.where(rx_msl, 0, ground)
+        d = np.maximum(distance, 1e-3)
+        rx_angle = (rx_height - self.tx_height) / d - d / (2 * self.k_factor * earth_radius)
+        clearance = (rx_angle - self.horizon[radial_idx, step_idx]) * d
+        clearance = np.where(inside, clearance, np.nan).astype(np.float32)
+        los = inside & ~(clearance < 0)
+        return HorizonQueryReturn(los.reshape(shape), clearance.reshape(shape), distance.reshape(shape))
+
+    def save(self, filename) -> None:
+        np.savez(filename, **self._asdict())
+
+    @classmethod
+    def load(cls, filename) -> 'HorizonIndex':
+        with np.load(filename, allow_pickle=False) as f:
+            return cls(*(f[name] if f[name].ndim else f[name].item() for name in cls._fields))
+
+
+def build_horizon_index(filename_or_ds: Union['PathOrDS', DEMSource],
+                        lon: float, lat: float, radius: float, tx_antenna_height: float, tx_msl: bool = False,
+                        num_radials: int = 3600, del_s: float = 0,
+                        refractivity: float = 301.0, k_factor: Optional[float] = None,
+                        g: 'Geod' = None, **profile_options) -> HorizonIndex:
+    """
+    Samples the terrain along num_radials radials out from the transmitter (see radial_profiles)
+    and keeps the running maximum of the elevation angles of the terrain along each radial,
+    over the effective earth (by refractivity or k_factor).
+
+    :param tx_antenna_height: [m above ground], or above mean sea level with tx_msl
+    """
+    from rfmodel.coverage import radial_profiles
+
+    profiles = radial_profiles(filename_or_ds, lon=lon, lat=lat, radius=radius, num_radials=num_radials,
+                               del_s=del_s, g=g, **profile_options)
+    if k_factor is None:
+        k_factor = float(get_k_factor(refractivity))
+    tx_height = tx_antenna_height + (0 if tx_msl else float(profiles.elevation[0, 0]))
+    distance = np.maximum(profiles.distance.astype(np.float64), 1e-3)
+    angle = (profiles.elevation - tx_height) / distance - distance / (2 * k_factor * earth_radius)
+    horizon = np.full(profiles.elevation.shape, -np.inf, dtype=np.float32)
+    if horizon.shape[1] > 2:
+        horizon[:, 2:] = np.maximum.accumulate(angle[:, 1:-1], axis=1)
+    return HorizonIndex(lon, lat, tx_height, profiles.del_s, k_factor, horizon, profiles.elevation)
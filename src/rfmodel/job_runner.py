@@ -0,0 +1,396 @@
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.metrics import metrics
+from rfmodel.rfmodel_types import RFModelResults, RFModelReturn
+
+if TYPE_CHECKING:
+    from rfmodel.coverage import CoverageReturn
+
+job_filename = 'job.json'
+inputs_dirname = 'inputs'
+link_columns = ('lon1', 'lat1', 'lon2', 'lat2', 'tx_antenna_height', 'rx_antenna_height')
+
+
+class JobStatus(NamedTuple):
+    """ the number of shards of a job by state; locked shards are being calculated (or their worker died) """
+    shards: int
+    completed: int
+    locked: int
+    pending: int
+
+    @property
+    def done(self) -> bool:
+        return self.completed == self.shards
+
+
+def _shard_name(work_dir: Path, shard: int, suffix: str) -> Path:
+    return work_dir / f'shard_{shard:06d}{suffix}'
+
+
+def _json_default(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    raise TypeError(f'{type(v).__name__} is not JSON serializable')
+
+
+def create_link_job(work_dir: Union[str, Path],
+                    lon1, lat1, lon2, lat2,
+                    tx_antenna_height, rx_antenna_height,
+                    rfmodel_options: dict,
+                    tx_msl: bool = False, rx_msl: bool = False,
+                    shard_size: int = 10_000,
+                    extra: Optional[dict] = None,
+                    **profile_options) -> JobStatus:
+    """
+    Creates a job of calc_path_loss_lonlat_results over many links in work_dir, split into shards of shard_size links
+    (see run_job). lon1, lat1, lon2, lat2, the antenna heights and the values of rfmodel_options may be arrays
+    (one item per link) or scalars, profile_options are scalars.
+
+    Creating the same job again returns its status, so a script may always create and then run its job;
+    creating a different job in the same work_dir raises a ValueError.
+
+    :param extra: json serializable data kept with the job (i.e. the names of the sites)
+    """
+    work_dir = Path(work_dir)
+    lon1, lat1, lon2, lat2 = (np.atleast_1d(v).ravel().astype(np.float64)
+                              for v in np.broadcast_arrays(lon1, lat1, lon2, lat2))
+    count = len(lon1)
+    arrays = dict(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2,
+                  tx_antenna_height=np.broadcast_to(tx_antenna_height, count).astype(np.float64),
+                  rx_antenna_height=np.broadcast_to(rx_antenna_height, count).astype(np.float64))
+    scalar_options = {}
+    for k, v in rfmodel_options.items():
+        if np.ndim(v):
+            arrays['rfmodel_options.' + k] = np.resize(np.asarray(v), count)
+        else:
+            scalar_options[k] = v
+    job = dict(kind='links', count=count, shard_size=shard_size, inputs_hash=_get_inputs_hash(arrays),
+               rfmodel_options=scalar_options, tx_msl=tx_msl, rx_msl=rx_msl,
+               profile_options=profile_options, extra=extra)
+    return _create_job(work_dir, job, arrays)
+
+
+def _get_inputs_hash(arrays: Dict[str, np.ndarray]) -> str:
+    h = hashlib.sha256()
+    for k in sorted(arrays):
+        h.update(k.encode())
+        h.update(np.ascontiguousarray(arrays[k]).tobytes())
+    return h.hexdigest()
+
+
+def _create_job(work_dir: Path, job: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> JobStatus:
+    """ writes the inputs and the job file, or checks that the job in work_dir is the same job """
+    job = json.loads(json.dumps(job, default=_json_default))
+    job_path = work_dir / job_filename
+    if job_path.exists():
+        if load_job(work_dir) != job:
+            raise ValueError(f'a different job exists in {work_dir}')
+        return job_status(work_dir)
+    # an array per input, so each shard maps only its own items
+    inputs_dir = work_dir / inputs_dirname
+    inputs_dir.mkdir(parents=True, exist_ok=True)
+    for k, v in arrays.items():
+        tmp = inputs_dir / f'{k}.{uuid.uuid4().hex}.tmp.npy'
+        np.save(tmp, v)
+        os.replace(tmp, inputs_dir / f'{k}.npy')
+    # the job file is written last, a job without it is incomplete and is created again
+    tmp = work_dir / f'{job_filename}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp, job_path)
+    return job_status(work_dir)
+
+
+def create_coverage_job(work_dir: Union[str, Path], filename_or_ds: Union[str, Path, DEMSource],
+                        lon: float, lat: float, radius: float,
+                        tx_antenna_height: float, rx_antenna_height: float, rfmodel_options: dict,
+                        tx_msl: bool = False, rx_msl: bool = False,
+                        num_radials: int = 360, del_s: float = 0, pixel_size: float = 0,
+                        min_points: int = 3, use_extension: bool = True,
+                        shard_size: int = 8,
+                        **profile_options) -> JobStatus:
+    """
+    Creates a job of the coverage of a transmitter at (lon, lat) up to radius [m] (see calc_coverage_radial),
+    split into shards of shard_size radials.
+    The radial profiles are sampled here, once, and kept with the job; each shard calculates its radials with
+    calc_radial_loss, so run_job doesn't read the DEM. The coverage is rasterized by collect_coverage_job.
+    """
+    from rfmodel.coverage import coverage_grid, deg_to_meters, radial_profiles
+
+    work_dir = Path(work_dir)
+    profiles = radial_profiles(filename_or_ds, lon=lon, lat=lat, radius=radius, num_radials=num_radials,
+                               del_s=del_s, **profile_options)
+    if not pixel_size:
+        pixel_size = profiles.del_s / deg_to_meters
+    geotransform, (rows, cols) = coverage_grid(lon, lat, radius, pixel_size)
+    arrays = dict(azimuths=profiles.azimuths, distance=profiles.distance, elevation=profiles.elevation)
+    job = dict(kind='coverage', count=num_radials, shard_size=shard_size, inputs_hash=_get_inputs_hash(arrays),
+               rfmodel_options=rfmodel_options, tx_antenna_height=tx_antenna_height,
+               rx_antenna_height=rx_antenna_height, tx_msl=tx_msl, rx_msl=rx_msl,
+               min_points=min_points, use_extension=use_extension,
+               extra=dict(lon=lon, lat=lat, del_s=profiles.del_s,
+                          geotransform=list(geotransform), shape=[rows, cols]))
+    return _create_job(work_dir, job, arrays)
+
+
+def _load_radial_profiles(work_dir: Path, job: Dict[str, Any], start: int = 0, stop: Optional[int] = None):
+    """ :return: the RadialProfiles of the radials [start, stop) of a coverage job """
+    from rfmodel.coverage import RadialProfiles
+
+    inputs_dir = work_dir / inputs_dirname
+    azimuths, distance, elevation = (np.load(inputs_dir / f'{k}.npy', mmap_mode='r')
+                                     for k in ('azimuths', 'distance', 'elevation'))
+    extra = job['extra']
+    return RadialProfiles(extra['lon'], extra['lat'], np.array(azimuths[start:stop]), extra['del_s'],
+                          np.array(distance), np.array(elevation[start:stop]))
+
+
+def load_job(work_dir: Union[str, Path]) -> Dict[str, Any]:
+    with open(Path(work_dir) / job_filename) as f:
+        return json.load(f)
+
+
+def get_shard_count(job: Dict[str, Any]) -> int:
+    return -(-job['count'] // job['shard_size'])
+
+
+def job_status(work_dir: Union[str, Path]) -> JobStatus:
+    work_dir = Path(work_dir)
+    shards = get_shard_count(load_job(work_dir))
+    completed = sum(_shard_name(work_dir, shard, '.npz').exists() for shard in range(shards))
+    locked = sum(_shard_name(work_dir, shard, '.lock').exists() and
+                 not _shard_name(work_dir, shard, '.npz').exists() for shard in range(shards))
+    return JobStatus(shards, completed, locked, shards - completed - locked)
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # os.kill terminates the process on Windows, the lock is broken after lock_timeout only
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _is_stale(lock_path: Path, lock_timeout: float) -> bool:
+    """ a lock of a dead process of this host, or a lock older than lock_timeout [s] (of any host) """
+    try:
+        mtime = lock_path.stat().st_mtime
+        with open(lock_path) as f:
+            owner = json.load(f)
+    except FileNotFoundError:
+        return False
+    except ValueError:
+        # a lock file that is being written
+        return time.time() - mtime > lock_timeout
+    if owner.get('host') == socket.gethostname() and not _pid_alive(owner.get('pid', 0)):
+        return True
+    return time.time() - mtime > lock_timeout
+
+
+def claim_shard(work_dir: Union[str, Path], shard: int, lock_timeout: float = 3600) -> bool:
+    """
+    Claims a shard by creating its lock file exclusively, which works for processes of one host
+    and for hosts that share the work_dir. A completed shard can't be claimed.
+    A stale lock (see _is_stale) is broken; at worst, two workers race on breaking it and both calculate the shard,
+    which is harmless since the results are written atomically.
+    """
+    work_dir = Path(work_dir)
+    lock_path = _shard_name(work_dir, shard, '.lock')
+    for _attempt in range(2):
+        if _shard_name(work_dir, shard, '.npz').exists():
+            return False
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _is_stale(lock_path, lock_timeout):
+                return False
+            try:
+                os.replace(lock_path, lock_path.with_name(f'{lock_path.name}.{uuid.uuid4().hex}.stale'))
+            except FileNotFoundError:
+                pass
+            for stale in work_dir.glob(f'{lock_path.name}.*.stale'):
+                stale.unlink(missing_ok=True)
+            continue
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(host=socket.gethostname(), pid=os.getpid(), time=time.time()), f)
+        # the shard may have been completed between the check and the lock
+        if _shard_name(work_dir, shard, '.npz').exists():
+            lock_path.unlink(missing_ok=True)
+            return False
+        return True
+    return False
+
+
+def calc_shard(calc_loss: Callable[[Any], RFModelReturn], filename_or_ds,
+               work_dir: Union[str, Path], shard: int, workers: Optional[int] = None) -> np.ndarray:
+    """
+    calculates a shard and writes its results atomically (the shard should be claimed, see claim_shard)
+
+    :return: the RFModelResults of the links of a link job, or the radial loss of the radials of a coverage job
+    """
+    work_dir = Path(work_dir)
+    job = load_job(work_dir)
+    start = shard * job['shard_size']
+    stop = min(start + job['shard_size'], job['count'])
+    tmp = _shard_name(work_dir, shard, f'.{uuid.uuid4().hex}.tmp.npz')
+    with metrics.stage('shard', stop - start):
+        if job['kind'] == 'coverage':
+            res = _calc_coverage_shard(calc_loss, work_dir, job, start, stop, workers=workers)
+            np.savez(tmp, radial_loss=res)
+        else:
+            res = _calc_link_shard(calc_loss, filename_or_ds, work_dir, job, start, stop, workers=workers)
+            res.save(tmp)
+    os.replace(tmp, _shard_name(work_dir, shard, '.npz'))
+    _shard_name(work_dir, shard, '.lock').unlink(missing_ok=True)
+    metrics.inc('shards')
+    return res
+
+
+def _calc_link_shard(calc_loss, filename_or_ds, work_dir: Path, job: Dict[str, Any], start: int, stop: int,
+                     workers: Optional[int] = None) -> RFModelResults:
+    from rfmodel.rfmodel import calc_path_loss_lonlat_results
+
+    rfmodel_options = dict(job['rfmodel_options'])
+    inputs_dir = work_dir / inputs_dirname
+    columns = {k: np.array(np.load(inputs_dir / f'{k}.npy', mmap_mode='r')[start:stop]) for k in link_columns}
+    for path in inputs_dir.glob('rfmodel_options.*.npy'):
+        k = path.name[len('rfmodel_options.'):-len('.npy')]
+        rfmodel_options[k] = np.array(np.load(path, mmap_mode='r')[start:stop])
+    return calc_path_loss_lonlat_results(
+        calc_loss, filename_or_ds, **columns, rfmodel_options=rfmodel_options,
+        tx_msl=job['tx_msl'], rx_msl=job['rx_msl'], workers=workers, **job['profile_options'])
+
+
+def _calc_coverage_shard(calc_loss, work_dir: Path, job: Dict[str, Any], start: int, stop: int,
+                         workers: Optional[int] = None) -> np.ndarray:
+    from rfmodel.coverage import calc_radial_loss
+
+    profiles = _load_radial_profiles(work_dir, job, start, stop)
+    tx_antenna_height = job['tx_antenna_height']
+    if not job['tx_msl']:
+        # the ground of the transmitter is taken from the first radial of the job, as calc_radial_loss does
+        tx_antenna_height += float(np.load(work_dir / inputs_dirname / 'elevation.npy', mmap_mode='r')[0, 0])
+    return calc_radial_loss(
+        calc_loss, profiles, tx_antenna_height=tx_antenna_height, rx_antenna_height=job['rx_antenna_height'],
+        rfmodel_options=job['rfmodel_options'], tx_msl=True, rx_msl=job['rx_msl'],
+        min_points=job['min_points'], use_extension=job['use_extension'], workers=workers)
+
+
+def run_job(calc_loss: Callable[[Any], RFModelReturn], filename_or_ds: Union[str, Path, DEMSource],
+            work_dir: Union[str, Path], max_shards: Optional[int] = None,
+            lock_timeout: float = 3600, workers: Optional[int] = None) -> int:
+    """
+    Calculates the shards of a job (see create_link_job, create_coverage_job) that are neither completed nor claimed
+    by other workers (a coverage job doesn't read filename_or_ds, its profiles are kept with the job).
+    Many run_job may run at once, in processes of one host or of hosts that share the work_dir;
+    when a run fails or is killed, running it again skips the completed shards, so at most a shard is lost.
+    The lock of a killed worker is broken at once on its own host, or after lock_timeout [s] on other hosts,
+    so lock_timeout should be longer than the calculation of a shard.
+
+    :param max_shards: the maximal number of shards to calculate (default: all)
+    :param workers: the number of threads per shard for thread safe models (see calc_path_loss_lonlat_results)
+    :return: the number of shards calculated
+    """
+    work_dir = Path(work_dir)
+    shards = get_shard_count(load_job(work_dir))
+    done = 0
+    for shard in range(shards):
+        if max_shards is not None and done >= max_shards:
+            break
+        if not claim_shard(work_dir, shard, lock_timeout=lock_timeout):
+            continue
+        try:
+            calc_shard(calc_loss, filename_or_ds, work_dir, shard, workers=workers)
+        except BaseException:
+            _shard_name(work_dir, shard, '.lock').unlink(missing_ok=True)
+            raise
+        done += 1
+    return done
+
+
+def _run_job_worker(calc_loss, filename_or_ds, work_dir, lock_timeout) -> int:
+    from rfmodel.parallel import _worker_dems, get_dem_key
+
+    filename_or_ds = _worker_dems.get(get_dem_key(filename_or_ds), filename_or_ds)
+    return run_job(calc_loss, filename_or_ds, work_dir, max_shards=1, lock_timeout=lock_timeout)
+
+
+def run_job_parallel(calc_loss: Callable[[Any], RFModelReturn], filename_or_ds: Union[str, Path, DEMSource],
+                     work_dir: Union[str, Path], processes: Optional[int] = None,
+                     executor: Optional[Executor] = None, lock_timeout: float = 3600,
+                     activation_key: Optional[str] = None,
+                     set_activation_key: Optional[Callable[[str], None]] = None) -> int:
+    """
+    run_job in processes worker processes (default: the cpu count) that claim the shards by their lock files.
+    calc_loss should be picklable (i.e. a module level function).
+
+    :param executor: an existing pool (see create_process_pool)
+    :return: the number of shards calculated
+    """
+    from rfmodel.parallel import create_process_pool, get_picklable_dem
+
+    filename_or_ds = get_picklable_dem(filename_or_ds)
+    own_executor = executor is None
+    if own_executor:
+        executor = create_process_pool(filename_or_ds, workers=processes,
+                                       activation_key=activation_key, set_activation_key=set_activation_key)
+    try:
+        status = job_status(work_dir)
+        shards = status.shards
+        # a task per shard, each claims the next free shard, so the workers stay busy until the last shard
+        futures = [executor.submit(_run_job_worker, calc_loss, filename_or_ds, str(work_dir), lock_timeout)
+                   for _ in range(shards - status.completed)]
+        return sum(future.result() for future in futures)
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def _check_completed(work_dir: Path, shards: int):
+    missing: List[int] = [shard for shard in range(shards) if not _shard_name(work_dir, shard, '.npz').exists()]
+    if missing:
+        raise ValueError(f'{len(missing)} of {shards} shards are not completed, i.e. shard {missing[0]}')
+
+
+def collect_job(work_dir: Union[str, Path]) -> RFModelResults:
+    """ :return: the results of all the links of a completed link job, in their order """
+    work_dir = Path(work_dir)
+    shards = get_shard_count(load_job(work_dir))
+    _check_completed(work_dir, shards)
+    return RFModelResults.concatenate([RFModelResults.load(_shard_name(work_dir, shard, '.npz'))
+                                       for shard in range(shards)])
+
+
+def collect_coverage_job(work_dir: Union[str, Path]) -> 'CoverageReturn':
+    """ :return: the coverage of a completed coverage job (see create_coverage_job), nan beyond the radius """
+    from rfmodel.coverage import CoverageReturn, rasterize_radials
+
+    work_dir = Path(work_dir)
+    job = load_job(work_dir)
+    shards = get_shard_count(job)
+    _check_completed(work_dir, shards)
+    radial_loss = []
+    for shard in range(shards):
+        with np.load(_shard_name(work_dir, shard, '.npz'), allow_pickle=False) as f:
+            radial_loss.append(f['radial_loss'])
+    extra = job['extra']
+    geotransform = tuple(extra['geotransform'])
+    loss = rasterize_radials(np.concatenate(radial_loss), _load_radial_profiles(work_dir, job),
+                             geotransform, tuple(extra['shape']))
+    return CoverageReturn(loss, geotransform, 4326)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.rfmodel import calc_profiles, get_profile_buffers
+from rfmodel.rfmodel_types import RFModelReturn, RFModelPropagationMode, RFModelResults
+
+if TYPE_CHECKING:
+    from osgeo_utils.auxiliary.util import PathOrDS
+
+
+class LinkMatrixReturn(NamedTuple):
+    """
+    Dense matrices of shape (n, m), item [i, j] is the link from site i (Tx) to site j (Rx).
+    fresnel_clearance, total_loss, free_space_loss: float32 (nan where not calculated, i.e. the diagonal)
+    propagation_mode: uint8 RFModelPropagationMode codes (UNKNOWN where not calculated)
+    """
+    fresnel_clearance: np.ndarray
+    total_loss: np.ndarray
+    free_space_loss: np.ndarray
+    propagation_mode: np.ndarray
+
+
+def get_link_matrix_tiles(n: int, m: int, tile_size: int, reciprocal: bool):
+    """ yields the (rows, cols) index arrays of the links of each tile, only the i < j links if reciprocal """
+    for row_start in range(0, n, tile_size):
+        for col_start in range(row_start if reciprocal else 0, m, tile_size):
+            rows, cols = np.meshgrid(np.arange(row_start, min(row_start + tile_size, n)),
+                                     np.arange(col_start, min(col_start + tile_size, m)), indexing='ij')
+            rows, cols = rows.ravel(), cols.ravel()
+            if reciprocal:
+                upper = rows < cols
+                rows, cols = rows[upper], cols[upper]
+            if len(rows):
+                yield rows, cols
+
+
+def calc_link_matrix(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: Union[PathOrDS, DEMSource],
+        lons: Sequence[float], lats: Sequence[float], antenna_heights,
+        rfmodel_options: dict,
+        lons2: Optional[Sequence[float]] = None, lats2: Optional[Sequence[float]] = None, antenna_heights2=None,
+        msl: bool = False,
+        tile_size: int = 256, contiguous: bool = False,
+        out: Optional[LinkMatrixReturn] = None,
+        workers: Optional[int] = None,
+        **profile_options) -> LinkMatrixReturn:
+    """
+    Calculates the links between every pair of sites.
+
+    Without lons2, lats2 - the (n, n) matrix of the links between the sites (lons, lats).
+    The profile of each unordered pair is extracted once; the reverse links (j -> i) are calculated with the reversed
+    elevation buffer of the forward (i -> j) profiles, a zero-copy view in which each reversed profile is contiguous.
+    The profile points are equally spaced, so the distances of the reverse profile, re-based to start from 0,
+    are the same as the forward ones.
+    With lons2, lats2 - the (n, m) matrix of the links from the sites (lons, lats) to the sites (lons2, lats2).
+
+    The matrix is calculated in tiles of tile_size x tile_size links, which bound the size of the profile buffers;
+    the profiles of each tile are evaluated by the fastest path the model allows (see calc_profiles).
+
+    :param antenna_heights, antenna_heights2: the antenna height of each site (or a scalar), used as Tx and as Rx
+    :param msl: True if the antenna heights are above mean sea level, otherwise above the terrain
+    :param contiguous: True to pass the reversed profiles as a contiguous copy (a single copy per tile);
+        False to pass the zero-copy reversed (negative stride) view
+    :param workers: the number of threads for thread safe models that release the GIL (see calc_profiles)
+    """
+    from rfmodel.geod.geod_profile import geod_profile_multi
+
+    reciprocal = lons2 is None
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    n = len(lons)
+    antenna_heights = np.broadcast_to(np.asarray(antenna_heights, dtype=np.float64), n)
+    if reciprocal:
+        lons2, lats2, antenna_heights2 = lons, lats, antenna_heights
+    else:
+        lons2 = np.asarray(lons2, dtype=np.float64)
+        lats2 = np.asarray(lats2, dtype=np.float64)
+        antenna_heights2 = np.broadcast_to(np.asarray(
+            antenna_heights if antenna_heights2 is None else antenna_heights2, dtype=np.float64), len(lons2))
+    m = len(lons2)
+
+    if out is None:
+        out = LinkMatrixReturn(*(np.full((n, m), np.nan, dtype=np.float32) for _ in range(3)),
+                               np.full((n, m), RFModelPropagationMode.UNKNOWN, dtype=np.uint8))
+
+    def calc_tile(profile_elevation, profile_distance, offsets, tx, rx, tx_idx, rx_idx):
+        tile_out = RFModelResults.empty(len(tx_idx))
+        calc_profiles(calc_loss, profile_elevation, profile_distance, offsets, tx, rx, tile_out.columns,
+                      rfmodel_options=rfmodel_options, workers=workers)
+        for matrix, column in zip(out, tile_out.columns):
+            matrix[tx_idx, rx_idx] = column
+
+    for rows, cols in get_link_matrix_tiles(n, m, tile_size, reciprocal):
+        geod_res, raster_res = geod_profile_multi(
+            filename_or_ds, lons[rows], lats[rows], lons2[cols], lats2[cols], **profile_options)
+        profile_elevation, profile_distance = get_profile_buffers(geod_res, raster_res)
+        offsets = geod_res.offsets
+        tx_ground, rx_ground = (0.0, 0.0) if msl else \
+            (profile_elevation[offsets[:-1]], profile_elevation[offsets[1:] - 1])
+        calc_tile(profile_elevation, profile_distance, offsets,
+                  antenna_heights[rows] + tx_ground, antenna_heights2[cols] + rx_ground, rows, cols)
+        if reciprocal:
+            # the reversed buffer holds the reversed profiles in reverse order
+            total = len(profile_elevation)
+            lengths = np.diff(offsets)[::-1]
+            reversed_offsets = total - offsets[::-1]
+            forward_idx = np.repeat(np.arange(len(rows))[::-1], lengths)
+            point_idx = np.arange(total) - np.repeat(reversed_offsets[:-1], lengths)
+            reversed_distance = profile_distance[offsets[:-1][forward_idx] + point_idx]
+            reversed_elevation = profile_elevation[::-1]
+            if contiguous:
+                reversed_elevation = np.ascontiguousarray(reversed_elevation)
+            calc_tile(reversed_elevation, reversed_distance, reversed_offsets,
+                      (antenna_heights[cols] + rx_ground)[::-1], (antenna_heights[rows] + tx_ground)[::-1],
+                      cols[::-1], rows[::-1])
+    return out
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, NamedTuple
+
+_null_stage = nullcontext()
+
+
+class StageStats(NamedTuple):
+    calls: int
+    count: int
+    seconds: float
+    max_seconds: float
+
+
+class _Stage:
+    __slots__ = ('registry', 'name', 'count', 'start')
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, count: int):
+        self.registry = registry
+        self.name = name
+        self.count = count
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.registry.record_stage(self.name, time.perf_counter() - self.start, self.count)
+
+
+class MetricsRegistry:
+    """
+    Records the wall time of the pipeline stages (geodesic, raster_sampling, array_conversion, model),
+    counters (i.e. profile_points, links) and the number of links by propagation mode.
+
+    When disabled (the default, unless the RFMODEL_METRICS environment variable is set) stage() returns a shared
+    no-op context and the instrumented code skips the counters, so the instrumentation can be left in place.
+    Hooks (callables of (stage, seconds, count)) are called on the end of each stage.
+    Collectors are objects with a stats() method that returns a NamedTuple (i.e. BlockCache, ResultCache),
+    they are weakly referenced and read only on snapshot; the stats of several objects of the same name are summed.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._stages: Dict[str, List] = {}
+        self._counters: Dict[str, float] = {}
+        self._modes: Dict[str, int] = {}
+        self._hooks: List[Callable[[str, float, int], None]] = []
+        self._collectors: Dict[str, weakref.WeakSet] = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, count: int = 1):
+        """ a context manager that records the wall time of a stage that processes count items """
+        if not self.enabled:
+            return _null_stage
+        return _Stage(self, name, count)
+
+    def record_stage(self, name: str, seconds: float, count: int = 1):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                self._stages[name] = [1, count, seconds, seconds]
+            else:
+                stage[0] += 1
+                stage[1] += count
+                stage[2] += seconds
+                stage[3] = max(stage[3], seconds)
+        for hook in self._hooks:
+            hook(name, seconds, count)
+
+    def inc(self, name: str, value: float = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def count_mode(self, propagation_mode: str, value: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._modes[propagation_mode] = self._modes.get(propagation_mode, 0) + value
+
+    def add_hook(self, hook: Callable[[str, float, int], None]):
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, float, int], None]):
+        self._hooks.remove(hook)
+
+    def add_collector(self, name: str, obj: Any):
+        with self._lock:
+            self._collectors.setdefault(name, weakref.WeakSet()).add(obj)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._modes.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: StageStats(*stage)._asdict() for name, stage in self._stages.items()}
+            counters = dict(self._counters)
+            modes = dict(self._modes)
+            collectors = {name: list(objs) for name, objs in self._collectors.items()}
+        collected = {}
+        for name, objs in collectors.items():
+            if not objs:
+                continue
+            values = {}
+            for obj in objs:
+                for k, v in obj.stats()._asdict().items():
+                    values[k] = values.get(k, 0) + v
+            collected[name] = values
+        return dict(stages=stages, counters=counters, propagation_modes=modes, collectors=collected)
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix: str = 'rfmodel') -> str:
+        """ :return: the snapshot in the Prometheus text exposition format """
+        snapshot = self.snapshot()
+        lines = []
+
+        def add_metric(name: str, metric_type: str, samples):
+            lines.append(f'# TYPE {prefix}_{name} {metric_type}')
+            for labels, value in samples:
+                labels = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'{prefix}_{name}{{{labels}}} {value}' if labels else f'{prefix}_{name} {value}')
+
+        stages = snapshot['stages']
+        if stages:
+            add_metric('stage_calls_total', 'counter', ((dict(stage=k), v['calls']) for k, v in stages.items()))
+            add_metric('stage_items_total', 'counter', ((dict(stage=k), v['count']) for k, v in stages.items()))
+            add_metric('stage_seconds_total', 'counter', ((dict(stage=k), v['seconds']) for k, v in stages.items()))
+            add_metric('stage_max_seconds', 'gauge', ((dict(stage=k), v['max_seconds']) for k, v in stages.items()))
+        for name, value in snapshot['counters'].items():
+            add_metric(f'{name}_total', 'counter', [({}, value)])
+        if snapshot['propagation_modes']:
+            add_metric('links_by_mode_total', 'counter',
+                       ((dict(propagation_mode=k), v) for k, v in snapshot['propagation_modes'].items()))
+        for collector, values in snapshot['collectors'].items():
+            for name, value in values.items():
+                add_metric(f'{collector}_{name}', 'gauge', [({}, value)])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry(enabled=bool(os.environ.get('RFMODEL_METRICS')))
+
+
+def enable_metrics(enabled: bool = True):
+    metrics.enabled = enabled
@@ -0,0 +1,146 @@
+import pickle
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from rfmodel.rfmodel_types import RFModelReturn, RFModelPropagationMode
+
+# batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx_antenna_height, out, extension=None,
+#       **rfmodel_options) -> None
+# the profiles are ragged in flat float32 buffers (the points of profile i are [offsets[i]:offsets[i+1]]),
+# the antenna heights [m above mean sea level], extension flags (uint8) and the rfmodel_options values
+# are arrays with an item per profile or scalars; the results are written into
+# out = (fresnel_clearance, total_loss, free_space_loss (float32), propagation_mode (uint8 RFModelPropagationMode))
+BatchCalcLoss = Callable[..., None]
+
+
+class ModelCapabilities(NamedTuple):
+    """
+    batch: a batch form of the model (see BatchCalcLoss), evaluates many profiles in one call
+    thread_safe: the model may be called concurrently from several threads
+    releases_gil: the model (or its batch form) releases the GIL, so threads run it in parallel
+    extension: the model accepts extension=True for a profile that extends the previous one along a radial
+    picklable: the model may be sent to worker processes
+        (for models that are not registered, it is probed with pickle.dumps)
+    """
+    batch: Optional[BatchCalcLoss] = None
+    thread_safe: bool = False
+    releases_gil: bool = False
+    extension: bool = False
+    picklable: bool = True
+
+
+scalar_capabilities = ModelCapabilities()
+
+_registry: Dict[Union[Callable, str], ModelCapabilities] = {}
+
+
+def get_model_name(calc_loss: Callable) -> str:
+    return f'{getattr(calc_loss, "__module__", "")}.{getattr(calc_loss, "__qualname__", type(calc_loss).__qualname__)}'
+
+
+def register_model(calc_loss: Union[Callable, str, None] = None, capabilities: Optional[ModelCapabilities] = None,
+                   **kwargs):
+    """
+    Declares the capabilities of a calc_loss model.
+    calc_loss may also be given by its 'module.qualname', so a model can be registered without importing it.
+    May be used as a decorator: @register_model(capabilities=...) or @register_model(thread_safe=True, ...)
+    """
+    if capabilities is None:
+        capabilities = ModelCapabilities(**kwargs)
+    if calc_loss is None:
+        return lambda f: register_model(f, capabilities)
+    _registry[calc_loss] = capabilities
+    return calc_loss
+
+
+def get_model_capabilities(calc_loss: Callable) -> ModelCapabilities:
+    """
+    :return: the registered capabilities of calc_loss, or its rfmodel_capabilities attribute,
+        otherwise the capabilities of an opaque scalar callable, which is picklable only if pickle.dumps succeeds
+        (i.e. a module level function, not a lambda or a closure)
+    """
+    try:
+        capabilities = _registry.get(calc_loss)
+    except TypeError:  # unhashable
+        capabilities = None
+    if capabilities is None:
+        capabilities = getattr(calc_loss, 'rfmodel_capabilities', None)
+    if capabilities is None:
+        capabilities = _registry.get(get_model_name(calc_loss))
+    if capabilities is None:
+        capabilities = scalar_capabilities if is_picklable(calc_loss) else \
+            scalar_capabilities._replace(picklable=False)
+    return capabilities
+
+
+def is_picklable(obj: Any) -> bool:
+    try:
+        pickle.dumps(obj)
+    except Exception:
+        return False
+    return True
+
+
+def calc_batch_with_scalar(calc_loss: Callable[[Any], RFModelReturn],
+                           profile_elevation: np.ndarray, profile_distance: np.ndarray, offsets: np.ndarray,
+                           tx_antenna_height, rx_antenna_height,
+                           out: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+                           extension=None, **rfmodel_options):
+    """ evaluates the batch protocol with a scalar model, one call per profile """
+    count = len(offsets) - 1
+    columns = {k: np.broadcast_to(v, count).tolist() for k, v in rfmodel_options.items() if np.ndim(v)}
+    scalars = {k: v for k, v in rfmodel_options.items() if k not in columns}
+    if extension is not None:
+        columns['extension'] = [bool(e) for e in np.broadcast_to(extension, count)]
+    tx_antenna_height = np.broadcast_to(tx_antenna_height, count).tolist()
+    rx_antenna_height = np.broadcast_to(rx_antenna_height, count).tolist()
+    fresnel_clearance, total_loss, free_space_loss, propagation_mode = out
+    for i, (start, end) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+        res = calc_loss(tx_antenna_height=tx_antenna_height[i], rx_antenna_height=rx_antenna_height[i],
+                        num_profile_points=end - start,
+                        profile_elevation=profile_elevation[start:end], profile_distance=profile_distance[start:end],
+                        **scalars, **{k: v[i] for k, v in columns.items()})
+        fresnel_clearance[i], total_loss[i], free_space_loss[i] = res[0:3]
+        propagation_mode[i] = RFModelPropagationMode.from_str(res[4])
+
+
+def _calc_tirem_loss_batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx_antenna_height, out,
+                           frequency, refractivity, conductivity, permittivity, humidity, polarization,
+                           extension=None):
+    from tirem.tirem3 import calc_tirem_loss_batch
+
+    count = len(offsets) - 1
+    columns = (np.ascontiguousarray(np.broadcast_to(v, count), dtype=np.float32)
+               for v in (tx_antenna_height, rx_antenna_height, frequency,
+                         refractivity, conductivity, permittivity, humidity))
+    polarization = np.ascontiguousarray(np.broadcast_to(polarization, count), dtype=np.uint8)
+    if extension is not None:
+        extension = np.ascontiguousarray(np.broadcast_to(extension, count), dtype=np.uint8)
+    # the extension writes into contiguous buffers, the columns of RFModelResults are strided views
+    contiguous_out = tuple(o if o.flags.c_contiguous else np.empty(count, dtype=o.dtype) for o in out)
+    calc_tirem_loss_batch(np.ascontiguousarray(profile_elevation, dtype=np.float32),
+                          np.ascontiguousarray(profile_distance, dtype=np.float32),
+                          np.ascontiguousarray(offsets, dtype=np.int64), *columns, polarization, *contiguous_out,
+                          extension)
+    for o, c in zip(out, contiguous_out):
+        if o is not c:
+            o[:] = c
+
+
+def _calc_reference_loss_batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx_antenna_height,
+                               out, frequency, refractivity=301.0, k_factor=None, deygout_depth: int = 2,
+                               extension=None, **kwargs):
+    from rfmodel.reference_model import calc_reference_loss_batch
+
+    calc_reference_loss_batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx_antenna_height,
+                              frequency, refractivity=refractivity, k_factor=k_factor, deygout_depth=deygout_depth,
+                              out=out)
+
+
+# the CalcTiremLoss state of an extension is global, so TIREM isn't thread safe
+# (depending on how it was built, the extension module reports its name as tirem3 or as tirem.tirem3)
+for _name in ('tirem.tirem3.calc_tirem_loss', 'tirem3.calc_tirem_loss'):
+    register_model(_name, batch=_calc_tirem_loss_batch, extension=True)
+register_model('rfmodel.reference_model.calc_reference_loss', batch=_calc_reference_loss_batch,
+               thread_safe=True, releases_gil=True)
@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, Executor
+from typing import Any, Callable, Optional, Sequence, Tuple, Dict, Hashable
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch, get_columns_from_dict_of_sequences
+from rfmodel.rfmodel_types import RFModelReturn
+
+_worker_dems: Dict[Hashable, Any] = {}
+
+
+def init_worker(filename_or_ds=None, activation_key: Optional[str] = None,
+                set_activation_key: Optional[Callable[[str], None]] = None):
+    """
+    Process pool initializer: sets the model activation key and opens the DEM once per worker.
+    The key is set with set_activation_key (default: tirem_set_activation_key).
+    """
+    if activation_key is not None:
+        if set_activation_key is None:
+            from tirem.tirem3 import tirem_set_activation_key as set_activation_key
+        set_activation_key(activation_key)
+    if isinstance(filename_or_ds, DEMSource):
+        _worker_dems[get_dem_key(filename_or_ds)] = filename_or_ds
+    elif filename_or_ds is not None:
+        from rfmodel.dem.block_cache import block_cache
+        _worker_dems[get_dem_key(filename_or_ds)] = block_cache.open_ds(filename_or_ds)
+
+
+def get_dem_key(filename_or_ds) -> Hashable:
+    return type(filename_or_ds).__name__, str(getattr(filename_or_ds, 'filename', filename_or_ds))
+
+
+def get_picklable_dem(filename_or_ds):
+    """
+    GDAL datasets can't be sent to other processes - send their filename instead;
+    a dataset without a file (i.e. in memory) can't be opened by the workers, convert it with MMapDEM.create
+    """
+    if isinstance(filename_or_ds, (str, os.PathLike, DEMSource)) or filename_or_ds is None:
+        return filename_or_ds
+    filename = filename_or_ds.GetDescription()
+    if not filename or filename.startswith('/vsimem/'):
+        raise ValueError(f'the dataset {filename!r} has no file that the worker processes can open, '
+                         f'convert it with MMapDEM.create')
+    return filename
+
+
+def create_process_pool(filename_or_ds=None, workers: Optional[int] = None,
+                        activation_key: Optional[str] = None,
+                        set_activation_key: Optional[Callable[[str], None]] = None) -> ProcessPoolExecutor:
+    """ creates a process pool whose workers are initialized with init_worker, it may be reused for many jobs """
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker,
+        initargs=(get_picklable_dem(filename_or_ds), activation_key, set_activation_key))
+
+
+def _calc_link_chunk(calc_loss, filename_or_ds, kwargs) -> Tuple[np.ndarray, np.ndarray]:
+    filename_or_ds = _worker_dems.get(get_dem_key(filename_or_ds), filename_or_ds)
+    # the pool already uses the cores, a thread pool per worker would oversubscribe them
+    return calc_path_loss_lonlat_batch(calc_loss, filename_or_ds, workers=1, **kwargs)
+
+
+def _slice_columns(d: dict, start: int, stop: int, count: int) -> dict:
+    """ slices the per-link columns (arrays or sequences of count items), the other values are sent as they are """
+    res = {}
+    for k, v in d.items():
+        if isinstance(v, (Sequence, np.ndarray)) and not isinstance(v, str):
+            column = np.asarray(v)
+            if column.shape == (count,):
+                v = column[start:stop]
+        res[k] = v
+    return res
+
+
+def calc_path_loss_lonlat_batch_parallel(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds,
+        lon1, lat1, lon2, lat2,
+        tx_antenna_height, rx_antenna_height,
+        rfmodel_options: dict,
+        workers: Optional[int] = None, chunk_size: int = 1000,
+        executor: Optional[Executor] = None,
+        activation_key: Optional[str] = None,
+        set_activation_key: Optional[Callable[[str], None]] = None,
+        out: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    calc_path_loss_lonlat_batch distributed over a process pool in chunks of chunk_size links.
+    The results are written in order into the output arrays.
+    calc_loss should be picklable (i.e. a module level function).
+
+    :param executor: an existing pool (see create_process_pool), otherwise a pool of workers processes is created
+    """
+    lon1, lat1, lon2, lat2 = (np.atleast_1d(v).ravel() for v in np.broadcast_arrays(lon1, lat1, lon2, lat2))
+    count = len(lon1)
+    filename_or_ds = get_picklable_dem(filename_or_ds)
+    if out is None:
+        a = np.empty((3, count), dtype=np.float32)
+        b = np.empty(count, dtype=bool)
+    else:
+        a, b = out
+
+    columns = dict(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2,
+                   tx_antenna_height=np.broadcast_to(tx_antenna_height, count),
+                   rx_antenna_height=np.broadcast_to(rx_antenna_height, count))
+    columns.update(kwargs)
+    rfmodel_options = get_columns_from_dict_of_sequences(rfmodel_options, count)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_process_pool(filename_or_ds, workers=workers,
+                                       activation_key=activation_key, set_activation_key=set_activation_key)
+    try:
+        futures = {}
+        for start in range(0, count, chunk_size):
+            stop = min(start + chunk_size, count)
+            chunk_kwargs = _slice_columns(columns, start, stop, count)
+            chunk_kwargs['rfmodel_options'] = _slice_columns(rfmodel_options, start, stop, count)
+            futures[start, stop] = executor.submit(_calc_link_chunk, calc_loss, filename_or_ds, chunk_kwargs)
+        for (start, stop), future in futures.items():
+            a[:, start:stop], b[start:stop] = future.result()
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+    return a, b
@@ -0,0 +1,123 @@
+from enum import IntEnum
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from rfmodel.reference_model import earth_radius, free_space_loss, get_k_factor, speed_of_light
+from rfmodel.rfmodel_types import RFModelPropagationMode
+
+
+class PrescreenClass(IntEnum):
+    """
+    SKIP: the free space loss alone exceeds max_loss, the model isn't called
+    SIMPLE: a clear line of sight, the free space loss is used
+    FULL: calc_loss is called
+    """
+    SKIP = 0
+    SIMPLE = 1
+    FULL = 2
+
+
+class PrescreenCriteria(NamedTuple):
+    """
+    max_loss: links whose free space loss exceeds max_loss [dB] are skipped (None - don't skip)
+    los_clearance: links whose fresnel clearance (the minimal ratio of the clearance to the first Fresnel zone
+        radius) is at least los_clearance get the free space loss (None - don't use the simple model),
+        i.e. 0.6 - the classic 60% clearance criterion
+    """
+    max_loss: Optional[float] = None
+    los_clearance: Optional[float] = None
+
+
+class PrescreenStats(NamedTuple):
+    links: int
+    skipped: int
+    simple: int
+    full: int
+
+
+class PrescreenReturn(NamedTuple):
+    """
+    classes: uint8 PrescreenClass codes, an item per profile
+    free_space_loss: [dB]
+    fresnel_clearance: the estimated ratio of the minimal clearance of the ray path to the first Fresnel zone radius,
+        over the effective earth (negative when the ray is obstructed, inf for profiles without interior points)
+    """
+    classes: np.ndarray
+    free_space_loss: np.ndarray
+    fresnel_clearance: np.ndarray
+
+    def stats(self) -> PrescreenStats:
+        counts = np.bincount(self.classes, minlength=len(PrescreenClass))
+        return PrescreenStats(len(self.classes), int(counts[PrescreenClass.SKIP]),
+                              int(counts[PrescreenClass.SIMPLE]), int(counts[PrescreenClass.FULL]))
+
+
+def prescreen_profiles(
+        profile_elevation: np.ndarray, profile_distance: np.ndarray, offsets: np.ndarray,
+        tx_antenna_height, rx_antenna_height, frequency,
+        criteria: PrescreenCriteria, refractivity=301.0, k_factor=None) -> PrescreenReturn:
+    """
+    Classifies all the profiles at once by the free space loss and the first Fresnel zone clearance
+    over the effective earth (by refractivity or k_factor).
+
+    The profiles are given in flat buffers, the points of profile i are [offsets[i]:offsets[i+1]].
+    tx_antenna_height, rx_antenna_height [m above mean sea level], frequency [MHz] and refractivity [N-units]
+    may be arrays (one item per profile) or scalars.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    count = len(offsets) - 1
+    elevation = np.asarray(profile_elevation[offsets[0]:offsets[-1]], dtype=np.float64)
+    distance = np.asarray(profile_distance[offsets[0]:offsets[-1]], dtype=np.float64)
+    offsets = offsets - offsets[0]
+    lengths = offsets[1:] - offsets[:-1]
+    non_empty = lengths > 0
+    # the first and last point of each profile (clipped, so empty profiles don't index out of the buffers)
+    starts = np.minimum(offsets[:-1], max(len(distance) - 1, 0))
+    ends = np.clip(offsets[1:] - 1, 0, None)
+    if k_factor is None:
+        k_factor = get_k_factor(refractivity)
+    tx, rx, frequency, k_factor = (np.broadcast_to(np.asarray(v, dtype=np.float64), count)
+                                   for v in (tx_antenna_height, rx_antenna_height, frequency, k_factor))
+
+    classes = np.full(count, PrescreenClass.FULL, dtype=np.uint8)
+    fresnel_clearance = np.full(count, np.inf)
+    fsl = np.full(count, np.nan)
+    if not non_empty.any():
+        return PrescreenReturn(classes, fsl, fresnel_clearance)
+    path_length = np.where(non_empty, distance[ends] - distance[starts], 0)
+    fsl[:] = free_space_loss(path_length, frequency)
+
+    profile_idx = np.repeat(np.arange(count), lengths)
+    d1 = distance - distance[starts][profile_idx]
+    d2 = path_length[profile_idx] - d1
+    bulge = d1 * d2 / (2 * k_factor[profile_idx] * earth_radius)
+    ray = tx[profile_idx] + (rx - tx)[profile_idx] * d1 / np.maximum(path_length[profile_idx], 1e-3)
+    wavelength = speed_of_light / 1e6 / frequency[profile_idx]
+    fresnel_radius = np.sqrt(wavelength * np.maximum(d1, 1e-3) * np.maximum(d2, 1e-3) /
+                             np.maximum(path_length[profile_idx], 1e-3))
+    ratio = (ray - elevation - bulge) / fresnel_radius
+    ratio[starts[non_empty]] = np.inf
+    ratio[ends[non_empty]] = np.inf
+    fresnel_clearance[non_empty] = np.minimum.reduceat(ratio, starts[non_empty])
+
+    if criteria.los_clearance is not None:
+        classes[non_empty & (fresnel_clearance >= criteria.los_clearance)] = PrescreenClass.SIMPLE
+    if criteria.max_loss is not None:
+        classes[fsl > criteria.max_loss] = PrescreenClass.SKIP
+    return PrescreenReturn(classes, fsl, fresnel_clearance)
+
+
+def fill_prescreened(res: PrescreenReturn, out: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]):
+    """
+    Writes the results of the links that don't need the model into out (see BatchCalcLoss):
+    SIMPLE links get the free space loss with the LOS mode,
+    SKIP links get the free space loss as a lower bound of the total loss with the UNKNOWN mode.
+    """
+    fresnel_clearance, total_loss, fsl, propagation_mode = out
+    screened = res.classes != PrescreenClass.FULL
+    fresnel_clearance[screened] = res.fresnel_clearance[screened]
+    total_loss[screened] = res.free_space_loss[screened]
+    fsl[screened] = res.free_space_loss[screened]
+    propagation_mode[screened] = np.where(res.classes[screened] == PrescreenClass.SIMPLE,
+                                          RFModelPropagationMode.LOS, RFModelPropagationMode.UNKNOWN)
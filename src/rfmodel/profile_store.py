@@ -0,0 +1,134 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from rfmodel.read_profile import read_profile
+
+# file layout (little endian):
+# header: magic (8 bytes), count (int64), total point count (int64), reserved (int64)
+# elevation: float32[total], distance: float32[total], offsets: int64[count + 1], ids: int64[count]
+magic = b'RFPROF01'
+header_dtype = np.dtype([('magic', 'S8'), ('count', '<i8'), ('total', '<i8'), ('reserved', '<i8')])
+
+
+class ProfileStoreWriter:
+    """
+    Streams profiles into a ProfileStore file.
+    The elevations are written as they come, the distances are spooled to a temporary file and appended on close.
+    """
+
+    def __init__(self, filename: Union[str, Path]):
+        self.filename = str(filename)
+        self._dist_filename = self.filename + '.dist.tmp'
+        self._f = open(self.filename, 'wb')
+        self._dist_f = open(self._dist_filename, 'wb')
+        self._f.write(np.zeros(1, dtype=header_dtype).tobytes())
+        self._offsets = [0]
+        self._ids = []
+
+    def append(self, dist: np.ndarray, elev: np.ndarray, profile_id: Optional[int] = None):
+        if len(dist) != len(elev):
+            raise ValueError(f'len(dist)={len(dist)} should be the same as len(elev)={len(elev)}')
+        self._f.write(np.ascontiguousarray(elev, dtype='<f4').tobytes())
+        self._dist_f.write(np.ascontiguousarray(dist, dtype='<f4').tobytes())
+        self._ids.append(len(self._ids) if profile_id is None else profile_id)
+        self._offsets.append(self._offsets[-1] + len(dist))
+
+    def close(self):
+        if self._f is None:
+            return
+        self._dist_f.close()
+        with open(self._dist_filename, 'rb') as dist_f:
+            shutil.copyfileobj(dist_f, self._f)
+        os.remove(self._dist_filename)
+        self._f.write(np.array(self._offsets, dtype='<i8').tobytes())
+        self._f.write(np.array(self._ids, dtype='<i8').tobytes())
+        header = np.array([(magic, len(self._ids), self._offsets[-1], 0)], dtype=header_dtype)
+        self._f.seek(0)
+        self._f.write(header.tobytes())
+        self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ProfileStore:
+    """
+    A memory-mapped container of many profiles.
+    The distances and elevations of all the profiles are kept in flat float32 arrays (dist, elev);
+    the points of profile i are [offsets[i]:offsets[i+1]], so they may be passed as is to batch computations.
+    Profiles are accessed by their index (store[i]) or by their id (store.get(profile_id)).
+    """
+
+    def __init__(self, filename: Union[str, Path]):
+        self.filename = str(filename)
+        header = np.fromfile(self.filename, dtype=header_dtype, count=1)
+        if len(header) != 1 or header['magic'][0] != magic:
+            raise ValueError(f'{self.filename} is not a profile store')
+        count, total = int(header['count'][0]), int(header['total'][0])
+        offset = header_dtype.itemsize
+        self.elev = self._memmap('<f4', offset, total)
+        offset += 4 * total
+        self.dist = self._memmap('<f4', offset, total)
+        offset += 4 * total
+        self.offsets = self._memmap('<i8', offset, count + 1)
+        offset += 8 * (count + 1)
+        self.ids = self._memmap('<i8', offset, count)
+        self._id_order = None
+
+    def _memmap(self, dtype, offset: int, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.filename, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+    @property
+    def npts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ :return: (dist, elev) views of profile idx """
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.dist[start:end], self.elev[start:end]
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def index_of(self, profile_id: int) -> int:
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        i = np.searchsorted(self.ids, profile_id, sorter=self._id_order)
+        if i == len(self) or self.ids[self._id_order[i]] != profile_id:
+            raise KeyError(profile_id)
+        return int(self._id_order[i])
+
+    def get(self, profile_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self[self.index_of(profile_id)]
+
+    @staticmethod
+    def write(filename: Union[str, Path], profiles: Iterable[Tuple[np.ndarray, np.ndarray]],
+              ids: Optional[Iterable[int]] = None) -> 'ProfileStore':
+        """ writes the given (dist, elev) profiles into a new store and opens it """
+        with ProfileStoreWriter(filename) as writer:
+            if ids is None:
+                for dist, elev in profiles:
+                    writer.append(dist, elev)
+            else:
+                for profile_id, (dist, elev) in zip(ids, profiles):
+                    writer.append(dist, elev, profile_id)
+        return ProfileStore(filename)
+
+    @staticmethod
+    def from_text_files(filename: Union[str, Path], profile_filenames: Iterable[str]) -> 'ProfileStore':
+        """ converts profile text files (see read_profile) into a store """
+        return ProfileStore.write(filename, (read_profile(f) for f in profile_filenames))
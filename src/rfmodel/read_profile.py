@@ -4,14 +4,16 @@ import numpy as np
 
 
 def read_profile(filename: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    reads a profile text file (i.e. ELEV3.DAT):
+    the first line is the number of points, followed by a line of "distance elevation" per point
+    """
     with open(filename, 'r') as f:
-        lines = f.readlines()
-    count = int(lines[0].strip())
-    dist = np.empty(count, dtype=np.float32)
-    elev = np.empty(count, dtype=np.float32)
-    for i in range(count):
-        d, e = lines[i+1].strip().split()
-        dist[i] = float(d)
-        elev[i] = float(e)
+        count = int(f.readline().strip())
+        values = np.fromstring(f.read(), dtype=np.float64, sep=' ')
+    if len(values) < 2 * count:
+        raise ValueError(f'{filename}: expected {count} points, found {len(values) // 2}')
+    values = values[:2 * count].reshape(count, 2).astype(np.float32)
+    dist = np.ascontiguousarray(values[:, 0])
+    elev = np.ascontiguousarray(values[:, 1])
     return dist, elev
-
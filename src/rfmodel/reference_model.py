@@ -0,0 +1,146 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from rfmodel.rfmodel_types import RFModelReturn, RFModelPropagationMode
+
+reference_model_version = 'REF-1.0'
+earth_radius = 6_371_000  # [m]
+speed_of_light = 299_792_458  # [m/s]
+
+
+def get_k_factor(refractivity) -> np.ndarray:
+    """ the effective earth radius factor for the given surface refractivity [N-units] (ITU-R P.452) """
+    return 1 / (1 - 0.04665 * np.exp(0.005577 * np.asarray(refractivity, dtype=np.float64)))
+
+
+def knife_edge_loss(v: np.ndarray) -> np.ndarray:
+    """ the single knife edge diffraction loss [dB] of the Fresnel-Kirchhoff parameter v (ITU-R P.526) """
+    v = np.asarray(v, dtype=np.float64)
+    clipped = np.maximum(v, -0.78)
+    loss = 6.9 + 20 * np.log10(np.sqrt((clipped - 0.1) ** 2 + 1) + clipped - 0.1)
+    return np.where(v > -0.78, loss, 0.0)
+
+
+def free_space_loss(distance, frequency) -> np.ndarray:
+    """ :return: free space loss [dB] of distance [m] at frequency [MHz] """
+    return 20 * np.log10(np.maximum(distance, 1) / 1000) + 20 * np.log10(frequency) + 32.45
+
+
+def _segment_argmax(values: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    :param values: the values of consecutive segments of the given lengths
+    :return: the index (into values) of the first maximum of each segment, -1 for empty segments
+    """
+    res = np.full(len(lengths), -1, dtype=np.int64)
+    non_empty = lengths > 0
+    if not non_empty.any():
+        return res
+    seg_starts = (np.cumsum(lengths) - lengths)[non_empty]
+    seg_max = np.maximum.reduceat(values, seg_starts)
+    candidates = np.where(values == np.repeat(seg_max, lengths[non_empty]), np.arange(len(values)), len(values))
+    res[non_empty] = np.minimum.reduceat(candidates, seg_starts)
+    return res
+
+
+def calc_reference_loss_batch(
+        profile_elevation: np.ndarray, profile_distance: np.ndarray, offsets: np.ndarray,
+        tx_antenna_height, rx_antenna_height, frequency,
+        refractivity=301.0, k_factor=None, deygout_depth: int = 2,
+        out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None) -> \
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    A vectorized reference model: free space loss, earth curvature with an effective earth radius (by refractivity)
+    and multiple knife edge diffraction by the Deygout method, all the profiles are calculated at once.
+
+    The profiles are given in flat buffers, the points of profile i are [offsets[i]:offsets[i+1]]
+    (i.e. ProfileStore or get_profile_buffers).
+    tx_antenna_height, rx_antenna_height [m above mean sea level], frequency [MHz] and refractivity [N-units]
+    may be arrays (one item per profile) or scalars.
+
+    :param k_factor: the effective earth radius factor, overrides refractivity (i.e. 4/3, or np.inf for a flat earth)
+    :param deygout_depth: 1 - only the main edge; 2 - the main edge and an edge on each side of it; and so on
+    :return: (fresnel_clearance, total_loss, free_space_loss, propagation_mode) arrays with an item per profile,
+        propagation_mode is RFModelPropagationMode codes (LOS or DIF)
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    count = len(offsets) - 1
+    elevation = np.asarray(profile_elevation[offsets[0]:offsets[-1]], dtype=np.float64)
+    distance = np.asarray(profile_distance[offsets[0]:offsets[-1]], dtype=np.float64)
+    offsets = offsets - offsets[0]
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    if k_factor is None:
+        k_factor = get_k_factor(refractivity)
+    tx, rx, frequency, k_factor = (np.broadcast_to(np.asarray(v, dtype=np.float64), count)
+                                   for v in (tx_antenna_height, rx_antenna_height, frequency, k_factor))
+    wavelength = speed_of_light / 1e6 / frequency
+
+    # the terrain raised by the earth bulge at each point
+    profile_idx = np.repeat(np.arange(count), offsets[1:] - offsets[:-1])
+    d = distance - distance[starts][profile_idx]
+    path_length = distance[ends] - distance[starts]
+    elevation = elevation + d * (path_length[profile_idx] - d) / (2 * k_factor[profile_idx] * earth_radius)
+
+    if out is None:
+        out = (np.empty(count, dtype=np.float32), np.empty(count, dtype=np.float32),
+               np.empty(count, dtype=np.float32), np.empty(count, dtype=np.uint8))
+    fresnel_clearance, total_loss, fsl, propagation_mode = out
+    fsl[:] = free_space_loss(path_length, frequency)
+    diffraction_loss = np.zeros(count, dtype=np.float64)
+
+    # each Deygout level finds the highest edge (by v) between the end points of each segment
+    seg_profile = np.arange(count)
+    seg_lo, seg_hi = starts, ends
+    seg_y_lo, seg_y_hi = tx, rx
+    for level in range(deygout_depth):
+        interior = np.maximum(seg_hi - seg_lo - 1, 0)
+        seg_count = len(seg_profile)
+        point_seg = np.repeat(np.arange(seg_count), interior)
+        point_idx = np.arange(len(point_seg)) + np.repeat(seg_lo + 1 - (np.cumsum(interior) - interior), interior)
+        d_lo, d_hi = distance[seg_lo][point_seg], distance[seg_hi][point_seg]
+        d1 = np.maximum(distance[point_idx] - d_lo, 1e-3)
+        d2 = np.maximum(d_hi - distance[point_idx], 1e-3)
+        ray = seg_y_lo[point_seg] + (seg_y_hi[point_seg] - seg_y_lo[point_seg]) * d1 / (d1 + d2)
+        v = (elevation[point_idx] - ray) * np.sqrt(2 * (d1 + d2) / (wavelength[seg_profile[point_seg]] * d1 * d2))
+
+        edge = _segment_argmax(v, interior)
+        has_edge = edge >= 0
+        v_max = np.full(seg_count, -np.inf)
+        v_max[has_edge] = v[edge[has_edge]]
+        if level == 0:
+            # v = -sqrt(2) * clearance / first Fresnel zone radius
+            fresnel_clearance[:] = -v_max / math.sqrt(2)
+            propagation_mode[:] = np.where(v_max > 0, RFModelPropagationMode.DIF, RFModelPropagationMode.LOS)
+        np.add.at(diffraction_loss, seg_profile, knife_edge_loss(v_max))
+
+        # split each segment with a significant edge into two sub segments at its edge
+        split = has_edge & (v_max > -0.78)
+        edge_idx = point_idx[edge[split]]
+        edge_height = elevation[edge_idx]
+        seg_profile = np.concatenate([seg_profile[split], seg_profile[split]])
+        seg_lo, seg_hi = np.concatenate([seg_lo[split], edge_idx]), np.concatenate([edge_idx, seg_hi[split]])
+        seg_y_lo = np.concatenate([seg_y_lo[split], edge_height])
+        seg_y_hi = np.concatenate([edge_height, seg_y_hi[split]])
+        if not len(seg_profile):
+            break
+
+    total_loss[:] = fsl + diffraction_loss
+    return out
+
+
+def calc_reference_loss(
+        tx_antenna_height: float, rx_antenna_height: float, frequency: float,
+        num_profile_points: int, profile_elevation, profile_distance,
+        refractivity: float = 301.0, k_factor: Optional[float] = None, deygout_depth: int = 2,
+        extension: bool = False, **kwargs) -> RFModelReturn:
+    """
+    The reference model (see calc_reference_loss_batch) with the calc_loss signature,
+    it may be used in place of calc_tirem_loss. The other TIREM options (i.e. conductivity) are ignored.
+    """
+    fresnel_clearance, total_loss, fsl, propagation_mode = calc_reference_loss_batch(
+        profile_elevation[:num_profile_points], profile_distance[:num_profile_points], [0, num_profile_points],
+        tx_antenna_height, rx_antenna_height, frequency,
+        refractivity=refractivity, k_factor=k_factor, deygout_depth=deygout_depth)
+    return RFModelReturn(float(fresnel_clearance[0]), float(total_loss[0]), float(fsl[0]),
+                         reference_model_version, RFModelPropagationMode(propagation_mode[0]).name)
@@ -0,0 +1,212 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from rfmodel.metrics import metrics
+from rfmodel.model_registry import get_model_name
+from rfmodel.rfmodel_types import RFModelReturn
+
+
+class ResultCacheStats(NamedTuple):
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    memory_count: int
+    disk_count: int
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+
+def _normalize(v: Any) -> Any:
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, Enum):
+        return v.value
+    return v
+
+
+class ResultCache:
+    """
+    A two tier (in memory LRU and optional on disk SQLite) cache of model results.
+
+    The disk tier is stamped with the model version (RFModelReturn.version). The version is given or learned from
+    the first computed result; the disk tier is not used before it is known, and is cleared if it was stamped with a
+    different version. The disk tier is bounded by max_disk_bytes, evicting the least recently used entries.
+    Instances are pickled by their disk tier filename (i.e. for a process pool), the memory tier is not sent.
+    """
+
+    def __init__(self, max_items: int = 100_000, filename: Optional[Union[str, Path]] = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024, version: Optional[str] = None):
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self.filename = None if filename is None else str(filename)
+        self.version = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[bytes, RFModelReturn]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._db = None
+        self._puts = 0
+        if filename is not None:
+            self._db = sqlite3.connect(self.filename, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # the WAL-safe setting: a crash may lose the last commits, but doesn't corrupt the database
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, fresnel_clearance REAL, total_loss REAL, '
+                'free_space_loss REAL, version TEXT, propagation_mode TEXT, atime REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_atime ON results (atime)')
+            self._db.commit()
+        if version is not None:
+            self.set_version(version)
+        metrics.add_collector('result_cache', self)
+
+    def __reduce__(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+            return self.__class__, (self.max_items, self.filename, self.max_disk_bytes, self.version)
+
+    @staticmethod
+    def get_key(model_name: str, num_profile_points: int, profile_elevation, profile_distance, **kwargs) -> bytes:
+        """ a content hash of the profile arrays and all the other model arguments """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(model_name.encode())
+        h.update(np.ascontiguousarray(profile_elevation[:num_profile_points], dtype=np.float32).tobytes())
+        h.update(np.ascontiguousarray(profile_distance[:num_profile_points], dtype=np.float32).tobytes())
+        h.update(repr(sorted((k, _normalize(v)) for k, v in kwargs.items())).encode())
+        return h.digest()
+
+    def set_version(self, version: str):
+        with self._lock:
+            if self.version is not None and self.version != version:
+                self._items.clear()
+            self.version = version
+            if self._db is None:
+                return
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row is None or row[0] != version:
+                self._db.execute('DELETE FROM results')
+                self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,))
+                self._db.commit()
+
+    def get(self, key: bytes) -> Optional[RFModelReturn]:
+        with self._lock:
+            res = self._items.get(key)
+            if res is not None:
+                self._items.move_to_end(key)
+                self.memory_hits += 1
+                return res
+            if self._db is not None and self.version is not None:
+                row = self._db.execute(
+                    'SELECT fresnel_clearance, total_loss, free_space_loss, version, propagation_mode '
+                    'FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE results SET atime = ? WHERE key = ?', (time.time(), key))
+                    res = RFModelReturn(*row)
+                    self._put_memory(key, res)
+                    self.disk_hits += 1
+                    return res
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, res: RFModelReturn):
+        with self._lock:
+            if self.version != res.version:
+                self.set_version(res.version)
+            self._put_memory(key, res)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 (key, *(float(v) for v in res[0:3]), res.version, res.propagation_mode, time.time()))
+                self._puts += 1
+                if self._puts % 1000 == 0:
+                    self.flush()
+
+    def _put_memory(self, key: bytes, res: RFModelReturn):
+        self._items[key] = res
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def flush(self):
+        """ commits the disk tier and evicts its least recently used entries down to max_disk_bytes """
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.commit()
+            page_size = self._db.execute('PRAGMA page_size').fetchone()[0]
+            while True:
+                page_count, free_count = (self._db.execute(f'PRAGMA {pragma}').fetchone()[0]
+                                          for pragma in ('page_count', 'freelist_count'))
+                count = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+                if (page_count - free_count) * page_size <= self.max_disk_bytes or count == 0:
+                    break
+                self._db.execute('DELETE FROM results WHERE key IN '
+                                 '(SELECT key FROM results ORDER BY atime LIMIT ?)', (max(count // 10, 1),))
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self.flush()
+                self._db.close()
+                self._db = None
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> ResultCacheStats:
+        with self._lock:
+            disk_count = 0 if self._db is None else \
+                self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            return ResultCacheStats(self.memory_hits, self.disk_hits, self.misses, len(self._items), disk_count)
+
+
+class CachedCalcLoss:
+    """
+    Wraps a calc_loss callable with a ResultCache, it may be used in place of calc_loss (i.e. in calc_path_loss_lonlat).
+    The extension flag is not part of the key; after a cache hit the next computed profile along a radial is
+    passed to the model as a new profile (extension=False), as the model did not see the skipped ones.
+    This state is kept per thread, as each thread evaluates its own radials.
+    Instances are picklable (for create_process_pool) if calc_loss is, the disk tier is opened again by its filename.
+    """
+
+    def __init__(self, calc_loss: Callable[[Any], RFModelReturn], cache: Optional[ResultCache] = None):
+        self.calc_loss = calc_loss
+        self.cache = ResultCache() if cache is None else cache
+        self.model_name = get_model_name(calc_loss)
+        self._state = threading.local()
+
+    def __reduce__(self):
+        return self.__class__, (self.calc_loss, self.cache)
+
+    def __call__(self, num_profile_points: int, profile_elevation, profile_distance,
+                 extension: Optional[bool] = None, **kwargs) -> RFModelReturn:
+        key = self.cache.get_key(self.model_name, num_profile_points, profile_elevation, profile_distance, **kwargs)
+        res = self.cache.get(key)
+        if res is not None:
+            self._state.extension_broken = True
+            return res
+        if extension is not None:
+            kwargs['extension'] = extension and not getattr(self._state, 'extension_broken', False)
+        res = self.calc_loss(num_profile_points=num_profile_points, profile_elevation=profile_elevation,
+                             profile_distance=profile_distance, **kwargs)
+        self._state.extension_broken = False
+        self.cache.put(key, res)
+        return res
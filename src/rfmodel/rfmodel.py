@@ -1,10 +1,22 @@
-from typing import Any, Callable, Sequence, Dict, Tuple
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor, Executor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Sequence, Dict, NamedTuple, Tuple, Optional, Union
 
 import numpy as np
 
-from osgeo_utils.auxiliary.util import PathOrDS
-from rfmodel.geod.geod_profile import geod_profile
-from rfmodel.rfmodel_types import RFModelReturn
+from rfmodel.metrics import metrics
+from rfmodel.model_registry import calc_batch_with_scalar, get_model_capabilities
+from rfmodel.prescreen import PrescreenClass, PrescreenCriteria, PrescreenStats, fill_prescreened, \
+    prescreen_profiles
+from rfmodel.rfmodel_types import RFModelReturn, RFModelPropagationMode, RFModelResults
+
+if TYPE_CHECKING:
+    # GDAL and pyproj are imported on first use (by geod_profile), so importing this module stays cheap
+    from osgeo_utils.auxiliary.util import PathOrDS
+    from rfmodel.geod.geod_profile import GeodIntermediateMultiReturn
 
 
 def calc_path_loss_lonlat(
@@ -14,22 +26,27 @@ def calc_path_loss_lonlat(
         tx_antenna_height: float, rx_antenna_height: float,
         tx_msl: bool = False, rx_msl: bool = False,
         print_debug: bool = False) -> RFModelReturn:
+    from rfmodel.geod.geod_profile import geod_profile
 
     geod_res, raster_res = geod_profile(filename_or_ds=filename_or_ds, **profile_options)
     npts = geod_res.npts
     dtype = np.float32
-    profile_distance = np.arange(npts, dtype=dtype)
-    profile_distance *= geod_res.del_s
-    profile_elevation = np.array(raster_res[0], dtype=dtype)
+    with metrics.stage('array_conversion', npts):
+        profile_distance = np.arange(npts, dtype=dtype)
+        profile_distance *= geod_res.del_s
+        profile_elevation = np.array(raster_res[0], dtype=dtype)
 
     if not tx_msl:
         tx_antenna_height += profile_elevation[0]
     if not rx_msl:
         rx_antenna_height += profile_elevation[-1]
 
-    res = calc_loss(tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
-                    num_profile_points=npts, profile_elevation=profile_elevation,
-                    profile_distance=profile_distance, **rfmodel_options)
+    with metrics.stage('model'):
+        res = calc_loss(tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+                        num_profile_points=npts, profile_elevation=profile_elevation,
+                        profile_distance=profile_distance, **rfmodel_options)
+    metrics.inc('links')
+    metrics.count_mode(res[4])
 
     if print_debug:
         print(f'Profile options: {profile_options}')
@@ -46,24 +63,344 @@ def get_dict_of_items_from_dict_of_sequences(d: Dict[Any, Sequence], index: int)
     return {k: (v[index % len(v)] if isinstance(v, Sequence) else v) for k, v in d.items()}
 
 
+def get_columns_from_dict_of_sequences(d: Dict[Any, Sequence], count: int) -> Dict[Any, Any]:
+    """ The columnar version of get_dict_of_items_from_dict_of_sequences - sequences are cyclically resized to count """
+    return {k: (np.resize(np.asarray(v), count) if isinstance(v, (Sequence, np.ndarray)) else v) for k, v in d.items()}
+
+
+def get_profile_buffers(geod_res: GeodIntermediateMultiReturn, raster_res: np.ndarray,
+                        dtype=np.float32) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: (profile_elevation, profile_distance) - flat arrays of all the profiles of geod_profile_multi,
+        the distances of each profile start from 0
+    """
+    starts = geod_res.offsets[:-1]
+    link_idx = np.repeat(np.arange(len(geod_res.npts)), geod_res.npts)
+    profile_distance = (np.arange(len(link_idx)) - starts[link_idx]).astype(dtype)
+    profile_distance *= geod_res.del_s.astype(dtype)[link_idx]
+    profile_elevation = np.ascontiguousarray(raster_res[0], dtype=dtype)
+    return profile_elevation, profile_distance
+
+
+def take_profiles(profile_elevation: np.ndarray, profile_distance: np.ndarray, offsets: np.ndarray,
+                  idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ :return: (profile_elevation, profile_distance, offsets) of the profiles idx of the flat buffers """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = (offsets[1:] - offsets[:-1])[idx]
+    new_offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    point_idx = np.arange(new_offsets[-1]) + np.repeat(offsets[:-1][idx] - new_offsets[:-1], lengths)
+    return profile_elevation[point_idx], profile_distance[point_idx], new_offsets
+
+
+def calc_profiles(calc_loss: Callable[[Any], RFModelReturn],
+                  profile_elevation: np.ndarray, profile_distance: np.ndarray, offsets: np.ndarray,
+                  tx_antenna_height, rx_antenna_height,
+                  out: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+                  rfmodel_options: dict, extension=None,
+                  workers: Optional[int] = None, min_chunk_size: int = 64):
+    """
+    Evaluates ragged profiles in flat buffers (the points of profile i are [offsets[i]:offsets[i+1]])
+    by the capabilities of the model (see model_registry):
+    with its batch form if it has one, otherwise with a call per profile;
+    in chunks on a thread pool of workers threads if it is thread safe and releases the GIL.
+
+    :param tx_antenna_height, rx_antenna_height: [m above mean sea level], arrays (one item per profile) or scalars
+    :param rfmodel_options: the values may be arrays (one item per profile) or scalars
+    :param out: (fresnel_clearance, total_loss, free_space_loss, propagation_mode) arrays, see BatchCalcLoss
+    """
+    capabilities = get_model_capabilities(calc_loss)
+    batch = capabilities.batch or partial(calc_batch_with_scalar, calc_loss)
+    if extension is not None and capabilities.batch is not None and not capabilities.extension:
+        extension = None
+    count = len(offsets) - 1
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if not (capabilities.thread_safe and capabilities.releases_gil) or workers <= 1 or count < 2 * min_chunk_size:
+        batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx_antenna_height, out,
+              extension=extension, **rfmodel_options)
+        return
+
+    def calc_chunk(start: int, stop: int):
+        first, last = offsets[start], offsets[stop]
+        chunk_columns = {k: (v[start:stop] if np.ndim(v) else v) for k, v in dict(
+            tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+            extension=extension, **rfmodel_options).items()}
+        batch(profile_elevation[first:last], profile_distance[first:last], offsets[start:stop + 1] - first,
+              out=tuple(o[start:stop] for o in out), **chunk_columns)
+
+    chunk_size = max(min_chunk_size, -(-count // (4 * workers)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(calc_chunk, start, min(start + chunk_size, count))
+                       for start in range(0, count, chunk_size)]:
+            future.result()
+
+
+ResultColumns = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def _calc_path_loss_lonlat_columns(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: PathOrDS,
+        lon1, lat1, lon2, lat2,
+        tx_antenna_height, rx_antenna_height,
+        rfmodel_options: dict,
+        get_out: Callable[[int], ResultColumns],
+        tx_msl=False, rx_msl=False,
+        print_debug: bool = False,
+        workers: Optional[int] = None,
+        prescreen: Optional[PrescreenCriteria] = None,
+        **profile_options) -> Optional[PrescreenStats]:
+    """
+    The engine of calc_path_loss_lonlat_results and calc_path_loss_lonlat_batch,
+    the results are written into the (fresnel_clearance, total_loss, free_space_loss, propagation_mode) columns
+    returned by get_out(count)
+
+    :return: the number of links of each prescreen class (None without prescreen)
+    """
+    from rfmodel.geod.geod_profile import geod_profile_multi
+
+    if prescreen is not None and 'frequency' not in rfmodel_options:
+        raise ValueError('prescreen needs the frequency in rfmodel_options')
+
+    geod_res, raster_res = geod_profile_multi(filename_or_ds, lon1, lat1, lon2, lat2, **profile_options)
+    count = len(geod_res.npts)
+    short = np.flatnonzero(geod_res.npts < 2)
+    if len(short):
+        raise ValueError(f'{len(short)} links have less than 2 profile points, i.e. link {short[0]}')
+    starts, ends = geod_res.offsets[:-1], geod_res.offsets[1:]
+    with metrics.stage('array_conversion', len(raster_res[0])):
+        profile_elevation, profile_distance = get_profile_buffers(geod_res, raster_res)
+
+    tx_antenna_height = np.broadcast_to(tx_antenna_height, count).astype(np.float64)
+    rx_antenna_height = np.broadcast_to(rx_antenna_height, count).astype(np.float64)
+    tx_antenna_height += np.where(tx_msl, 0, profile_elevation[starts])
+    rx_antenna_height += np.where(rx_msl, 0, profile_elevation[ends - 1])
+
+    model_out = get_out(count)
+    rfmodel_columns = get_columns_from_dict_of_sequences(rfmodel_options, count)
+    stats = None
+    if prescreen is None:
+        with metrics.stage('model', count):
+            calc_profiles(calc_loss, profile_elevation, profile_distance, geod_res.offsets,
+                          tx_antenna_height, rx_antenna_height, model_out,
+                          rfmodel_options=rfmodel_columns, workers=workers)
+    else:
+        with metrics.stage('prescreen', count):
+            screen = prescreen_profiles(
+                profile_elevation, profile_distance, geod_res.offsets, tx_antenna_height, rx_antenna_height,
+                rfmodel_columns['frequency'], prescreen, refractivity=rfmodel_columns.get('refractivity', 301.0))
+            fill_prescreened(screen, model_out)
+        stats = screen.stats()
+        metrics.inc('prescreen_skipped', stats.skipped)
+        metrics.inc('prescreen_simple', stats.simple)
+        if print_debug:
+            print(f'Prescreen {prescreen}: {stats}')
+        idx = np.flatnonzero(screen.classes == PrescreenClass.FULL)
+        if len(idx):
+            def take(v):
+                return v[idx] if np.ndim(v) else v
+
+            full_out = RFModelResults.empty(len(idx))
+            with metrics.stage('model', len(idx)):
+                calc_profiles(calc_loss, *take_profiles(profile_elevation, profile_distance, geod_res.offsets, idx),
+                              take(tx_antenna_height), take(rx_antenna_height), full_out.columns,
+                              rfmodel_options={k: take(v) for k, v in rfmodel_columns.items()}, workers=workers)
+            for column, full_column in zip(model_out, full_out.columns):
+                column[idx] = full_column
+    if metrics.enabled:
+        metrics.inc('links', count)
+        for mode, mode_count in enumerate(np.bincount(model_out[3])):
+            if mode_count:
+                metrics.count_mode(RFModelPropagationMode(mode).name, int(mode_count))
+
+    if print_debug:
+        print(f'Profile options: {profile_options}')
+        print(f'RfModel options: {rfmodel_options}')
+        print(geod_res)
+    return stats
+
+
+def calc_path_loss_lonlat_results(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: PathOrDS,
+        lon1, lat1, lon2, lat2,
+        tx_antenna_height, rx_antenna_height,
+        rfmodel_options: dict,
+        tx_msl=False, rx_msl=False,
+        out: Optional[RFModelResults] = None,
+        print_debug: bool = False,
+        workers: Optional[int] = None,
+        prescreen: Optional[PrescreenCriteria] = None,
+        **profile_options) -> RFModelResults:
+    """
+    Calculates the path loss of many links at once.
+    All the geodesics are computed in one pass and the raster is sampled with a single vectorized read,
+    then the model evaluates the flat profile buffers, by the fastest path its capabilities allow (see calc_profiles),
+    writing directly into the columns of the results.
+
+    lon1, lat1, lon2, lat2, tx_antenna_height, rx_antenna_height, tx_msl, rx_msl,
+    the values of rfmodel_options and npts, del_s of profile_options may be arrays (one item per link) or scalars.
+    The version of the results is left as it is (empty for a new RFModelResults),
+    since the batch form of a model doesn't report its version.
+
+    :param workers: the number of threads for thread safe models that release the GIL (default: the cpu count)
+    :param prescreen: if given, the links are first classified in a vectorized pass (see prescreen_profiles),
+        calc_loss is called only for the links that need the full model (see fill_prescreened for the others);
+        the number of links of each class is set on the prescreen_stats of the results
+    """
+    def get_out(count: int) -> ResultColumns:
+        nonlocal out
+        if out is None:
+            out = RFModelResults.empty(count)
+        elif len(out) != count:
+            raise ValueError(f'out should be of length {count}')
+        return out.columns
+
+    prescreen_stats = _calc_path_loss_lonlat_columns(
+        calc_loss, filename_or_ds, lon1, lat1, lon2, lat2, tx_antenna_height, rx_antenna_height, rfmodel_options,
+        get_out, tx_msl=tx_msl, rx_msl=rx_msl, print_debug=print_debug, workers=workers, prescreen=prescreen,
+        **profile_options)
+    out.prescreen_stats = prescreen_stats
+    return out
+
+
+def calc_path_loss_lonlat_batch(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: PathOrDS,
+        lon1, lat1, lon2, lat2,
+        tx_antenna_height, rx_antenna_height,
+        rfmodel_options: dict,
+        tx_msl=False, rx_msl=False,
+        out: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        print_debug: bool = False,
+        workers: Optional[int] = None,
+        prescreen: Optional[PrescreenCriteria] = None,
+        **profile_options) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    calc_path_loss_lonlat_results, in the (a, b) form of calc_path_loss_lonlat_multi.
+    The model writes directly into the rows of a (only the propagation modes take a temporary uint8 array).
+
+    :return: (a, b) - a: float32 array of shape (3, count) of [fresnel_clearance, total_loss, free_space_loss],
+        b: bool array of shape (count,), True for LOS links
+        (with prescreen, calc_path_loss_lonlat_results also reports the number of links of each prescreen class)
+    """
+    a = b = propagation_mode = None
+
+    def get_out(count: int) -> ResultColumns:
+        nonlocal a, b, propagation_mode
+        if out is None:
+            a = np.empty((3, count), dtype=np.float32)
+            b = np.empty(count, dtype=bool)
+        else:
+            a, b = out
+            if a.shape[1:] != (count,) or len(b) != count:
+                raise ValueError(f'out should be of length {count}')
+        propagation_mode = np.empty(count, dtype=np.uint8)
+        return a[0], a[1], a[2], propagation_mode
+
+    _calc_path_loss_lonlat_columns(
+        calc_loss, filename_or_ds, lon1, lat1, lon2, lat2, tx_antenna_height, rx_antenna_height, rfmodel_options,
+        get_out, tx_msl=tx_msl, rx_msl=rx_msl, print_debug=print_debug, workers=workers, prescreen=prescreen,
+        **profile_options)
+    np.equal(propagation_mode, RFModelPropagationMode.LOS, out=b)
+
+    if print_debug:
+        print(a)
+        print(b)
+
+    return a, b
+
+
 def calc_path_loss_lonlat_multi(
         calc_loss: Callable[[Any], RFModelReturn],
         filename_or_ds: PathOrDS,
         count: int, main_options: dict,
         profile_options: dict, rfmodel_options: dict,
+        processes: Optional[int] = None, executor: Optional[Executor] = None,
         **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates count links, the options are cyclically resized to count.
+    With processes > 1 or an executor (see rfmodel.parallel.create_process_pool) the links are distributed over
+    a process pool, if the model is picklable; otherwise calc_path_loss_lonlat_batch picks the fastest path that
+    the model capabilities allow (batch, threads or a call per link).
+    """
+    profile_options = get_columns_from_dict_of_sequences(profile_options, count)
+    lonlat = {k: np.resize(profile_options.pop(k), count) for k in ('lon1', 'lat1', 'lon2', 'lat2')}
+    if (executor is not None or (processes or 0) > 1) and get_model_capabilities(calc_loss).picklable:
+        from rfmodel.parallel import calc_path_loss_lonlat_batch_parallel
+        return calc_path_loss_lonlat_batch_parallel(
+            calc_loss, filename_or_ds,
+            **lonlat,
+            **get_columns_from_dict_of_sequences(main_options, count),
+            rfmodel_options=get_columns_from_dict_of_sequences(rfmodel_options, count),
+            workers=processes, executor=executor,
+            **profile_options, **kwargs)
+    return calc_path_loss_lonlat_batch(
+        calc_loss=calc_loss,
+        filename_or_ds=filename_or_ds,
+        **lonlat,
+        **get_columns_from_dict_of_sequences(main_options, count),
+        rfmodel_options=get_columns_from_dict_of_sequences(rfmodel_options, count),
+        **profile_options, **kwargs)
 
-    a = np.empty((3, count), dtype=np.float32)
-    b = np.empty(count, dtype=bool)
-    for i in range(count):
-        res = calc_path_loss_lonlat(
-            calc_loss=calc_loss,
-            filename_or_ds=filename_or_ds,
-            **get_dict_of_items_from_dict_of_sequences(main_options, i),
-            profile_options=get_dict_of_items_from_dict_of_sequences(profile_options, i),
-            rfmodel_options=get_dict_of_items_from_dict_of_sequences(rfmodel_options, i), **kwargs)
-        a[:, i] = res[0:3]
-        b[i] = res[4] == 'LOS'
 
-    return a, b
+class ProgressiveReturn(NamedTuple):
+    """
+    a, b: as returned by calc_path_loss_lonlat_batch
+    refined: bool array of shape (count,), True for the links that were recalculated at full resolution
+    coarse_total_loss: the total loss of the coarse pass
+    """
+    a: np.ndarray
+    b: np.ndarray
+    refined: np.ndarray
+    coarse_total_loss: np.ndarray
+
+
+def calc_path_loss_lonlat_progressive(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: PathOrDS,
+        lon1, lat1, lon2, lat2,
+        tx_antenna_height, rx_antenna_height,
+        rfmodel_options: dict,
+        threshold: float, margin: float,
+        coarse_del_s: float = 0, coarse_ovr_idx: Optional[Union[int, float, str]] = 'auto',
+        tx_msl=False, rx_msl=False,
+        **profile_options) -> ProgressiveReturn:
+    """
+    Coarse to fine evaluation of a link set against a decision threshold (i.e. the maximal allowed total loss).
+    All the links are calculated on a coarse overview (coarse_ovr_idx, default: the one that matches coarse_del_s),
+    then only the links whose coarse total loss is within margin [dB] of threshold [dB] are recalculated with
+    profile_options (by default: at full resolution).
+
+    :param coarse_del_s: the distance between the profile points of the coarse pass [m]
+        (default: the resolution of the coarse overview, or 4 times the full resolution)
+    """
+    lon1, lat1, lon2, lat2 = (np.atleast_1d(v).ravel() for v in np.broadcast_arrays(lon1, lat1, lon2, lat2))
+    count = len(lon1)
+    columns = dict(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2,
+                   tx_antenna_height=np.broadcast_to(tx_antenna_height, count),
+                   rx_antenna_height=np.broadcast_to(rx_antenna_height, count),
+                   tx_msl=np.broadcast_to(tx_msl, count), rx_msl=np.broadcast_to(rx_msl, count))
+    rfmodel_options = get_columns_from_dict_of_sequences(rfmodel_options, count)
+    if not coarse_del_s and coarse_ovr_idx == 'auto':
+        from rfmodel.geod.geod_profile import get_resolution_meters
+        coarse_del_s = 4 * get_resolution_meters(filename_or_ds)
+    coarse_options = dict(profile_options, ovr_idx=coarse_ovr_idx, del_s=coarse_del_s)
+    coarse_options.pop('npts', None)
+    with metrics.stage('coarse_pass', count):
+        a, b = calc_path_loss_lonlat_batch(calc_loss, filename_or_ds, **columns,
+                                           rfmodel_options=rfmodel_options, **coarse_options)
+    coarse_total_loss = a[1].copy()
+    refined = ~(np.abs(coarse_total_loss - threshold) > margin)  # nan losses are refined too
+    idx = np.flatnonzero(refined)
+    if len(idx):
+        def take(d: dict) -> dict:
+            return {k: (v[idx] if isinstance(v, np.ndarray) and v.shape == (count,) else v) for k, v in d.items()}
 
+        with metrics.stage('fine_pass', len(idx)):
+            a[:, idx], b[idx] = calc_path_loss_lonlat_batch(
+                calc_loss, filename_or_ds, **take(columns), rfmodel_options=take(rfmodel_options),
+                **take(profile_options))
+    metrics.inc('refined_links', len(idx))
+    return ProgressiveReturn(a, b, refined, coarse_total_loss)
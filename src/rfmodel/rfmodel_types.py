@@ -1,7 +1,7 @@
 from enum import IntEnum
-from typing import NamedTuple
+from typing import Iterable, NamedTuple, Sequence, Tuple, Union
 
-from numpy.testing import assert_almost_equal
+import numpy as np
 
 
 class RFModelReturn(NamedTuple):
@@ -19,6 +19,8 @@ class RFModelReturn(NamedTuple):
     propagation_mode: str
 
     def assert_equal(self: 'RFModelReturn', other: 'RFModelReturn', decimal=7):
+        from numpy.testing import assert_almost_equal
+
         assert_almost_equal(self[0:3], other[0:3], decimal=decimal)
         assert self[3:] == other[3:]
 
@@ -26,3 +28,122 @@ class RFModelReturn(NamedTuple):
 class RFModelPolarization(IntEnum):
     H = 0
     V = 1
+
+
+class RFModelPropagationMode(IntEnum):
+    """ propagation mode codes, as used by the columnar APIs (i.e. calc_link_matrix, calc_tirem_loss_batch) """
+    LOS = 0
+    DIF = 1
+    TRO = 2
+    INVL = 3
+    UNKNOWN = 255
+
+    @classmethod
+    def from_str(cls, propagation_mode: str) -> 'RFModelPropagationMode':
+        return cls.__members__.get(propagation_mode, cls.UNKNOWN)
+
+
+class RFModelResults:
+    """
+    Columnar results of many links: the fresnel_clearance, total_loss and free_space_loss float32 columns
+    and the propagation_mode uint8 column of RFModelPropagationMode codes, 16 bytes per link.
+
+    The columns are field views of a single structured array (see to_structured), so they can be passed as the out
+    of the batch APIs (see BatchCalcLoss) and filled in place.
+    Indexing by an int returns an RFModelReturn, by a slice, mask or index array - an RFModelResults.
+    """
+    dtype = np.dtype([('fresnel_clearance', np.float32), ('total_loss', np.float32),
+                      ('free_space_loss', np.float32), ('propagation_mode', np.uint8)], align=True)
+
+    def __init__(self, data: np.ndarray, version: str = ''):
+        if data.dtype != self.dtype:
+            raise ValueError(f'expected dtype {self.dtype}, got {data.dtype}')
+        self.data = data
+        self.version = version
+        # the PrescreenStats of the calculation that filled the results, if it was prescreened
+        self.prescreen_stats = None
+
+    @classmethod
+    def empty(cls, count: int, version: str = '') -> 'RFModelResults':
+        data = np.zeros(count, dtype=cls.dtype)
+        data['propagation_mode'] = RFModelPropagationMode.UNKNOWN
+        return cls(data, version)
+
+    @classmethod
+    def from_columns(cls, fresnel_clearance, total_loss, free_space_loss, propagation_mode,
+                     version: str = '') -> 'RFModelResults':
+        res = cls.empty(len(total_loss), version)
+        res.data['fresnel_clearance'] = fresnel_clearance
+        res.data['total_loss'] = total_loss
+        res.data['free_space_loss'] = free_space_loss
+        res.data['propagation_mode'] = propagation_mode
+        return res
+
+    @classmethod
+    def from_returns(cls, returns: Iterable[RFModelReturn]) -> 'RFModelResults':
+        returns = list(returns)
+        res = cls.empty(len(returns), returns[0].version if returns else '')
+        for i, r in enumerate(returns):
+            res.data[i] = (r.fresnel_clearance, r.total_loss, r.free_space_loss,
+                           RFModelPropagationMode.from_str(r.propagation_mode))
+        return res
+
+    @classmethod
+    def concatenate(cls, results: Sequence['RFModelResults']) -> 'RFModelResults':
+        return cls(np.concatenate([r.data for r in results]) if results else np.zeros(0, dtype=cls.dtype),
+                   results[0].version if results else '')
+
+    @property
+    def fresnel_clearance(self) -> np.ndarray:
+        return self.data['fresnel_clearance']
+
+    @property
+    def total_loss(self) -> np.ndarray:
+        return self.data['total_loss']
+
+    @property
+    def free_space_loss(self) -> np.ndarray:
+        return self.data['free_space_loss']
+
+    @property
+    def propagation_mode(self) -> np.ndarray:
+        return self.data['propagation_mode']
+
+    @property
+    def los(self) -> np.ndarray:
+        return self.propagation_mode == RFModelPropagationMode.LOS
+
+    @property
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ the out of the batch APIs (see BatchCalcLoss) """
+        return self.fresnel_clearance, self.total_loss, self.free_space_loss, self.propagation_mode
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, item) -> Union[RFModelReturn, 'RFModelResults']:
+        if isinstance(item, (int, np.integer)):
+            fresnel_clearance, total_loss, free_space_loss, propagation_mode = self.data[item].tolist()
+            return RFModelReturn(fresnel_clearance, total_loss, free_space_loss, self.version,
+                                 RFModelPropagationMode(propagation_mode).name)
+        return RFModelResults(self.data[item], self.version)
+
+    def __repr__(self) -> str:
+        return f'RFModelResults(count={len(self)}, version={self.version!r})'
+
+    def to_structured(self) -> np.ndarray:
+        """ :return: the underlying structured array (a view, not a copy) """
+        return self.data
+
+    def to_ab(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ :return: (a, b) as returned by calc_path_loss_lonlat_batch """
+        return np.stack([self.fresnel_clearance, self.total_loss, self.free_space_loss]), self.los
+
+    def save(self, filename) -> None:
+        """ saves the results to a .npz file, column by column """
+        np.savez(filename, version=self.version, **{name: self.data[name] for name in self.dtype.names})
+
+    @classmethod
+    def load(cls, filename) -> 'RFModelResults':
+        with np.load(filename, allow_pickle=False) as f:
+            return cls.from_columns(*(f[name] for name in cls.dtype.names), version=str(f['version']))
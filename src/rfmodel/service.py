@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, List, NamedTuple, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.rfmodel import calc_path_loss_lonlat_results
+from rfmodel.rfmodel_types import RFModelReturn, RFModelPropagationMode
+
+if TYPE_CHECKING:
+    from osgeo_utils.auxiliary.util import PathOrDS
+
+link_keys = ('lon1', 'lat1', 'lon2', 'lat2', 'tx_antenna_height', 'rx_antenna_height')
+http_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class PathLossServiceStats(NamedTuple):
+    requests: int
+    batches: int
+    rejected: int
+    queued: int
+    max_batch: int
+
+
+class PathLossService:
+    """
+    Calculates point to point path loss requests in micro-batches.
+
+    Concurrent requests are queued and gathered into a batch until max_batch_size requests are waiting or
+    max_latency seconds passed since the first one; each batch is calculated with a single
+    calc_path_loss_lonlat_results call (on a single worker thread, so the event loop stays responsive)
+    and the results are fanned out back to the requests; if a batch fails, its requests are calculated one by one,
+    so a bad request fails only itself.
+    The DEM is opened once. When max_queue_size requests are already waiting, new requests are rejected,
+    as are request bodies larger than max_body_size bytes.
+
+    A request is a dict of lon1, lat1, lon2, lat2, tx_antenna_height, rx_antenna_height,
+    optional tx_msl, rx_msl and optional values that override the default rfmodel_options.
+    """
+
+    def __init__(self, calc_loss: Callable[[Any], RFModelReturn], filename_or_ds: Union[PathOrDS, DEMSource],
+                 rfmodel_options: dict, max_batch_size: int = 256, max_latency: float = 0.005,
+                 max_queue_size: int = 4096, max_body_size: int = 64 * 1024, **profile_options):
+        self.calc_loss = calc_loss
+        if isinstance(filename_or_ds, DEMSource):
+            self.dem = filename_or_ds
+        else:
+            from rfmodel.dem.block_cache import block_cache
+            self.dem = block_cache.open_ds(filename_or_ds)
+        self.rfmodel_options = rfmodel_options
+        self.profile_options = profile_options
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_queue_size = max_queue_size
+        self.max_body_size = max_body_size
+        self.requests = 0
+        self.batches = 0
+        self.rejected = 0
+        self.max_batch = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self._fallback_tasks: Set[asyncio.Task] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def calc_batch(self, links: List[dict]) -> List[dict]:
+        """ calculates the given requests in a single batch call """
+        columns = {k: np.array([link[k] for link in links], dtype=np.float64) for k in link_keys}
+        rfmodel_options = {k: [link.get(k, v) for link in links] for k, v in self.rfmodel_options.items()}
+        res = calc_path_loss_lonlat_results(
+            self.calc_loss, self.dem, **columns, rfmodel_options=rfmodel_options,
+            tx_msl=np.array([bool(link.get('tx_msl', False)) for link in links]),
+            rx_msl=np.array([bool(link.get('rx_msl', False)) for link in links]),
+            **self.profile_options)
+        return [dict(fresnel_clearance=fresnel_clearance, total_loss=total_loss, free_space_loss=free_space_loss,
+                     los=propagation_mode == RFModelPropagationMode.LOS,
+                     propagation_mode=RFModelPropagationMode(propagation_mode).name)
+                for fresnel_clearance, total_loss, free_space_loss, propagation_mode in res.data.tolist()]
+
+    def start_batching(self):
+        if self._batch_task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._batch_task = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def stop_batching(self):
+        if self._batch_task is not None:
+            tasks = [self._batch_task, *self._fallback_tasks]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._batch_task = None
+            self._fallback_tasks.clear()
+            # the worker thread exits after its current batch, without blocking the event loop
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, link: dict) -> dict:
+        """ queues a request and waits for its result, raises asyncio.QueueFull if the queue is full """
+        self.start_batching()
+        # validate here, so a bad request doesn't fail the whole batch
+        link = dict(link, **{k: float(link[k]) for k in link_keys})
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((link, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.requests += 1
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(batch))
+            links = [link for link, _future in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.calc_batch, links)
+            except Exception as e:
+                if len(batch) == 1:
+                    _link, future = batch[0]
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                # the bad requests are found in a task of its own, so the next batches aren't held back
+                task = loop.create_task(self._calc_links(batch))
+                self._fallback_tasks.add(task)
+                task.add_done_callback(self._fallback_tasks.discard)
+            else:
+                for (_link, future), res in zip(batch, results):
+                    if not future.done():
+                        future.set_result(res)
+
+    async def _calc_links(self, batch: List[Tuple[dict, asyncio.Future]]):
+        """ calculates each request of a failed batch on its own, so only the bad requests fail """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(loop.run_in_executor(self._executor, self.calc_batch, [link])
+                                         for link, _future in batch), return_exceptions=True)
+        for (_link, future), res in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(res, BaseException):
+                future.set_exception(res)
+            else:
+                future.set_result(res[0])
+
+    def stats(self) -> PathLossServiceStats:
+        return PathLossServiceStats(self.requests, self.batches, self.rejected,
+                                    0 if self._queue is None else self._queue.qsize(), self.max_batch)
+
+    async def handle_request(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        """ :return: (status, json response) """
+        if path == '/stats':
+            return 200, self.stats()._asdict()
+        if path != '/loss':
+            return 404, dict(error=f'unknown path: {path}')
+        if method != 'POST':
+            return 405, dict(error='use POST')
+        try:
+            link = json.loads(body)
+            return 200, await self.submit(link)
+        except asyncio.QueueFull:
+            return 503, dict(error='the request queue is full')
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, dict(error=f'bad request: {e!r}')
+        except Exception as e:
+            return 500, dict(error=repr(e))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ a minimal HTTP/1.1 server, with keep-alive """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _version = request_line.decode('latin-1').split(maxsplit=2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                content_length = int(headers.get('content-length', 0))
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if not 0 <= content_length <= self.max_body_size:
+                    # the body isn't read, so the connection can't be reused
+                    status, response = 413, dict(error=f'the request body is over {self.max_body_size} bytes')
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(content_length)
+                    status, response = await self.handle_request(method, path, body)
+                data = json.dumps(response).encode()
+                response_headers = [f'HTTP/1.1 {status} {http_reasons[status]}',
+                                    'Content-Type: application/json',
+                                    f'Content-Length: {len(data)}',
+                                    f'Connection: {"keep-alive" if keep_alive else "close"}']
+                if status == 503:
+                    response_headers.append('Retry-After: 1')
+                writer.write(('\r\n'.join(response_headers) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        """ starts serving on host:port (port 0 picks a free port, see server.sockets[0].getsockname()) """
+        self.start_batching()
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8080):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def load_function(spec: str) -> Callable:
+    """ loads a function by a 'module:function' spec """
+    module_name, _, function_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='RFModel path loss service')
+    parser.add_argument('dem', help='DEM filename')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--model', default='tirem.tirem3:calc_tirem_loss', help='module:function')
+    parser.add_argument('--activation-key', default=None)
+    parser.add_argument('--set-activation-key', default='tirem.tirem3:tirem_set_activation_key',
+                        help='module:function')
+    parser.add_argument('--options', default='{}', help='rfmodel options (json)')
+    parser.add_argument('--del-s', type=float, default=0, help='profile distance increment [m]')
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-latency', type=float, default=0.005, help='[s]')
+    parser.add_argument('--max-queue-size', type=int, default=4096)
+    parser.add_argument('--max-body-size', type=int, default=64 * 1024, help='[bytes]')
+    args = parser.parse_args(argv)
+
+    if args.activation_key is not None:
+        load_function(args.set_activation_key)(args.activation_key)
+    service = PathLossService(
+        load_function(args.model), args.dem, rfmodel_options=json.loads(args.options),
+        max_batch_size=args.max_batch_size, max_latency=args.max_latency, max_queue_size=args.max_queue_size,
+        max_body_size=args.max_body_size,
+        del_s=args.del_s)
+    print(f'serving on http://{args.host}:{args.port}')
+    asyncio.run(service.serve_forever(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+from itertools import product
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.metrics import metrics
+from rfmodel.rfmodel import calc_profiles
+from rfmodel.rfmodel_types import RFModelResults, RFModelReturn
+
+if TYPE_CHECKING:
+    from osgeo_utils.auxiliary.util import PathOrDS
+
+
+class SweepReturn(NamedTuple):
+    """
+    dims: the names of the swept parameters, in the order of the axes of results ('case' for a list of cases)
+    coords: the values of each swept parameter (for 'case', the list of the cases)
+    results: a structured array of RFModelResults.dtype, of shape (len(coords[dim]) for dim in dims)
+    """
+    dims: Tuple[str, ...]
+    coords: Dict[str, Sequence]
+    results: np.ndarray
+
+    @property
+    def total_loss(self) -> np.ndarray:
+        return self.results['total_loss']
+
+    def sel(self, **labels) -> np.ndarray:
+        """ :return: the results at the given coordinate values, i.e. sel(frequency=900.0, tx_antenna_height=30) """
+        idx = tuple(list(self.coords[dim]).index(labels[dim]) if dim in labels else slice(None) for dim in self.dims)
+        return self.results[idx]
+
+    def to_results(self) -> RFModelResults:
+        """ :return: the flat results, in the order of the Cartesian product of coords (or of the cases) """
+        return RFModelResults(self.results.ravel())
+
+
+def calc_path_loss_sweep(
+        calc_loss: Callable[[Any], RFModelReturn],
+        filename_or_ds: Union['PathOrDS', DEMSource],
+        profile_options: dict, rfmodel_options: dict,
+        tx_antenna_height: float, rx_antenna_height: float,
+        tx_msl: bool = False, rx_msl: bool = False,
+        sweep: Optional[Dict[str, Sequence]] = None,
+        cases: Optional[Sequence[dict]] = None,
+        chunk_size: int = 256,
+        workers: Optional[int] = None) -> SweepReturn:
+    """
+    Evaluates a single Tx->Rx path under many parameter combinations, the profile is extracted only once.
+
+    Either sweep - the values of each swept parameter, whose Cartesian product is evaluated, i.e.
+    dict(frequency=[450, 900, 1800], polarization=[RFModelPolarization.H, RFModelPolarization.V],
+    tx_antenna_height=[10, 20, 30]);
+    or cases - an explicit list of dicts of parameters.
+    The parameters may be any of the rfmodel_options (frequency, polarization, refractivity, conductivity,
+    permittivity, humidity, ...) and tx_antenna_height, rx_antenna_height, tx_msl, rx_msl;
+    the other parameters take their values from the arguments.
+    polarization takes RFModelPolarization values (the batch models take it as uint8, not as 'H'/'V').
+    The heights above the ground are converted with the elevations at the ends of the kept profile,
+    so changing tx_msl/rx_msl doesn't read the DEM.
+
+    The combinations are evaluated in chunks of chunk_size, by the fastest path the model allows (see calc_profiles).
+    """
+    from rfmodel.geod.geod_profile import geod_profile
+
+    if (sweep is None) == (cases is None):
+        raise ValueError('either sweep or cases should be given')
+    if sweep is not None:
+        dims = tuple(sweep)
+        coords = {dim: list(values) for dim, values in sweep.items()}
+        shape = tuple(len(values) for values in coords.values())
+        combinations = [dict(zip(dims, values)) for values in product(*coords.values())]
+    else:
+        dims = ('case',)
+        coords = dict(case=list(cases))
+        shape = (len(cases),)
+        combinations = coords['case']
+
+    geod_res, raster_res = geod_profile(filename_or_ds=filename_or_ds, **profile_options)
+    npts = geod_res.npts
+    profile_distance = np.arange(npts, dtype=np.float32)
+    profile_distance *= geod_res.del_s
+    profile_elevation = np.array(raster_res[0], dtype=np.float32)
+
+    defaults = dict(rfmodel_options, tx_antenna_height=tx_antenna_height, rx_antenna_height=rx_antenna_height,
+                    tx_msl=tx_msl, rx_msl=rx_msl)
+    unknown = {k for combination in combinations for k in combination} - set(defaults)
+    if unknown:
+        raise ValueError(f'unknown sweep parameters: {sorted(unknown)}')
+    results = RFModelResults.empty(len(combinations))
+    for start in range(0, len(combinations), chunk_size):
+        chunk = combinations[start:start + chunk_size]
+        count = len(chunk)
+        columns = {k: np.array([c.get(k, v) for c in chunk]) if any(k in c for c in chunk) else v
+                   for k, v in defaults.items()}
+        tx = np.broadcast_to(columns.pop('tx_antenna_height'), count).astype(np.float64)
+        rx = np.broadcast_to(columns.pop('rx_antenna_height'), count).astype(np.float64)
+        tx += np.where(columns.pop('tx_msl'), 0, profile_elevation[0])
+        rx += np.where(columns.pop('rx_msl'), 0, profile_elevation[-1])
+        # the same profile for all the combinations of the chunk
+        offsets = np.arange(count + 1, dtype=np.int64) * npts
+        with metrics.stage('model', count):
+            calc_profiles(calc_loss, np.tile(profile_elevation, count), np.tile(profile_distance, count), offsets,
+                          tx, rx, results[start:start + count].columns, rfmodel_options=columns, workers=workers)
+    metrics.inc('links', len(combinations))
+    return SweepReturn(dims, coords, results.data.reshape(shape))
@@ -1,6 +1,10 @@
 #pragma once
 
+#ifdef _WIN32
 #define TIREM3_EXPORT __declspec(dllimport)
+#else
+#define TIREM3_EXPORT
+#endif
 
 TIREM3_EXPORT
 void CalcTiremLoss(float tx_antenna_height, float rx_antenna_height, float frequency,
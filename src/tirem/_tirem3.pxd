@@ -5,4 +5,4 @@ cdef extern from "_tirem3.h":
                        float refractivity, float conductivity, float permittivity, float humidity,
                        const char *polarization, char *version, char *propagation_mode,
                        float *fresnel_clearance, float *total_loss, float *free_space_loss,
-                       const char *activation_key);
+                       const char *activation_key) nogil
@@ -0,0 +1,49 @@
+/*
+ * A stand-in for the licensed TIREM library, implementing the CalcTiremLoss signature of _tirem3.h.
+ * It is meant only for building and testing the Python API (i.e. on Linux), its results are NOT TIREM's:
+ * free space loss plus a single knife-edge diffraction loss over the highest obstacle.
+ */
+#include <math.h>
+#include <string.h>
+
+#include "../_tirem3.h"
+
+void CalcTiremLoss(float tx_antenna_height, float rx_antenna_height, float frequency,
+                   int num_profile_points, const float * profile_elevation, const float * profile_distance, int extension,
+                   float refractivity, float conductivity, float permittivity, float humidity,
+                   const char * polarization, char * version, char * propagation_mode,
+                   float * fresnel_clearance, float * total_loss, float * free_space_loss,
+                   const char * activation_key)
+{
+    int i;
+    double d, wavelength, nu, max_nu = -INFINITY, min_ratio = INFINITY;
+    double fsl, diffraction = 0;
+
+    strcpy(version, "STUB-1.0");
+    if (num_profile_points < 2) {
+        strcpy(propagation_mode, "INVL");
+        *fresnel_clearance = *total_loss = *free_space_loss = 0;
+        return;
+    }
+    d = profile_distance[num_profile_points - 1] - profile_distance[0];
+    wavelength = 299.792458 / frequency;
+    fsl = 32.45 + 20 * log10(frequency) + 20 * log10(d / 1000);
+    for (i = 1; i < num_profile_points - 1; i++) {
+        double d1 = profile_distance[i] - profile_distance[0];
+        double d2 = d - d1;
+        double los = tx_antenna_height + (rx_antenna_height - tx_antenna_height) * d1 / d;
+        double r1 = sqrt(wavelength * d1 * d2 / d);
+        double h = profile_elevation[i] - los;
+        nu = h * sqrt(2 * d / (wavelength * d1 * d2));
+        if (nu > max_nu)
+            max_nu = nu;
+        if (-h / r1 < min_ratio)
+            min_ratio = -h / r1;
+    }
+    if (max_nu > -0.78)
+        diffraction = 6.9 + 20 * log10(sqrt((max_nu - 0.1) * (max_nu - 0.1) + 1) + max_nu - 0.1);
+    *free_space_loss = (float)fsl;
+    *total_loss = (float)(fsl + diffraction);
+    *fresnel_clearance = (float)(min_ratio > 0 && isfinite(min_ratio) ? min_ratio : 0);
+    strcpy(propagation_mode, max_nu > 0 ? "DIF " : "LOS ");
+}
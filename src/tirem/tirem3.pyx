@@ -3,6 +3,7 @@ from typing import NamedTuple
 
 include "base.pxi"
 from libc.string cimport memset
+from libc.stdint cimport int64_t
 from tirem cimport _tirem3  # Import the pxd "header"
 cimport cython
 
@@ -92,3 +93,96 @@ def calc_tirem_loss(
     )
     return _TiremReturn(fresnel_clearance, total_loss, free_space_loss,
                         version.decode().strip(), propagation_mode.decode().strip())
+
+
+# propagation mode codes of calc_tirem_loss_batch (the codes of rfmodel's RFModelPropagationMode)
+cdef enum:
+    _MODE_LOS = 0
+    _MODE_DIF = 1
+    _MODE_TRO = 2
+    _MODE_INVL = 3
+    _MODE_UNKNOWN = 255
+
+MODE_LOS = _MODE_LOS
+MODE_DIF = _MODE_DIF
+MODE_TRO = _MODE_TRO
+MODE_INVL = _MODE_INVL
+MODE_UNKNOWN = _MODE_UNKNOWN
+
+cdef inline unsigned char _mode_code(const char *mode) nogil:
+    if mode[0] == b'L' and mode[1] == b'O' and mode[2] == b'S':
+        return _MODE_LOS
+    if mode[0] == b'D' and mode[1] == b'I' and mode[2] == b'F':
+        return _MODE_DIF
+    if mode[0] == b'T' and mode[1] == b'R' and mode[2] == b'O':
+        return _MODE_TRO
+    if mode[0] == b'I' and mode[1] == b'N' and mode[2] == b'V':
+        return _MODE_INVL
+    return _MODE_UNKNOWN
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def calc_tirem_loss_batch(
+        const float[::1] profile_elevation, const float[::1] profile_distance, const int64_t[::1] offsets,
+        const float[::1] tx_antenna_height, const float[::1] rx_antenna_height, const float[::1] frequency,
+        const float[::1] refractivity, const float[::1] conductivity, const float[::1] permittivity,
+        const float[::1] humidity, const unsigned char[::1] polarization,
+        float[::1] fresnel_clearance, float[::1] total_loss, float[::1] free_space_loss,
+        unsigned char[::1] propagation_mode,
+        const unsigned char[::1] extension = None,
+    ):
+    """
+    Calculates many links in a single call, looping over CalcTiremLoss without the GIL.
+
+    The profiles are ragged: the points of link i are [offsets[i]:offsets[i+1]] of the flat
+    profile_elevation and profile_distance (float32) buffers.
+    All the other arrays are contiguous, of length count = len(offsets) - 1 (see calc_tirem_loss for the units):
+    float32 parameters, uint8 polarization (0 - Horizontal, 1 - Vertical) and optional uint8 extension flags.
+    The results are written into the caller supplied fresnel_clearance, total_loss, free_space_loss (float32)
+    and propagation_mode (uint8, MODE_LOS, MODE_DIF, MODE_TRO, MODE_INVL or MODE_UNKNOWN) arrays.
+    """
+    cdef Py_ssize_t count = offsets.shape[0] - 1
+    cdef Py_ssize_t i
+    cdef int64_t start, end
+    cdef char[5] _polarization
+    cdef char[9] version
+    cdef char[5] mode
+    cdef bint _extension = False
+    cdef bint has_extension = extension is not None
+
+    if count < 0:
+        raise ValueError('offsets should have at least one item')
+    if offsets[0] < 0:
+        raise ValueError('offsets should not be negative')
+    for i in range(count):
+        if offsets[i + 1] < offsets[i]:
+            raise ValueError(f'offsets should be non-decreasing, offsets[{i + 1}] < offsets[{i}]')
+    if offsets[count] > profile_elevation.shape[0] or offsets[count] > profile_distance.shape[0]:
+        raise ValueError('offsets exceed the profile buffers')
+    lengths = [tx_antenna_height.shape[0], rx_antenna_height.shape[0], frequency.shape[0],
+               refractivity.shape[0], conductivity.shape[0], permittivity.shape[0], humidity.shape[0],
+               polarization.shape[0], fresnel_clearance.shape[0], total_loss.shape[0], free_space_loss.shape[0],
+               propagation_mode.shape[0]]
+    if has_extension:
+        lengths.append(extension.shape[0])
+    if min(lengths) < count:
+        raise ValueError(f'all the per link arrays should be of length {count}')
+
+    _polarization[1] = 0
+    with nogil:
+        for i in range(count):
+            start = offsets[i]
+            end = offsets[i + 1]
+            _polarization[0] = b'V' if polarization[i] else b'H'
+            if has_extension:
+                _extension = extension[i]
+            _tirem3.CalcTiremLoss(
+                tx_antenna_height[i], rx_antenna_height[i], frequency[i],
+                <int>(end - start), &profile_elevation[start], &profile_distance[start],
+                _extension,
+                refractivity[i], conductivity[i], permittivity[i], humidity[i],
+                _polarization, version, mode,
+                &fresnel_clearance[i], &total_loss[i], &free_space_loss[i],
+                _activation,
+            )
+            propagation_mode[i] = _mode_code(mode)
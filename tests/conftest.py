@@ -0,0 +1,39 @@
+import math
+
+import numpy as np
+import pytest
+
+from rfmodel.dem.mmap_dem import MMapDEM
+from rfmodel.rfmodel_types import RFModelReturn
+
+synthetic_geotransform = (34.0, 0.01, 0.0, 33.0, 0.0, -0.01)
+
+
+def stand_in_loss(tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                  profile_elevation, profile_distance, **kwargs) -> RFModelReturn:
+    """ a cheap picklable model: the free space loss plus a penalty for the highest obstruction """
+    d = max(float(profile_distance[num_profile_points - 1]), 1.0)
+    free_space_loss = 20 * math.log10(d / 1000) + 20 * math.log10(frequency) + 32.45
+    obstruction = float(np.max(profile_elevation[:num_profile_points])) - min(tx_antenna_height, rx_antenna_height)
+    total_loss = free_space_loss + max(obstruction, 0) / 10
+    return RFModelReturn(0.0, total_loss, free_space_loss, 'STANDIN', 'LOS' if obstruction <= 0 else 'DIF')
+
+
+class CountingDEM(MMapDEM):
+    sampled_points = 0
+
+    def sample(self, x, y, **kwargs):
+        CountingDEM.sampled_points += np.size(x)
+        return super().sample(x, y, **kwargs)
+
+
+def create_synthetic_dem(filename, dem_class=MMapDEM, shape=(200, 200), max_elevation=500, seed=0):
+    """ a random terrain of the given shape with its top left corner at (34, 33) and 0.01 degree pixels """
+    rng = np.random.default_rng(seed)
+    array = rng.uniform(0, max_elevation, shape).astype(np.float32)
+    return dem_class.from_array(filename, array, geotransform=synthetic_geotransform)
+
+
+@pytest.fixture
+def synthetic_dem(tmp_path):
+    return create_synthetic_dem(tmp_path / 'dem.raw')
@@ -0,0 +1,62 @@
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.dem.block_cache import BlockCache, get_ds_key
+from rfmodel.dem.sample import sample_raster
+
+
+def test_block_cache():
+    filename = 'data/srtm_30k_global.tif'
+    x = np.array([-71.11666667, -83.34059574, -96.62663201, -110.34290056, -123.68333333])
+    y = np.array([42.25, 45.35040408, 47.01585593, 47.07341669, 45.51666667])
+    exp_alts = np.array([56, 181, 278, 1767, 495])
+
+    cache = BlockCache()
+    alts = sample_raster(filename, x=x, y=y, cache=cache)
+    assert_almost_equal(alts[0], exp_alts)
+    stats = cache.stats()
+    assert stats.hits == 0
+    assert stats.misses > 0
+    assert stats.nbytes > 0
+
+    alts = sample_raster(filename, x=x, y=y, cache=cache)
+    assert_almost_equal(alts[0], exp_alts)
+    assert cache.stats().misses == stats.misses
+    assert cache.stats().hits == stats.misses
+
+    alts = sample_raster(filename, x=x, y=y, cache=None)
+    assert_almost_equal(alts[0], exp_alts)
+
+    cache.set_max_bytes(0)
+    stats = cache.stats()
+    assert stats.count == stats.nbytes == 0
+    assert stats.evictions > 0
+
+
+def test_block_cache_datasets():
+    filenames = ['data/srtm_30k_global.tif', 'data/srtm_lowres.tif']
+    cache = BlockCache(max_datasets=1)
+    ds = cache.open_ds(filenames[0])
+    assert cache.open_ds(filenames[0]) is ds
+    cache.open_ds(filenames[1])
+    assert cache.open_ds(filenames[0]) is not ds
+
+    # invalidating a dataset closes its cached handle, so the modified file is read again
+    ds = cache.open_ds(filenames[0])
+    cache.invalidate(get_ds_key(ds))
+    assert cache.open_ds(filenames[0]) is not ds
+
+
+class InMemoryDataset:
+    def GetDescription(self):
+        return ''
+
+
+def test_ds_key():
+    ds1, ds2 = InMemoryDataset(), InMemoryDataset()
+    key1 = get_ds_key(ds1)
+    assert get_ds_key(ds1) == key1
+    assert get_ds_key(ds2) != key1
+    del ds1
+    # a new dataset doesn't get the key of a collected one, even at the same address
+    assert all(get_ds_key(InMemoryDataset()) != key1 for _ in range(10))
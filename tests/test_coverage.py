@@ -0,0 +1,149 @@
+import json
+import math
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.coverage import IncrementalCoverage, calc_coverage_radial, calc_coverage_radial_blocks, coverage_grid, \
+    radial_profiles, write_coverage_blocks
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel_types import RFModelReturn
+
+from conftest import CountingDEM
+
+
+def free_space_loss(tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                    profile_elevation, profile_distance, extension=False, **kwargs) -> RFModelReturn:
+    d = float(profile_distance[num_profile_points - 1])
+    loss = 20 * math.log10(d / 1000) + 20 * math.log10(frequency) + 32.45
+    return RFModelReturn(0.0, loss, loss, 'FSL', 'LOS')
+
+
+def test_coverage_radial():
+    filename = 'data/srtm_30k_global.tif'
+    lon, lat = 35.0, 32.0
+    radius = 300_000
+    del_s = 30_000
+
+    extensions = []
+
+    def calc_loss(extension, **kwargs):
+        extensions.append(extension)
+        return free_space_loss(extension=extension, **kwargs)
+
+    res = calc_coverage_radial(
+        calc_loss, filename, lon=lon, lat=lat, radius=radius,
+        tx_antenna_height=10, rx_antenna_height=2, rfmodel_options=dict(frequency=1000.0),
+        num_radials=36, del_s=del_s)
+
+    steps = int(radius // del_s) + 1
+    calls_per_radial = steps - 3 + 1
+    assert len(extensions) == 36 * calls_per_radial
+    for i in range(0, len(extensions), calls_per_radial):
+        assert extensions[i] is False
+        assert all(extensions[i + 1:i + calls_per_radial])
+
+    geotransform, shape = coverage_grid(lon, lat, radius, del_s / 111_111)
+    assert res.geotransform == geotransform
+    assert res.loss.shape == shape
+    assert np.isnan(res.loss[0, 0])
+    # the loss grows with the distance from the transmitter
+    row = res.loss[shape[0] // 2]
+    center = shape[1] // 2
+    valid = row[center:][~np.isnan(row[center:])]
+    assert len(valid) > 3
+    assert np.all(np.diff(valid) >= 0)
+
+
+def test_incremental_coverage(tmp_path):
+    rng = np.random.default_rng(0)
+    terrain = rng.uniform(0, 300, (400, 400)).astype(np.float32)
+    geotransform = (34.0, 0.005, 0.0, 33.0, 0.0, -0.005)
+    dem = CountingDEM.from_array(tmp_path / 'dem.raw', terrain, geotransform)
+    options = dict(lon=35.0, lat=32.0, radius=50_000, rfmodel_options=dict(frequency=1000.0),
+                   num_radials=72, del_s=1000)
+
+    def expected_loss(**kwargs):
+        return calc_coverage_radial(calc_reference_loss, dem, **dict(options, **kwargs)).loss
+
+    calls = []
+
+    def calc_loss(**kwargs):
+        calls.append(kwargs['num_profile_points'])
+        return calc_reference_loss(**kwargs)
+
+    cov = IncrementalCoverage(calc_loss, dem, tx_antenna_height=30, rx_antenna_height=2, **options)
+    assert_almost_equal(cov.loss, expected_loss(tx_antenna_height=30, rx_antenna_height=2), decimal=4)
+
+    # a height change reuses the profiles and doesn't read the DEM
+    CountingDEM.sampled_points = 0
+    assert len(cov.update(tx_antenna_height=50)) == 72
+    assert len(cov.update(tx_antenna_height=50)) == 0
+    assert CountingDEM.sampled_points == 0
+    assert_almost_equal(cov.loss, expected_loss(tx_antenna_height=50, rx_antenna_height=2), decimal=4)
+
+    # a "new building" north east of the transmitter
+    data = np.memmap(tmp_path / 'dem.raw', dtype=np.float32, mode='r+', shape=(400, 400))
+    data[185:188, 215:218] = 800
+    data.flush()
+    calls.clear()
+    radials = cov.update_dem(35.075, 32.06, 35.09, 32.075)
+    assert 0 < len(radials) < 72
+    assert len(calls) == len(radials) * (51 - 3 + 1)
+    assert_almost_equal(cov.loss, expected_loss(tx_antenna_height=50, rx_antenna_height=2), decimal=4)
+
+
+def test_incremental_coverage_geotiff(tmp_path):
+    from osgeo import gdal
+
+    rng = np.random.default_rng(0)
+    terrain = rng.uniform(0, 300, (400, 400)).astype(np.float32)
+    filename = str(tmp_path / 'dem.tif')
+    ds = gdal.GetDriverByName('GTiff').Create(filename, 400, 400, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform((34.0, 0.005, 0.0, 33.0, 0.0, -0.005))
+    ds.SetProjection('EPSG:4326')
+    ds.GetRasterBand(1).WriteArray(terrain)
+    ds = None
+    options = dict(lon=35.0, lat=32.0, radius=50_000, tx_antenna_height=30, rx_antenna_height=2,
+                   rfmodel_options=dict(frequency=1000.0), num_radials=72, del_s=1000)
+    cov = IncrementalCoverage(calc_reference_loss, filename, **options)
+
+    # a tile patched on disk, while its handle and blocks are cached
+    ds = gdal.Open(filename, gdal.GA_Update)
+    ds.GetRasterBand(1).WriteArray(np.full((3, 3), 800, dtype=np.float32), 215, 185)
+    ds = None
+    radials = cov.update_dem(35.075, 32.06, 35.09, 32.075)
+    assert 0 < len(radials) < 72
+    assert cov.profiles.elevation.max() == 800
+    assert_almost_equal(cov.loss, calc_coverage_radial(calc_reference_loss, filename, **options).loss, decimal=4)
+
+
+def test_coverage_blocks(tmp_path):
+    from osgeo import gdal
+    filename = 'data/srtm_30k_global.tif'
+    out_filename = str(tmp_path / 'coverage.tif')
+    options = dict(lon=35.0, lat=32.0, radius=300_000, tx_antenna_height=10, rx_antenna_height=2,
+                   rfmodel_options=dict(frequency=1000.0), num_radials=36, del_s=30_000, pixel_size=0.05)
+    expected = calc_coverage_radial(free_space_loss, filename, **options)
+    geotransform, shape = calc_coverage_radial_blocks(free_space_loss, filename, out_filename, block_size=16,
+                                                      overview_levels=[2], **options)
+    assert geotransform == expected.geotransform
+    assert shape == expected.loss.shape
+    ds = gdal.Open(out_filename)
+    band = ds.GetRasterBand(1)
+    assert band.GetBlockSize() == [16, 16]
+    assert band.GetOverviewCount() == 1
+    assert_almost_equal(band.ReadAsArray(), expected.loss)
+    ds = None
+
+    # resume an interrupted run: the first row of blocks is kept
+    profiles = radial_profiles(filename, lon=35.0, lat=32.0, radius=300_000, num_radials=36, del_s=30_000)
+    with open(out_filename + '.progress', 'w') as f:
+        json.dump(dict(config=dict(geotransform=list(geotransform), shape=list(shape), block_size=16),
+                       completed_rows=1), f)
+    radial_values = np.zeros((36, 11), dtype=np.float32)
+    assert write_coverage_blocks(out_filename, radial_values, profiles, geotransform, shape, block_size=16) == \
+        -(-shape[0] // 16) - 1
+    loss = gdal.Open(out_filename).ReadAsArray()
+    assert_almost_equal(loss[:16], expected.loss[:16])
+    assert np.all(loss[16:][~np.isnan(expected.loss[16:])] == 0)
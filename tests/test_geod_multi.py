@@ -0,0 +1,39 @@
+import itertools
+
+import numpy as np
+from pyproj import Geod
+
+from rfmodel.geod.geod_backport import GeodIntermediateFlag, inv_intermediate_multi
+
+
+def test_inv_intermediate_multi():
+    g = Geod(ellps='WGS84')
+    lons1 = np.array([35.0, 34.8, -122.4, 179.9, 10.0])
+    lats1 = np.array([32.0, 31.5, 37.7, 0.0, 50.0])
+    lons2 = np.array([35.2, 34.81, -118.2, -179.9, 10.01])
+    lats2 = np.array([32.1, 31.51, 34.0, 0.1, 50.0])
+    del_s = np.array([30.0, 30.0, 5000.0, 100.0, 30.0])
+    all_flags = [npts_flag | del_s_flag | GeodIntermediateFlag.AZIS_KEEP
+                 for npts_flag, del_s_flag in itertools.product(
+                     (GeodIntermediateFlag.NPTS_ROUND, GeodIntermediateFlag.NPTS_CEIL, GeodIntermediateFlag.NPTS_TRUNC),
+                     (GeodIntermediateFlag.DEL_S_RECALC, GeodIntermediateFlag.DEL_S_NO_RECALC))]
+    for flags, initial_idx, terminus_idx in itertools.product(all_flags, (0, 1), (0, 1)):
+        res = inv_intermediate_multi(g, lons1, lats1, lons2, lats2, del_s=del_s,
+                                     initial_idx=initial_idx, terminus_idx=terminus_idx, flags=flags)
+        for i in range(len(lons1)):
+            expected = g.inv_intermediate(lons1[i], lats1[i], lons2[i], lats2[i], del_s=del_s[i],
+                                          initial_idx=initial_idx, terminus_idx=terminus_idx, flags=flags)
+            start, end = res.offsets[i], res.offsets[i + 1]
+            assert res.npts[i] == expected.npts
+            np.testing.assert_allclose(res.del_s[i], expected.del_s)
+            np.testing.assert_allclose(res.lons[start:end], expected.lons, atol=1e-9)
+            np.testing.assert_allclose(res.lats[start:end], expected.lats, atol=1e-9)
+            np.testing.assert_allclose(res.azis[start:end], expected.azis, atol=1e-6)
+
+    # by npts
+    res = inv_intermediate_multi(g, lons1, lats1, lons2, lats2, npts=7, initial_idx=0, terminus_idx=0)
+    assert res.azis is None
+    for i in range(len(lons1)):
+        expected = g.inv_intermediate(lons1[i], lats1[i], lons2[i], lats2[i], npts=7, initial_idx=0, terminus_idx=0)
+        np.testing.assert_allclose(res.lons[7 * i:7 * (i + 1)], expected.lons, atol=1e-9)
+        np.testing.assert_allclose(res.lats[7 * i:7 * (i + 1)], expected.lats, atol=1e-9)
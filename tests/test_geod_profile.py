@@ -3,11 +3,12 @@ import timeit
 import numpy as np
 from numpy.testing import assert_almost_equal
 
-from rfmodel.geod.geod_profile import Geod, geod_profile
+from rfmodel.dem.mmap_dem import MMapDEM
+from rfmodel.geod.geod_profile import Geod, geod_profile, geod_profile_multi, get_ovr_idx_by_del_s, \
+    get_resolution_meters
 
 
-def test_profile(do_print=False):
-    filename = 'data/srtm_30k_global.tif'
+def test_profile(do_print=False, filename='data/srtm_30k_global.tif'):
     boston_lat = 42. + (15. / 60.)
     boston_lon = -71. - (7. / 60.)
     portland_lat = 45. + (31. / 60.)
@@ -42,6 +43,52 @@ def test_profile(do_print=False):
         assert_almost_equal(alts, exp_alts)
 
 
+def test_profile_mmap_dem(tmp_path):
+    dem = MMapDEM.create('data/srtm_30k_global.tif', tmp_path / 'srtm_30k_global.raw')
+    test_profile(filename=dem)
+
+
+def test_profile_multi():
+    filename = 'data/srtm_30k_global.tif'
+    lon1 = np.array([-71.11666667, -71.11666667, -80.0])
+    lat1 = np.array([42.25, 42.25, 35.0])
+    lon2 = np.array([-123.68333333, -100.0, -81.0])
+    lat2 = np.array([45.51666667, 40.0, 36.0])
+    del_s = np.array([1_000_000, 100_000, 10_000])
+
+    geod_res, alts = geod_profile_multi(filename, lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2, del_s=del_s)
+    assert len(geod_res.offsets) == len(lon1) + 1
+    assert alts.shape == (1, geod_res.offsets[-1])
+    for i in range(len(lon1)):
+        exp_res, exp_alts = geod_profile(
+            filename, lon1=lon1[i], lat1=lat1[i], lon2=lon2[i], lat2=lat2[i], del_s=del_s[i])
+        start, end = geod_res.offsets[i], geod_res.offsets[i + 1]
+        assert geod_res.npts[i] == exp_res.npts == end - start
+        assert_almost_equal(geod_res.del_s[i], exp_res.del_s)
+        assert_almost_equal(geod_res.lons[start:end], exp_res.lons)
+        assert_almost_equal(geod_res.lats[start:end], exp_res.lats)
+        assert_almost_equal(alts[0][start:end], exp_alts[0])
+
+
+def test_profile_auto_overview(tmp_path):
+    from osgeo import gdal
+    filename = str(tmp_path / 'dem.tif')
+    gdal.Translate(filename, 'data/srtm_30k_global.tif')
+    ds = gdal.Open(filename, gdal.GA_Update)
+    ds.BuildOverviews('AVERAGE', [2, 4])
+    ds = None
+    resolution = get_resolution_meters(filename)
+    assert_almost_equal(get_resolution_meters(filename, ovr_idx=2), resolution * 4)
+    assert get_ovr_idx_by_del_s(filename, resolution / 2) == 0
+    assert get_ovr_idx_by_del_s(filename, resolution * 3) == 1
+    assert get_ovr_idx_by_del_s(filename, resolution * 10) == 2
+
+    kwargs = dict(lon1=-71.11666667, lat1=42.25, lon2=-123.68333333, lat2=45.51666667, del_s=resolution * 4)
+    geod_res, alts = geod_profile(filename, ovr_idx='auto', **kwargs)
+    exp_res, exp_alts = geod_profile(filename, ovr_idx=2, **kwargs)
+    assert_almost_equal(alts, exp_alts)
+
+
 if __name__ == '__main__':
     do_time = False
     bench_count = 1
@@ -0,0 +1,41 @@
+import numpy as np
+
+from rfmodel.coverage import get_radial_points
+from rfmodel.dem.mmap_dem import MMapDEM
+from rfmodel.horizon import HorizonIndex, build_horizon_index
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel import calc_path_loss_lonlat_results
+from rfmodel.rfmodel_types import RFModelPropagationMode
+
+
+def test_horizon(tmp_path):
+    rng = np.random.default_rng(0)
+    dem = MMapDEM.from_array(tmp_path / 'dem.raw', rng.uniform(0, 300, (400, 400)).astype(np.float32),
+                             geotransform=(34.0, 0.005, 0.0, 33.0, 0.0, -0.005))
+    lon, lat = 35.0, 32.0
+    index = build_horizon_index(dem, lon, lat, radius=30_000, tx_antenna_height=50, num_radials=36, del_s=500)
+    index.save(tmp_path / 'horizon.npz')
+    index = HorizonIndex.load(tmp_path / 'horizon.npz')
+    assert index.horizon.shape == (36, 61)
+
+    # receivers on the steps of the radials, where the profiles to them are the prefixes of the radials
+    count = 300
+    radials = rng.integers(0, 36, count)
+    steps = rng.integers(2, 61, count)
+    lons, lats = get_radial_points(lon, lat, np.arange(36) * 10.0, np.arange(61) * 500.0)
+    rx_antenna_height = rng.uniform(2, 200, count)
+    res = index.query(lons[radials, steps], lats[radials, steps], rx_antenna_height)
+    assert res.los.shape == (count,)
+    assert 0 < res.los.sum() < count
+
+    expected = calc_path_loss_lonlat_results(
+        calc_reference_loss, dem, lon1=lon, lat1=lat, lon2=lons[radials, steps], lat2=lats[radials, steps],
+        tx_antenna_height=50, rx_antenna_height=rx_antenna_height,
+        rfmodel_options=dict(frequency=1000.0, k_factor=index.k_factor), npts=steps + 1)
+    clear = np.abs(res.clearance) > 0.5
+    assert clear.sum() > count * 0.9
+    assert np.all(res.los[clear] == (expected.propagation_mode == RFModelPropagationMode.LOS)[clear])
+
+    # beyond the radius
+    res = index.query([lon + 1], [lat], 10)
+    assert not res.los[0] and np.isnan(res.clearance[0])
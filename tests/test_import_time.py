@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# the modules of a short lived worker, that only reads profiles and calls the model
+# (its import time budget is checked by benchmarks/bench_rfmodel.py)
+startup_modules = ('rfmodel.rfmodel', 'rfmodel.read_profile', 'rfmodel.rfmodel_types')
+heavy_modules = ('osgeo', 'osgeo_utils', 'pyproj', 'numpy.testing', 'rfmodel.geod.geod_profile')
+# the modules that work on a DEMSource without GDAL
+gdal_free_modules = ('rfmodel.coverage', 'rfmodel.horizon', 'rfmodel.link_matrix', 'rfmodel.service',
+                     'rfmodel.parallel')
+src_dir = Path(__file__).parent.parent / 'src'
+
+
+def get_loaded_modules(modules, candidates):
+    code = (f'import json, sys; import {", ".join(modules)}; '
+            f'print(json.dumps([m for m in {candidates!r} if m in sys.modules]))')
+    env = {**os.environ, 'PYTHONPATH': str(src_dir)}
+    return json.loads(subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                                     text=True, env=env).stdout)
+
+
+def test_import_time():
+    assert get_loaded_modules(startup_modules, heavy_modules) == []
+    assert get_loaded_modules(gdal_free_modules, ('osgeo', 'osgeo_utils')) == []
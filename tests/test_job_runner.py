@@ -0,0 +1,119 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.coverage import calc_coverage_radial
+from rfmodel.job_runner import claim_shard, collect_coverage_job, collect_job, create_coverage_job, \
+    create_link_job, job_status, load_job, run_job, run_job_parallel
+from rfmodel.rfmodel import calc_path_loss_lonlat_results
+from rfmodel.rfmodel_types import RFModelReturn
+
+from conftest import create_synthetic_dem, stand_in_loss
+
+calls = []
+
+
+def failing_loss(*args, **kwargs) -> RFModelReturn:
+    calls.append(1)
+    if len(calls) > 25:
+        raise RuntimeError('crash')
+    return stand_in_loss(*args, **kwargs)
+
+
+def make_links(tmp_path, count=95):
+    dem = create_synthetic_dem(tmp_path / 'dem.raw', shape=(100, 100))
+    rng = np.random.default_rng(0)
+    links = dict(lon1=rng.uniform(34.1, 34.9, count), lat1=rng.uniform(32.1, 32.9, count),
+                 lon2=rng.uniform(34.1, 34.9, count), lat2=rng.uniform(32.1, 32.9, count),
+                 tx_antenna_height=rng.uniform(10, 300, count), rx_antenna_height=10,
+                 rfmodel_options=dict(frequency=[300.0, 3000.0], polarization='H'), del_s=500)
+    return dem, links
+
+
+def test_job_runner(tmp_path):
+    dem, links = make_links(tmp_path)
+    expected = calc_path_loss_lonlat_results(stand_in_loss, dem, **links)
+    work_dir = tmp_path / 'job'
+    assert create_link_job(work_dir, shard_size=10, **links) == (10, 0, 0, 10)
+    assert run_job(stand_in_loss, dem, work_dir, max_shards=3) == 3
+    assert job_status(work_dir) == (10, 3, 0, 7)
+    with pytest.raises(ValueError):
+        collect_job(work_dir)
+
+    # the same job again keeps its results, another job in the same work_dir is refused
+    assert create_link_job(work_dir, shard_size=10, **links).completed == 3
+    with pytest.raises(ValueError):
+        create_link_job(work_dir, shard_size=20, **links)
+
+    # a crash loses only the shard that was being calculated
+    calls.clear()
+    with pytest.raises(RuntimeError):
+        run_job(failing_loss, dem, work_dir)
+    assert job_status(work_dir) == (10, 5, 0, 5)
+
+    assert run_job(stand_in_loss, dem, work_dir) == 5
+    assert job_status(work_dir).done
+    res = collect_job(work_dir)
+    assert_almost_equal(res.total_loss, expected.total_loss, decimal=5)
+    assert (res.propagation_mode == expected.propagation_mode).all()
+
+
+def test_job_runner_locks(tmp_path):
+    dem, links = make_links(tmp_path, count=30)
+    work_dir = tmp_path / 'job'
+    create_link_job(work_dir, shard_size=10, **links)
+
+    # a live lock of another host is kept, until it times out
+    with open(work_dir / 'shard_000000.lock', 'w') as f:
+        json.dump(dict(host='another-host', pid=1, time=0), f)
+    assert not claim_shard(work_dir, 0)
+    assert job_status(work_dir) == (3, 0, 1, 2)
+    os.utime(work_dir / 'shard_000000.lock', (0, 0))
+    assert claim_shard(work_dir, 0)
+    assert not claim_shard(work_dir, 0)
+    os.remove(work_dir / 'shard_000000.lock')
+
+    # the lock of a dead process of this host is broken at once
+    if os.name != 'nt':
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        with open(work_dir / 'shard_000001.lock', 'w') as f:
+            json.dump(dict(host=socket.gethostname(), pid=dead.pid, time=0), f)
+    assert run_job(stand_in_loss, dem, work_dir) == 3
+    assert not list(work_dir.glob('*.lock')) and not list(work_dir.glob('*.stale'))
+
+
+def test_job_runner_parallel(tmp_path):
+    dem, links = make_links(tmp_path)
+    expected = calc_path_loss_lonlat_results(stand_in_loss, dem, **links)
+    work_dir = tmp_path / 'job'
+    create_link_job(work_dir, shard_size=10, **links)
+    assert run_job_parallel(stand_in_loss, dem, work_dir, processes=2) == 10
+    assert_almost_equal(collect_job(work_dir).total_loss, expected.total_loss, decimal=5)
+
+
+def test_coverage_job(tmp_path):
+    dem, _links = make_links(tmp_path)
+    coverage_options = dict(lon=34.5, lat=32.5, radius=10_000, tx_antenna_height=30, rx_antenna_height=2,
+                            rfmodel_options=dict(frequency=900.0), num_radials=36, del_s=200, pixel_size=0.02)
+    work_dir = tmp_path / 'coverage'
+    assert create_coverage_job(work_dir, dem, shard_size=8, **coverage_options) == (5, 0, 0, 5)
+    assert run_job(stand_in_loss, dem, work_dir, max_shards=2) == 2
+    with pytest.raises(ValueError):
+        collect_coverage_job(work_dir)
+    assert create_coverage_job(work_dir, dem, shard_size=8, **coverage_options).completed == 2
+    # the shards don't read the DEM, the profiles are kept with the job
+    assert run_job(stand_in_loss, None, work_dir) == 3
+    coverage = collect_coverage_job(work_dir)
+    expected = calc_coverage_radial(stand_in_loss, dem, **coverage_options)
+    assert coverage.geotransform == expected.geotransform
+    assert_almost_equal(coverage.loss, expected.loss, decimal=4)
+    rows, cols = coverage.loss.shape
+    assert np.isnan(coverage.loss[0, 0])
+    assert np.isfinite(coverage.loss[rows // 2, cols // 2])
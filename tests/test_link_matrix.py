@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.link_matrix import calc_link_matrix
+from rfmodel.model_registry import calc_batch_with_scalar, register_model
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch
+from rfmodel.rfmodel_types import RFModelReturn, RFModelPropagationMode
+
+from conftest import CountingDEM, create_synthetic_dem
+
+
+def directional_loss(tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                  profile_elevation, profile_distance, **kwargs) -> RFModelReturn:
+    assert profile_distance[0] == 0
+    d = float(profile_distance[num_profile_points - 1])
+    free_space_loss = 20 * math.log10(d / 1000) + 20 * math.log10(frequency) + 32.45
+    # depends on the direction of the profile
+    obstruction = float(np.max(profile_elevation[1:num_profile_points // 2 + 1])) - tx_antenna_height
+    total_loss = free_space_loss + max(obstruction, 0) / 10
+    return RFModelReturn(0.0, total_loss, free_space_loss, 'STANDIN', 'LOS' if obstruction <= 0 else 'DIF')
+
+
+calls = []
+
+
+def _directional_loss_batch(profile_elevation, profile_distance, offsets, tx_antenna_height, rx_antenna_height, out,
+                         extension=None, **rfmodel_options):
+    calls.append((len(offsets) - 1, profile_elevation.strides[0] < 0))
+    calc_batch_with_scalar(directional_loss, profile_elevation, profile_distance, offsets,
+                           tx_antenna_height, rx_antenna_height, out, **rfmodel_options)
+
+
+@register_model(batch=_directional_loss_batch)
+def batch_directional_loss(**kwargs) -> RFModelReturn:
+    raise AssertionError('the batch form should be used')
+
+
+def test_link_matrix(tmp_path):
+    dem = create_synthetic_dem(tmp_path / 'dem.raw', CountingDEM)
+    rng = np.random.default_rng(0)
+    n = 7
+    lons = rng.uniform(34.1, 35.9, n)
+    lats = rng.uniform(31.1, 32.9, n)
+    heights = rng.uniform(10, 300, n)
+    options = dict(rfmodel_options=dict(frequency=1000.0), del_s=1000)
+
+    CountingDEM.sampled_points = 0
+    res = calc_link_matrix(directional_loss, dem, lons, lats, heights, tile_size=3, **options)
+    matrix_points = CountingDEM.sampled_points
+
+    i, j = np.nonzero(~np.eye(n, dtype=bool))
+    CountingDEM.sampled_points = 0
+    a, b = calc_path_loss_lonlat_batch(directional_loss, dem, lons[i], lats[i], lons[j], lats[j],
+                                       heights[i], heights[j], **options)
+    # each unordered pair is sampled once
+    assert matrix_points * 2 == CountingDEM.sampled_points
+
+    assert np.all(np.isnan(np.diag(res.total_loss)))
+    assert np.all(np.diag(res.propagation_mode) == RFModelPropagationMode.UNKNOWN)
+    assert_almost_equal(res.total_loss[i, j], a[1], decimal=4)
+    assert_almost_equal(res.free_space_loss[i, j], a[2], decimal=4)
+    assert_almost_equal(res.free_space_loss, res.free_space_loss.T, decimal=4)
+    assert np.all((res.propagation_mode[i, j] == RFModelPropagationMode.LOS) == b)
+
+    # a contiguous copy of the reversed profiles, and the batch form of a registered model
+    res2 = calc_link_matrix(directional_loss, dem, lons, lats, heights, contiguous=True, **options)
+    assert_almost_equal(res2.total_loss, res.total_loss)
+    calls.clear()
+    res_batch = calc_link_matrix(batch_directional_loss, dem, lons, lats, heights, tile_size=3, **options)
+    assert_almost_equal(res_batch.total_loss, res.total_loss)
+    assert np.all(res_batch.propagation_mode == res.propagation_mode)
+    assert sum(count for count, _ in calls) == n * (n - 1)
+    # the reverse links get the zero-copy reversed view
+    assert any(negative_stride for _, negative_stride in calls)
+
+    # n x m
+    res3 = calc_link_matrix(directional_loss, dem, lons[:3], lats[:3], heights[:3],
+                            lons2=lons[3:], lats2=lats[3:], antenna_heights2=heights[3:], tile_size=2, **options)
+    assert res3.total_loss.shape == (3, n - 3)
+    assert_almost_equal(res3.total_loss, res.total_loss[:3, 3:])
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from rfmodel.metrics import MetricsRegistry, metrics
+from rfmodel.result_cache import CachedCalcLoss
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch
+
+from conftest import stand_in_loss
+
+
+def test_metrics_disabled():
+    registry = MetricsRegistry()
+    with registry.stage('model'):
+        pass
+    registry.inc('links')
+    registry.count_mode('LOS')
+    assert registry.snapshot() == dict(stages={}, counters={}, propagation_modes={}, collectors={})
+
+
+def test_metrics(synthetic_dem):
+    rng = np.random.default_rng(0)
+    count = 20
+    kwargs = dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                  lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                  tx_antenna_height=rng.uniform(10, 600, count), rx_antenna_height=10,
+                  rfmodel_options=dict(frequency=1000.0), del_s=1000)
+    stages = []
+
+    def hook(stage, _seconds, _count):
+        stages.append(stage)
+
+    metrics.add_hook(hook)
+    calc_loss = CachedCalcLoss(stand_in_loss)
+    metrics.reset()
+    metrics.enabled = True
+    try:
+        _a, b = calc_path_loss_lonlat_batch(calc_loss, synthetic_dem, **kwargs)
+        _a, b = calc_path_loss_lonlat_batch(calc_loss, synthetic_dem, **kwargs)
+        snapshot = metrics.snapshot()
+        prometheus = metrics.to_prometheus()
+        json_snapshot = json.loads(metrics.to_json())
+    finally:
+        metrics.enabled = False
+        metrics.reset()
+        metrics.remove_hook(hook)
+
+    assert set(snapshot['stages']) == {'geodesic', 'raster_sampling', 'array_conversion', 'model'}
+    assert snapshot['stages']['model']['calls'] == 2
+    assert snapshot['stages']['model']['count'] == 2 * count
+    assert stages.count('model') == 2
+    assert snapshot['counters']['links'] == 2 * count
+    assert snapshot['counters']['profile_points'] == snapshot['stages']['raster_sampling']['count']
+    modes = snapshot['propagation_modes']
+    assert modes['LOS'] == 2 * np.count_nonzero(b)
+    assert sum(modes.values()) == 2 * count
+    assert snapshot['collectors']['result_cache']['memory_hits'] >= count
+    assert json_snapshot['counters'] == snapshot['counters']
+    assert f'rfmodel_links_total {2 * count}' in prometheus
+    assert 'rfmodel_stage_seconds_total{stage="model"}' in prometheus
+    assert f'rfmodel_links_by_mode_total{{propagation_mode="LOS"}} {modes["LOS"]}' in prometheus
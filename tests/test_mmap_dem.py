@@ -0,0 +1,62 @@
+import pickle
+
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.dem.dem_source import DEMSource
+from rfmodel.dem.mmap_dem import MMapDEM
+
+
+def test_mmap_dem(tmp_path):
+    array = np.arange(20, dtype=np.float32).reshape(4, 5) * 10
+    geotransform = (30.0, 1.0, 0.0, 40.0, 0.0, -1.0)
+    dem = MMapDEM.from_array(tmp_path / 'dem.raw', array, geotransform, srs=4326)
+    assert dem.shape == (1, 4, 5)
+    assert_almost_equal(dem.get_resolution_meters(), 111_111)
+
+    x = np.array([30.1, 31.9, 34.99, 29.0, 36.0])
+    y = np.array([39.9, 38.5, 36.01, 41.0, 35.0])
+    assert_almost_equal(dem.sample(x, y)[0], [0, 60, 190, 0, 190])
+
+    # pixel centers are exact, the mid point between two pixels is their mean
+    x = np.array([30.5, 31.0, 30.5, 31.0])
+    y = np.array([39.5, 39.5, 39.0, 39.0])
+    assert_almost_equal(dem.sample(x, y, interpolation='bilinear')[0], [0, 5, 25, 30])
+
+    dem2 = pickle.loads(pickle.dumps(dem))
+    assert dem2.filename == dem.filename
+    assert_almost_equal(dem2.sample(x, y), dem.sample(x, y))
+
+
+def test_dem_source_abstract():
+    class NoResolutionDEM(DEMSource):
+        def sample(self, x, y, srs=4326, band_nums=None, ovr_idx=None):
+            return np.zeros((1, len(x)))
+
+    with pytest.raises(TypeError):
+        NoResolutionDEM()
+
+
+def test_mmap_dem_create_scaled(tmp_path):
+    from osgeo import gdal
+    from rfmodel.dem.sample import sample_raster
+
+    array = np.arange(20, dtype=np.int16).reshape(4, 5) * 10
+    ds = gdal.GetDriverByName('GTiff').Create(str(tmp_path / 'dem.tif'), 5, 4, 1, gdal.GDT_Int16)
+    ds.SetGeoTransform((30.0, 1.0, 0.0, 40.0, 0.0, -1.0))
+    ds.SetProjection('EPSG:4326')
+    band = ds.GetRasterBand(1)
+    band.WriteArray(array)
+    band.SetScale(0.5)
+    band.SetOffset(-10.0)
+    band.SetNoDataValue(-32768)
+    dem = MMapDEM.create(ds, tmp_path / 'dem.raw')
+    assert dem.data.dtype == np.float32
+    assert dem.nodata == -32768 * 0.5 - 10
+
+    # the same elevations as sampling the GeoTIFF
+    x = np.array([30.1, 31.9, 34.99])
+    y = np.array([39.9, 38.5, 36.01])
+    assert_almost_equal(dem.sample(x, y), sample_raster(ds, x, y))
+    assert_almost_equal(dem.sample(x, y)[0], [-10, 20, 85])
@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.coverage import calc_radial_loss, radial_profiles
+from rfmodel.model_registry import get_model_capabilities, register_model, scalar_capabilities
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch, calc_path_loss_lonlat_multi
+from rfmodel.rfmodel_types import RFModelReturn
+
+from conftest import create_synthetic_dem
+
+threads = set()
+
+
+def strict_reference_loss(tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                          profile_elevation, profile_distance) -> RFModelReturn:
+    # a scalar model without extension or **kwargs
+    return calc_reference_loss(tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                               profile_elevation, profile_distance)
+
+
+def scalar_reference_loss(**kwargs) -> RFModelReturn:
+    return calc_reference_loss(**kwargs)
+
+
+@register_model(thread_safe=True, releases_gil=True)
+def threaded_reference_loss(**kwargs) -> RFModelReturn:
+    threads.add(threading.get_ident())
+    return calc_reference_loss(**kwargs)
+
+
+extensions = []
+
+
+def _never_batch(*args, **kwargs):
+    raise AssertionError('the batch form should not be used for extension')
+
+
+@register_model(batch=_never_batch, extension=True)
+def extension_reference_loss(extension=False, **kwargs) -> RFModelReturn:
+    extensions.append(extension)
+    return calc_reference_loss(**kwargs)
+
+
+def test_model_registry(synthetic_dem):
+    assert get_model_capabilities(scalar_reference_loss) == scalar_capabilities
+    assert get_model_capabilities(threaded_reference_loss).thread_safe
+    assert get_model_capabilities(calc_reference_loss).batch is not None
+    # lambdas and closures can't be sent to worker processes
+    assert not get_model_capabilities(lambda **kwargs: scalar_reference_loss(**kwargs)).picklable
+
+    rng = np.random.default_rng(0)
+    count = 300
+    kwargs = dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                  lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                  tx_antenna_height=rng.uniform(10, 300, count), rx_antenna_height=10,
+                  rfmodel_options=dict(frequency=[300.0, 3000.0]), del_s=1000)
+    expected_a, expected_b = calc_path_loss_lonlat_batch(scalar_reference_loss, synthetic_dem, **kwargs)
+    for calc_loss in (calc_reference_loss, threaded_reference_loss):
+        a, b = calc_path_loss_lonlat_batch(calc_loss, synthetic_dem, workers=4, **kwargs)
+        assert_almost_equal(a, expected_a, decimal=4)
+        assert np.all(b == expected_b)
+    assert len(threads) > 1
+
+    profiles = radial_profiles(synthetic_dem, lon=35.0, lat=32.0, radius=50_000, num_radials=8, del_s=1000)
+    options = dict(tx_antenna_height=30, rx_antenna_height=2, rfmodel_options=dict(frequency=1000.0))
+    expected = calc_radial_loss(scalar_reference_loss, profiles, **options)
+    assert_almost_equal(calc_radial_loss(strict_reference_loss, profiles, workers=1, **options), expected, decimal=4)
+    for calc_loss in (calc_reference_loss, threaded_reference_loss):
+        assert_almost_equal(calc_radial_loss(calc_loss, profiles, **options), expected, decimal=4)
+    # the prefixes of the batch form in small groups
+    assert_almost_equal(calc_radial_loss(calc_reference_loss, profiles, max_batch_points=100, **options),
+                        expected, decimal=4)
+
+    # a model that supports extension is called per step, to reuse the prefix, even if it has a batch form
+    extensions.clear()
+    assert_almost_equal(calc_radial_loss(extension_reference_loss, profiles, radials=[0], **options)[0],
+                        expected[0], decimal=4)
+    assert extensions == [False] + [True] * (len(extensions) - 1) and len(extensions) > 1
+
+
+def test_model_dispatch_processes(tmp_path):
+    rng = np.random.default_rng(1)
+    dem = create_synthetic_dem(tmp_path / 'dem.raw', seed=1)
+    count = 20
+    options = dict(count=count, main_options=dict(tx_antenna_height=50, rx_antenna_height=10),
+                   profile_options=dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                                        lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                                        del_s=1000),
+                   rfmodel_options=dict(frequency=1000.0))
+    a, b = calc_path_loss_lonlat_multi(calc_reference_loss, dem, processes=2, **options)
+    expected_a, expected_b = calc_path_loss_lonlat_multi(scalar_reference_loss, dem, **options)
+    assert_almost_equal(a, expected_a, decimal=4)
+    assert np.all(b == expected_b)
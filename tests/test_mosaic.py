@@ -0,0 +1,85 @@
+import pickle
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.dem.mmap_dem import MMapDEM
+from rfmodel.dem.mosaic import MosaicDEM
+
+
+def make_tiles(tmp_path, array, x0, y0, tile_size, res):
+    filenames = []
+    rows, cols = array.shape
+    for r in range(0, rows, tile_size):
+        for c in range(0, cols, tile_size):
+            geotransform = (x0 + c * res, res, 0.0, y0 - r * res, 0.0, -res)
+            filename = tmp_path / f'tile_{r}_{c}.raw'
+            MMapDEM.from_array(filename, array[r:r + tile_size, c:c + tile_size], geotransform, srs=4326)
+            filenames.append(filename)
+    return filenames
+
+
+def test_mosaic(tmp_path):
+    res = 0.1
+    array = np.arange(400, dtype=np.float32).reshape(20, 20)
+    whole = MMapDEM.from_array(tmp_path / 'whole.raw', array, (34.0, res, 0.0, 32.0, 0.0, -res), srs=4326)
+    filenames = make_tiles(tmp_path, array, 34.0, 32.0, 10, res)
+    mosaic = MosaicDEM(filenames, max_open=2)
+
+    rng = np.random.default_rng(0)
+    x = rng.uniform(34.0, 36.0, 1000)
+    y = rng.uniform(30.0, 32.0, 1000)
+    # points on the seams of the tiles
+    x = np.concatenate([x, [35.0, 35.0, 34.5, 35.0]])
+    y = np.concatenate([y, [31.0, 30.5, 31.0, 30.05]])
+    assert_almost_equal(mosaic.sample(x, y), whole.sample(x, y))
+    stats = mosaic.stats()
+    assert stats.reads == 4
+    assert stats.open_tiles == 2
+    assert stats.evictions == 2
+
+    # outside of all the tiles
+    assert_almost_equal(mosaic.sample([10.0, 34.5], [10.0, 31.5])[0], [0, whole.sample([34.5], [31.5])[0, 0]])
+
+    # a single open tile at a time
+    mosaic = MosaicDEM(filenames, max_open=1)
+    assert_almost_equal(mosaic.sample(x, y), whole.sample(x, y))
+    assert mosaic.stats().open_tiles == 1
+
+    index_filename = tmp_path / 'index.json'
+    mosaic.save_index(index_filename)
+    mosaic2 = MosaicDEM.from_index(index_filename)
+    assert_almost_equal(mosaic2.sample(x, y), whole.sample(x, y))
+    mosaic3 = pickle.loads(pickle.dumps(mosaic))
+    assert_almost_equal(mosaic3.sample(x, y), whole.sample(x, y))
+    assert_almost_equal(mosaic.get_resolution_meters(), whole.get_resolution_meters())
+
+
+def test_mosaic_antimeridian(tmp_path):
+    east = np.full((10, 10), 1, dtype=np.float32)
+    west = np.full((10, 10), 2, dtype=np.float32)
+    filenames = [tmp_path / 'east.raw', tmp_path / 'west.raw']
+    MMapDEM.from_array(filenames[0], east, (179.0, 0.1, 0.0, 1.0, 0.0, -0.1), srs=4326)
+    MMapDEM.from_array(filenames[1], west, (-180.0, 0.1, 0.0, 1.0, 0.0, -0.1), srs=4326)
+    mosaic = MosaicDEM(filenames)
+    x = [179.5, -179.5, 180.5, 179.95, -180.05]
+    y = [0.5, 0.5, 0.5, 0.5, 0.5]
+    assert_almost_equal(mosaic.sample(x, y)[0], [1, 2, 2, 1, 1])
+
+    # a tile that extends beyond the antimeridian
+    beyond = np.full((10, 20), 3, dtype=np.float32)
+    MMapDEM.from_array(tmp_path / 'beyond.raw', beyond, (179.0, 0.1, 0.0, 1.0, 0.0, -0.1), srs=4326)
+    mosaic = MosaicDEM([tmp_path / 'beyond.raw'])
+    assert_almost_equal(mosaic.sample(x, y)[0], [3, 3, 3, 3, 3])
+
+
+def test_mosaic_mixed_dtypes(tmp_path):
+    filenames = [tmp_path / 'int16.raw', tmp_path / 'float32.raw']
+    MMapDEM.from_array(filenames[0], np.full((10, 10), 300, dtype=np.int16), (34.0, 0.1, 0.0, 32.0, 0.0, -0.1),
+                       srs=4326)
+    MMapDEM.from_array(filenames[1], np.full((10, 10), 100_000.25, dtype=np.float32),
+                       (35.0, 0.1, 0.0, 32.0, 0.0, -0.1), srs=4326)
+    mosaic = MosaicDEM(filenames)
+    res = mosaic.sample([34.5, 35.5, 10.0], [31.5, 31.5, 10.0])
+    assert res.dtype == np.float32
+    assert_almost_equal(res[0], [300, 100_000.25, 0])
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.coverage import calc_radial_loss, radial_profiles
+from rfmodel.parallel import calc_path_loss_lonlat_batch_parallel, create_process_pool, get_picklable_dem
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch
+from rfmodel.rfmodel_types import RFModelReturn
+
+from conftest import stand_in_loss
+
+activation_keys = []
+
+
+def set_activation_key(key: str):
+    activation_keys.append(key)
+
+
+def keyed_loss(**kwargs) -> RFModelReturn:
+    # the workers must be activated before the first link
+    assert activation_keys == ['key']
+    return stand_in_loss(**kwargs)
+
+
+def test_parallel(synthetic_dem):
+    dem = synthetic_dem
+    rng = np.random.default_rng(0)
+    count = 103
+    lon1 = rng.uniform(34.1, 35.9, count)
+    lat1 = rng.uniform(31.1, 32.9, count)
+    lon2 = rng.uniform(34.1, 35.9, count)
+    lat2 = rng.uniform(31.1, 32.9, count)
+    kwargs = dict(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2,
+                  tx_antenna_height=rng.uniform(10, 300, count), rx_antenna_height=10,
+                  rfmodel_options=dict(frequency=[300.0, 3000.0]), del_s=1000)
+
+    set_activation_key('key')
+    exp_a, exp_b = calc_path_loss_lonlat_batch(keyed_loss, dem, **kwargs)
+    activation_keys.clear()
+    a, b = calc_path_loss_lonlat_batch_parallel(
+        keyed_loss, dem, workers=3, chunk_size=10,
+        activation_key='key', set_activation_key=set_activation_key, **kwargs)
+    assert_almost_equal(a, exp_a)
+    assert (b == exp_b).all()
+
+    # per-link lists are sliced per chunk as arrays are
+    kwargs.update(tx_antenna_height=kwargs['tx_antenna_height'].tolist(), del_s=[1000.0, 500.0] * 51 + [700.0])
+    set_activation_key('key')
+    exp_a, exp_b = calc_path_loss_lonlat_batch(keyed_loss, dem, **kwargs)
+    activation_keys.clear()
+    a, b = calc_path_loss_lonlat_batch_parallel(
+        keyed_loss, dem, workers=3, chunk_size=10,
+        activation_key='key', set_activation_key=set_activation_key, **kwargs)
+    assert_almost_equal(a, exp_a)
+    assert (b == exp_b).all()
+
+    profiles = radial_profiles(dem, lon=35.0, lat=32.0, radius=50_000, num_radials=12, del_s=1000)
+    radial_kwargs = dict(tx_antenna_height=20, rx_antenna_height=2, rfmodel_options=dict(frequency=1000.0))
+    with create_process_pool(dem, workers=2, activation_key='key', set_activation_key=set_activation_key) as pool:
+        radial_loss = calc_radial_loss(keyed_loss, profiles, executor=pool, chunk_size=5, **radial_kwargs)
+    set_activation_key('key')
+    exp_radial_loss = calc_radial_loss(keyed_loss, profiles, **radial_kwargs)
+    assert_almost_equal(radial_loss, exp_radial_loss)
+
+
+class InMemoryDataset:
+    def __init__(self, description: str = ''):
+        self.description = description
+
+    def GetDescription(self):
+        return self.description
+
+
+def test_picklable_dem():
+    assert get_picklable_dem(InMemoryDataset('dem.tif')) == 'dem.tif'
+    # the workers can't open a dataset that has no file
+    for description in ('', '/vsimem/dem.tif'):
+        with pytest.raises(ValueError):
+            get_picklable_dem(InMemoryDataset(description))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.prescreen import PrescreenClass, PrescreenCriteria, prescreen_profiles
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch, calc_path_loss_lonlat_results
+from rfmodel.rfmodel_types import RFModelReturn
+
+from conftest import create_synthetic_dem
+
+calls = []
+
+
+def counting_reference_loss(**kwargs) -> RFModelReturn:
+    calls.append(kwargs['num_profile_points'])
+    return calc_reference_loss(**kwargs)
+
+
+def test_prescreen_profiles():
+    # a flat profile, a profile with a hill in the middle, and an empty profile
+    distance = np.tile(np.arange(11, dtype=np.float32) * 100, 2)
+    elevation = np.zeros(22, dtype=np.float32)
+    elevation[16] = 100
+    res = prescreen_profiles(elevation, distance, [0, 11, 22, 22], 30, 30, 1000,
+                             PrescreenCriteria(max_loss=150, los_clearance=0.6), k_factor=np.inf)
+    assert res.classes.tolist() == [PrescreenClass.SIMPLE, PrescreenClass.FULL, PrescreenClass.FULL]
+    assert res.fresnel_clearance[0] > 0.6 > 0 > res.fresnel_clearance[1]
+    assert res.stats().simple == 1
+    res = prescreen_profiles(elevation, distance, [0, 11, 22], 30, 30, 1000, PrescreenCriteria(max_loss=80))
+    assert res.classes.tolist() == [PrescreenClass.SKIP] * 2
+
+
+def test_prescreen_batch(tmp_path):
+    rng = np.random.default_rng(0)
+    dem = create_synthetic_dem(tmp_path / 'dem.raw', max_elevation=200)
+    count = 300
+    kwargs = dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                  lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                  tx_antenna_height=rng.uniform(10, 1000, count), rx_antenna_height=rng.uniform(2, 1000, count),
+                  rfmodel_options=dict(frequency=[300.0, 3000.0]), del_s=1000)
+    expected_a, expected_b = calc_path_loss_lonlat_batch(calc_reference_loss, dem, **kwargs)
+    max_loss = float(np.median(expected_a[2]))
+    calls.clear()
+    a, b = calc_path_loss_lonlat_batch(counting_reference_loss, dem, **kwargs,
+                                       prescreen=PrescreenCriteria(max_loss=max_loss, los_clearance=0.6))
+    skipped = expected_a[2] > max_loss
+    assert 0 < len(calls) < count - skipped.sum()
+    # the free space loss is exact and the reference model has no diffraction loss with a 60% clearance
+    assert_almost_equal(a[2], expected_a[2], decimal=3)
+    assert_almost_equal(a[:, ~skipped], expected_a[:, ~skipped], decimal=3)
+    assert np.all(b[~skipped] == expected_b[~skipped])
+    assert not b[skipped].any()
+
+    # the number of links each criterion removed
+    criteria = PrescreenCriteria(max_loss=max_loss, los_clearance=0.6)
+    calls.clear()
+    res = calc_path_loss_lonlat_results(counting_reference_loss, dem, **kwargs, prescreen=criteria)
+    stats = res.prescreen_stats
+    assert stats.links == count and stats.skipped == skipped.sum()
+    assert stats.full == len(calls) and stats.skipped + stats.simple + stats.full == count
+    assert calc_path_loss_lonlat_results(calc_reference_loss, dem, **kwargs).prescreen_stats is None
+    with pytest.raises(ValueError):
+        calc_path_loss_lonlat_results(calc_reference_loss, dem, **dict(kwargs, rfmodel_options={}),
+                                      prescreen=criteria)
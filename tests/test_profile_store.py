@@ -0,0 +1,35 @@
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.profile_store import ProfileStore, ProfileStoreWriter
+from rfmodel.read_profile import read_profile
+
+
+def test_profile_store(tmp_path):
+    dist, elev = read_profile('data/ELEV3.DAT')
+    assert len(dist) == len(elev) == 250
+    assert dist.dtype == elev.dtype == np.float32
+    assert_almost_equal(dist[:3], [0, 500, 1000])
+
+    lengths = [250, 10, 0, 3]
+    ids = [7, 3, 11, 5]
+    filename = tmp_path / 'profiles.rfp'
+    with ProfileStoreWriter(filename) as writer:
+        for n, profile_id in zip(lengths, ids):
+            writer.append(dist[:n], elev[:n] + profile_id, profile_id=profile_id)
+
+    store = ProfileStore(filename)
+    assert len(store) == len(lengths)
+    assert list(store.npts) == lengths
+    assert list(store.offsets) == [0, 250, 260, 260, 263]
+    assert len(store.dist) == len(store.elev) == sum(lengths)
+    for (d, e), n, profile_id in zip(store, lengths, ids):
+        assert_almost_equal(d, dist[:n])
+        assert_almost_equal(e, elev[:n] + profile_id)
+    d, e = store.get(5)
+    assert_almost_equal(e, elev[:3] + 5)
+    assert store.index_of(3) == 1
+
+    store = ProfileStore.from_text_files(tmp_path / 'elev3.rfp', ['data/ELEV3.DAT'] * 2)
+    assert list(store.ids) == [0, 1]
+    assert_almost_equal(store[1][1], elev)
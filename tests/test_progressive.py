@@ -0,0 +1,25 @@
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch, calc_path_loss_lonlat_progressive
+
+
+def test_progressive(synthetic_dem):
+    rng = np.random.default_rng(0)
+    count = 200
+    kwargs = dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                  lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                  tx_antenna_height=rng.uniform(10, 300, count), rx_antenna_height=10,
+                  rfmodel_options=dict(frequency=[300.0, 3000.0]))
+    expected_a, expected_b = calc_path_loss_lonlat_batch(calc_reference_loss, synthetic_dem, del_s=500, **kwargs)
+    threshold = float(np.median(expected_a[1]))
+    res = calc_path_loss_lonlat_progressive(calc_reference_loss, synthetic_dem, threshold=threshold, margin=6,
+                                            coarse_del_s=4000, del_s=500, **kwargs)
+    assert 0 < res.refined.sum() < count
+    assert_almost_equal(res.a[:, res.refined], expected_a[:, res.refined], decimal=4)
+    assert np.all(res.b[res.refined] == expected_b[res.refined])
+    # the links that weren't refined are decided the same way by the coarse pass
+    coarse = ~res.refined
+    assert np.all(np.abs(res.coarse_total_loss[coarse] - threshold) > 6)
+    assert_almost_equal(res.a[1, coarse], res.coarse_total_loss[coarse])
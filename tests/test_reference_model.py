@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from rfmodel.profile_store import ProfileStore
+from rfmodel.reference_model import calc_reference_loss, calc_reference_loss_batch, get_k_factor
+from rfmodel.rfmodel_types import RFModelPropagationMode
+
+
+def test_reference_model_single_edge():
+    distance = np.arange(101, dtype=np.float32) * 100
+    elevation = np.zeros(101, dtype=np.float32)
+    res = calc_reference_loss(100, 100, 1000.0, 101, elevation, distance, k_factor=np.inf)
+    fsl = 20 * math.log10(10) + 20 * math.log10(1000) + 32.45
+    assert_almost_equal(res.free_space_loss, fsl, decimal=4)
+    assert res.propagation_mode == 'LOS'
+
+    # a knife edge 20m above the ray at 3km
+    elevation[30] = 120
+    res = calc_reference_loss(100, 100, 1000.0, 101, elevation, distance, k_factor=np.inf)
+    d1, d2, wavelength = 3000, 7000, 299.792458 / 1000
+    v = 20 * math.sqrt(2 * (d1 + d2) / (wavelength * d1 * d2))
+    knife_edge_loss = 6.9 + 20 * math.log10(math.sqrt((v - 0.1) ** 2 + 1) + v - 0.1)
+    assert res.propagation_mode == 'DIF'
+    assert_almost_equal(res.total_loss, fsl + knife_edge_loss, decimal=3)
+    assert_almost_equal(res.fresnel_clearance, -v / math.sqrt(2), decimal=4)
+
+
+def test_reference_model_earth_curvature():
+    # 60km over flat terrain with 10m antennas is beyond the radio horizon
+    distance = np.arange(601, dtype=np.float32) * 100
+    elevation = np.zeros(601, dtype=np.float32)
+    assert_almost_equal(get_k_factor(301), 4 / 3, decimal=2)
+    flat = calc_reference_loss(10, 10, 1000.0, 601, elevation, distance, k_factor=np.inf)
+    curved = calc_reference_loss(10, 10, 1000.0, 601, elevation, distance, refractivity=301)
+    assert flat.propagation_mode == 'LOS'
+    assert curved.propagation_mode == 'DIF'
+    assert curved.total_loss > curved.free_space_loss + 10
+
+
+def test_reference_model_batch(tmp_path):
+    rng = np.random.default_rng(0)
+    profiles = []
+    for n in rng.integers(2, 300, 200):
+        distance = np.arange(n, dtype=np.float32) * rng.uniform(10, 100)
+        elevation = np.cumsum(rng.normal(0, 5, n)).astype(np.float32) + 100
+        profiles.append((distance, elevation))
+    store = ProfileStore.write(tmp_path / 'profiles.bin', profiles)
+    tx = rng.uniform(100, 200, len(store))
+    frequency = rng.uniform(100, 3000, len(store))
+    fresnel_clearance, total_loss, fsl, modes = calc_reference_loss_batch(
+        store.elev, store.dist, store.offsets, tx, 120, frequency, deygout_depth=3)
+    assert set(modes.tolist()) == {RFModelPropagationMode.LOS, RFModelPropagationMode.DIF}
+    for i, (distance, elevation) in enumerate(store):
+        res = calc_reference_loss(tx[i], 120, frequency[i], len(distance), elevation, distance, deygout_depth=3)
+        assert_almost_equal(res[0:3], (fresnel_clearance[i], total_loss[i], fsl[i]), decimal=3)
+        assert res.propagation_mode == RFModelPropagationMode(modes[i]).name
+
+    # the sub edges of the Deygout method only add loss
+    _, main_edge_loss, _, _ = calc_reference_loss_batch(
+        store.elev, store.dist, store.offsets, tx, 120, frequency, deygout_depth=1)
+    assert np.all(total_loss >= main_edge_loss - 1e-4)
@@ -0,0 +1,109 @@
+import pickle
+import threading
+
+import numpy as np
+
+from rfmodel.model_registry import get_model_name
+from rfmodel.read_profile import read_profile
+from rfmodel.result_cache import CachedCalcLoss, ResultCache
+from rfmodel.rfmodel_types import RFModelPolarization, RFModelReturn
+
+
+class StandInModel:
+    def __init__(self, version='STANDIN-1'):
+        self.version = version
+        self.calls = []
+
+    def __call__(self, tx_antenna_height, rx_antenna_height, frequency, num_profile_points,
+                 profile_elevation, profile_distance, polarization, extension=False) -> RFModelReturn:
+        self.calls.append(extension)
+        loss = float(frequency + tx_antenna_height + rx_antenna_height + profile_elevation[:num_profile_points].sum())
+        return RFModelReturn(0.0, loss, loss, self.version, 'LOS')
+
+
+def test_result_cache(tmp_path):
+    dist, elev = read_profile('data/ELEV3.DAT')
+    elev = elev + np.arange(len(elev), dtype=np.float32)
+    options = dict(tx_antenna_height=10.0, rx_antenna_height=2.0, polarization=RFModelPolarization.V,
+                   num_profile_points=len(elev), profile_elevation=elev, profile_distance=dist)
+    filename = tmp_path / 'cache.sqlite'
+
+    model = StandInModel()
+    calc_loss = CachedCalcLoss(model, ResultCache(filename=filename))
+    res = [calc_loss(frequency=f, **options) for f in (300.0, 3000.0, 300.0, np.float64(300.0))]
+    assert len(model.calls) == 2
+    assert res[0] == res[2] == res[3]
+    stats = calc_loss.cache.stats()
+    assert (stats.memory_hits, stats.disk_hits, stats.misses) == (2, 0, 2)
+    # the key names the model as the registry does
+    assert calc_loss.model_name == get_model_name(model)
+    calc_loss.cache.close()
+
+    # a new process would hit the disk tier
+    model = StandInModel()
+    calc_loss = CachedCalcLoss(model, ResultCache(filename=filename, version='STANDIN-1'))
+    assert calc_loss(frequency=3000.0, **options) == res[1]
+    assert calc_loss.cache.stats().disk_hits == 1
+    assert len(model.calls) == 0
+    calc_loss.cache.close()
+
+    # a new model version invalidates the disk tier
+    model = StandInModel('STANDIN-2')
+    calc_loss = CachedCalcLoss(model, ResultCache(filename=filename, version='STANDIN-2'))
+    assert calc_loss.cache.stats().disk_count == 0
+    calc_loss(frequency=3000.0, **options)
+    assert len(model.calls) == 1
+
+    # after a hit along a radial, the next computed profile is not an extension
+    model.calls.clear()
+    radial = dict(options, frequency=300.0)
+    for n in (10, 11, 12):
+        calc_loss(**dict(radial, num_profile_points=n), extension=n > 10)
+    assert model.calls == [False, True, True]
+    model.calls.clear()
+    for n in (11, 12, 13, 14):
+        calc_loss(**dict(radial, num_profile_points=n), extension=n > 11)
+    assert model.calls == [False, True]
+
+
+def test_result_cache_pickle(tmp_path):
+    dist, elev = read_profile('data/ELEV3.DAT')
+    options = dict(tx_antenna_height=10.0, rx_antenna_height=2.0, polarization=RFModelPolarization.V,
+                   num_profile_points=len(elev), profile_elevation=elev, profile_distance=dist, frequency=300.0)
+    calc_loss = CachedCalcLoss(StandInModel(), ResultCache(filename=tmp_path / 'cache.sqlite'))
+    res = calc_loss(**options)
+
+    # as sent to a worker process, the disk tier is opened again by its filename
+    calc_loss2 = pickle.loads(pickle.dumps(calc_loss))
+    assert calc_loss2.cache.filename == calc_loss.cache.filename
+    calc_loss2.calc_loss.calls.clear()
+    assert calc_loss2(**options) == res
+    assert calc_loss2.cache.stats().disk_hits == 1
+    assert calc_loss2.calc_loss.calls == []
+
+    # overwriting an item makes it the most recently used
+    cache = ResultCache(max_items=2)
+    cache.put(b'a', res)
+    cache.put(b'b', res)
+    cache.put(b'a', res)
+    cache.put(b'c', res)
+    assert cache.get(b'a') == res
+    assert cache.get(b'b') is None
+
+
+def test_cached_calc_loss_threads():
+    dist, elev = read_profile('data/ELEV3.DAT')
+    radial = dict(tx_antenna_height=10.0, rx_antenna_height=2.0, polarization=RFModelPolarization.V,
+                  profile_elevation=elev, profile_distance=dist, frequency=300.0)
+    model = StandInModel()
+    calc_loss = CachedCalcLoss(model)
+    calc_loss(**dict(radial, num_profile_points=10))
+
+    # a hit in another thread doesn't break the extension chain of this thread
+    thread = threading.Thread(target=calc_loss, kwargs=dict(radial, num_profile_points=10, extension=False))
+    calc_loss(**dict(radial, num_profile_points=20))
+    thread.start()
+    thread.join()
+    model.calls.clear()
+    calc_loss(**dict(radial, num_profile_points=21), extension=True)
+    assert model.calls == [True]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch, calc_path_loss_lonlat_results
+from rfmodel.rfmodel_types import RFModelPropagationMode, RFModelResults, RFModelReturn
+
+
+def test_results(tmp_path):
+    returns = [RFModelReturn(0.5, 100.0, 90.0, 'REF', 'LOS'), RFModelReturn(-1.0, 130.0, 95.0, 'REF', 'DIF'),
+               RFModelReturn(-2.0, 150.0, 99.0, 'REF', 'TRO')]
+    res = RFModelResults.from_returns(returns)
+    assert len(res) == 3
+    assert res.to_structured().itemsize == 16
+    for i, r in enumerate(returns):
+        res[i].assert_equal(r)
+    assert res.propagation_mode.tolist() == [RFModelPropagationMode.LOS, RFModelPropagationMode.DIF,
+                                             RFModelPropagationMode.TRO]
+    assert res.los.tolist() == [True, False, False]
+
+    tail = res[1:]
+    assert isinstance(tail, RFModelResults) and len(tail) == 2
+    tail.total_loss[0] = 131
+    assert res.total_loss[1] == 131  # a view
+    both = RFModelResults.concatenate([res, res[res.los]])
+    assert len(both) == 4
+    both[3].assert_equal(returns[0])
+
+    filename = tmp_path / 'results.npz'
+    res.save(filename)
+    loaded = RFModelResults.load(filename)
+    assert loaded.version == 'REF'
+    assert np.array_equal(loaded.to_structured(), res.to_structured())
+
+
+def test_results_batch(synthetic_dem):
+    rng = np.random.default_rng(0)
+    count = 100
+    kwargs = dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                  lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                  tx_antenna_height=rng.uniform(10, 300, count), rx_antenna_height=10,
+                  rfmodel_options=dict(frequency=1000.0), del_s=1000)
+    res = calc_path_loss_lonlat_results(calc_reference_loss, synthetic_dem, **kwargs)
+    a, b = calc_path_loss_lonlat_batch(calc_reference_loss, synthetic_dem, **kwargs)
+    assert_almost_equal(res.to_ab()[0], a)
+    assert np.array_equal(res.los, b)
+    assert res[0].propagation_mode == ('LOS' if b[0] else 'DIF')
+    assert_almost_equal(res[0].total_loss, a[1, 0])
+
+    # the caller's arrays are filled in place
+    out = np.full((3, count), np.nan, dtype=np.float32), np.zeros(count, dtype=bool)
+    a2, b2 = calc_path_loss_lonlat_batch(calc_reference_loss, synthetic_dem, out=out, **kwargs)
+    assert a2 is out[0] and b2 is out[1]
+    assert_almost_equal(a2, a)
+    assert np.array_equal(b2, b)
+    assert res.version == ''
+
+    # a link without a profile (the same start and end points) is refused rather than reading its neighbour's
+    kwargs.update(lon2=kwargs['lon1'].copy(), lat2=kwargs['lat1'].copy())
+    with pytest.raises(ValueError):
+        calc_path_loss_lonlat_results(calc_reference_loss, synthetic_dem, **kwargs)
@@ -1,4 +1,7 @@
-from rfmodel.rfmodel import calc_path_loss_lonlat
+from numpy.testing import assert_almost_equal
+
+from rfmodel.rfmodel import calc_path_loss_lonlat, calc_path_loss_lonlat_multi, \
+    get_dict_of_items_from_dict_of_sequences
 from rfmodel.rfmodel_types import RFModelPolarization, RFModelReturn
 from tirem.tirem3 import calc_tirem_loss
 
@@ -36,3 +39,34 @@ def test_calc_loss_lonlat():
         version='TIREM-5.', propagation_mode='TRO')
 
     expected.assert_equal(res)
+
+
+def test_calc_loss_lonlat_multi():
+    filename = 'data/srtm_30k_global.tif'
+
+    lon1 = [-71.11666667, -71.11666667, -80.0]
+    lat1 = [42.25, 42.25, 35.0]
+    lon2 = [-123.68333333, -100.0, -81.0]
+    lat2 = [45.51666667, 40.0, 36.0]
+    count = len(lon1)
+
+    main_options = dict(tx_antenna_height=[5, 10], rx_antenna_height=5)
+    profile_options = dict(lon1=lon1, lat1=lat1, lon2=lon2, lat2=lat2, del_s=500)
+    rfmodel_options = dict(
+        frequency=[3000.0, 300.0], polarization=RFModelPolarization.H,
+        refractivity=300.0, conductivity=0.003, permittivity=10.0, humidity=10.0)
+
+    a, b = calc_path_loss_lonlat_multi(
+        calc_tirem_loss, filename, count=count, main_options=main_options,
+        profile_options=profile_options, rfmodel_options=rfmodel_options)
+    assert a.shape == (3, count)
+    assert b.shape == (count,)
+
+    for i in range(count):
+        res = calc_path_loss_lonlat(
+            calc_tirem_loss, filename,
+            **get_dict_of_items_from_dict_of_sequences(main_options, i),
+            profile_options=get_dict_of_items_from_dict_of_sequences(profile_options, i),
+            rfmodel_options=get_dict_of_items_from_dict_of_sequences(rfmodel_options, i))
+        assert_almost_equal(a[:, i], res[0:3], decimal=3)
+        assert b[i] == (res.propagation_mode == 'LOS')
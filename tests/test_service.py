@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.dem.mmap_dem import MMapDEM
+from rfmodel.rfmodel import calc_path_loss_lonlat_batch
+from rfmodel.service import PathLossService
+
+from conftest import stand_in_loss
+
+
+async def post(port: int, path: str, link) -> tuple:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(link).encode()
+    writer.write(f'POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_service(synthetic_dem):
+    dem = synthetic_dem
+    rng = np.random.default_rng(0)
+    count = 50
+    columns = dict(lon1=rng.uniform(34.1, 35.9, count), lat1=rng.uniform(31.1, 32.9, count),
+                   lon2=rng.uniform(34.1, 35.9, count), lat2=rng.uniform(31.1, 32.9, count),
+                   tx_antenna_height=rng.uniform(10, 300, count), rx_antenna_height=np.full(count, 10.0))
+    frequency = np.where(np.arange(count) % 2, 300.0, 3000.0)
+    links = [dict({k: v[i] for k, v in columns.items()}, frequency=frequency[i]) for i in range(count)]
+    a, b = calc_path_loss_lonlat_batch(stand_in_loss, dem, **columns, rfmodel_options=dict(frequency=frequency),
+                                       del_s=1000)
+
+    async def run():
+        service = PathLossService(stand_in_loss, dem, rfmodel_options=dict(frequency=1000.0),
+                                  max_batch_size=16, max_latency=0.05, del_s=1000)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        results = await asyncio.gather(*(post(port, '/loss', link) for link in links))
+        bad_request = await post(port, '/loss', dict(lon1=35))
+        stats = service.stats()
+        # a link without a profile fails only its own request, not the others of its batch
+        degenerate = dict(links[0], lon2=links[0]['lon1'], lat2=links[0]['lat1'])
+        batch_results = await asyncio.gather(*(post(port, '/loss', link) for link in [degenerate] + links[1:8]))
+        too_large = await post(port, '/loss', dict(links[0], padding='x' * 100_000))
+        server.close()
+        await service.stop_batching()
+        return results, bad_request, stats, batch_results, too_large
+
+    results, bad_request, stats, batch_results, too_large = asyncio.run(run())
+    assert batch_results[0][0] == 400
+    assert [status for status, _res in batch_results[1:]] == [200] * 7
+    assert_almost_equal([res['total_loss'] for _status, res in batch_results[1:]], a[1, 1:8], decimal=4)
+    assert too_large[0] == 413
+    assert all(status == 200 for status, _res in results)
+    assert_almost_equal([res['total_loss'] for _status, res in results], a[1], decimal=4)
+    assert [res['los'] for _status, res in results] == b.tolist()
+    assert bad_request[0] == 400
+    assert stats.requests == count
+    assert stats.batches < count
+    assert stats.max_batch <= 16
+
+
+def test_service_backpressure(tmp_path):
+    dem = MMapDEM.from_array(tmp_path / 'dem.raw', np.zeros((10, 10), dtype=np.float32),
+                             geotransform=(34.0, 0.1, 0.0, 33.0, 0.0, -0.1))
+    link = dict(lon1=34.1, lat1=32.9, lon2=34.9, lat2=32.1, tx_antenna_height=10, rx_antenna_height=10)
+
+    async def run():
+        service = PathLossService(stand_in_loss, dem, rfmodel_options=dict(frequency=1000.0),
+                                  max_batch_size=1, max_latency=0, max_queue_size=2, del_s=1000)
+        statuses = [status for status, _res in await asyncio.gather(
+            *(service.handle_request('POST', '/loss', json.dumps(link).encode()) for _ in range(10)))]
+        executor = service._executor
+        await service.stop_batching()
+        return statuses, service.stats(), executor
+
+    statuses, stats, executor = asyncio.run(run())
+    # stopping shuts down the worker thread of the batches
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
+    assert 503 in statuses
+    assert statuses.count(200) == stats.requests
+    assert statuses.count(503) == stats.rejected
@@ -0,0 +1,67 @@
+import pytest
+from numpy.testing import assert_almost_equal
+
+from rfmodel.reference_model import calc_reference_loss
+from rfmodel.rfmodel import calc_path_loss_lonlat
+from rfmodel.rfmodel_types import RFModelPolarization
+from rfmodel.sweep import calc_path_loss_sweep
+
+from conftest import CountingDEM, create_synthetic_dem
+
+
+def scalar_reference_loss(**kwargs):
+    return calc_reference_loss(**kwargs)
+
+
+def test_sweep(tmp_path):
+    dem = create_synthetic_dem(tmp_path / 'dem.raw', CountingDEM)
+    profile_options = dict(lon1=34.5, lat1=31.5, lon2=35.5, lat2=32.5, del_s=500)
+    rfmodel_options = dict(frequency=1000.0, refractivity=301.0, polarization=RFModelPolarization.H)
+    sweep = dict(frequency=[450.0, 900.0, 1800.0], refractivity=[250.0, 350.0], tx_antenna_height=[10.0, 100.0],
+                 rx_msl=[False, True])
+    for calc_loss in (calc_reference_loss, scalar_reference_loss):
+        CountingDEM.sampled_points = 0
+        res = calc_path_loss_sweep(calc_loss, dem, profile_options, rfmodel_options,
+                                   tx_antenna_height=30, rx_antenna_height=600, sweep=sweep, chunk_size=5)
+        npts = CountingDEM.sampled_points
+        assert res.dims == tuple(sweep)
+        assert res.results.shape == (3, 2, 2, 2)
+        for frequency in sweep['frequency']:
+            for tx_antenna_height in sweep['tx_antenna_height']:
+                for rx_msl in sweep['rx_msl']:
+                    expected = calc_path_loss_lonlat(
+                        calc_reference_loss, dem, profile_options,
+                        rfmodel_options=dict(rfmodel_options, frequency=frequency, refractivity=350.0),
+                        tx_antenna_height=tx_antenna_height, rx_antenna_height=600, rx_msl=rx_msl)
+                    res_item = res.sel(frequency=frequency, refractivity=350.0,
+                                       tx_antenna_height=tx_antenna_height, rx_msl=rx_msl)
+                    assert_almost_equal(res_item['total_loss'], expected.total_loss, decimal=4)
+        # a single profile extraction
+        assert CountingDEM.sampled_points > 0
+        assert npts == CountingDEM.sampled_points // (1 + 3 * 2 * 2)
+
+    cases = [dict(frequency=450.0), dict(tx_antenna_height=50.0, polarization=RFModelPolarization.V)]
+    res = calc_path_loss_sweep(calc_reference_loss, dem, profile_options, rfmodel_options,
+                               tx_antenna_height=30, rx_antenna_height=10, cases=cases)
+    assert res.dims == ('case',)
+    assert len(res.to_results()) == 2
+
+
+def test_sweep_tirem(synthetic_dem):
+    tirem3 = pytest.importorskip('tirem.tirem3')
+    dem = synthetic_dem
+    profile_options = dict(lon1=34.5, lat1=31.5, lon2=35.5, lat2=32.5, del_s=500)
+    rfmodel_options = dict(frequency=1000.0, refractivity=301.0, conductivity=0.028, permittivity=15.0,
+                           humidity=10.0, polarization=RFModelPolarization.H)
+    sweep = dict(frequency=[450.0, 900.0], polarization=[RFModelPolarization.H, RFModelPolarization.V])
+    res = calc_path_loss_sweep(tirem3.calc_tirem_loss, dem, profile_options, rfmodel_options,
+                               tx_antenna_height=30, rx_antenna_height=10, sweep=sweep)
+    assert res.results.shape == (2, 2)
+    for frequency in sweep['frequency']:
+        for polarization in sweep['polarization']:
+            expected = calc_path_loss_lonlat(
+                tirem3.calc_tirem_loss, dem, profile_options,
+                rfmodel_options=dict(rfmodel_options, frequency=frequency, polarization=polarization),
+                tx_antenna_height=30, rx_antenna_height=10)
+            res_item = res.sel(frequency=frequency, polarization=polarization)
+            assert_almost_equal(res_item['total_loss'], expected.total_loss, decimal=3)
@@ -1,8 +1,11 @@
+import numpy as np
+import pytest
 from numpy.testing import assert_almost_equal
 
 from rfmodel.read_profile import read_profile
-from rfmodel.rfmodel_types import RFModelPolarization, RFModelReturn
-from tirem.tirem3 import calc_tirem_loss
+from rfmodel.rfmodel_types import RFModelPolarization, RFModelPropagationMode, RFModelReturn
+from tirem import tirem3
+from tirem.tirem3 import calc_tirem_loss, calc_tirem_loss_batch, MODE_LOS, MODE_DIF, MODE_TRO, MODE_INVL
 
 
 def test_tirem():
@@ -63,3 +66,60 @@ def test_tirem():
     for i, o in io:
         res = calc_tirem_loss(num_profile_points=len(elev), profile_elevation=elev, profile_distance=dist, **i, **base)
         o.assert_equal(res, decimal=3)
+
+
+def test_tirem_batch():
+    dist, elev = read_profile('data/ELEV3.DAT')
+    lengths = [len(elev), 100, 3]
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    profile_elevation = np.concatenate([elev[:n] for n in lengths])
+    profile_distance = np.concatenate([dist[:n] for n in lengths])
+    count = len(lengths)
+
+    params = dict(
+        tx_antenna_height=[2, 1000, 10],
+        rx_antenna_height=[2, 1000, 10],
+        frequency=[300, 300, 3000],
+        refractivity=[301] * count,
+        conductivity=[0.028] * count,
+        permittivity=[15] * count,
+        humidity=[10] * count,
+    )
+    polarization = [RFModelPolarization.V, RFModelPolarization.H, RFModelPolarization.V]
+
+    fresnel_clearance = np.empty(count, dtype=np.float32)
+    total_loss = np.empty(count, dtype=np.float32)
+    free_space_loss = np.empty(count, dtype=np.float32)
+    propagation_mode = np.empty(count, dtype=np.uint8)
+    calc_tirem_loss_batch(
+        profile_elevation, profile_distance, offsets,
+        **{k: np.array(v, dtype=np.float32) for k, v in params.items()},
+        polarization=np.array(polarization, dtype=np.uint8),
+        fresnel_clearance=fresnel_clearance, total_loss=total_loss, free_space_loss=free_space_loss,
+        propagation_mode=propagation_mode)
+
+    modes = {'LOS': MODE_LOS, 'DIF': MODE_DIF, 'TRO': MODE_TRO, 'INVL': MODE_INVL}
+    for i in range(count):
+        n = lengths[i]
+        res = calc_tirem_loss(num_profile_points=n, profile_elevation=elev[:n].copy(),
+                              profile_distance=dist[:n].copy(), polarization=polarization[i],
+                              **{k: v[i] for k, v in params.items()})
+        assert_almost_equal((fresnel_clearance[i], total_loss[i], free_space_loss[i]), res[0:3], decimal=4)
+        assert propagation_mode[i] == modes[res.propagation_mode]
+
+    # offsets that would read out of the buffers are refused before the loop
+    for bad_offsets in ([-1, 10, 20, 30], [0, 20, 10, 30]):
+        with pytest.raises(ValueError):
+            calc_tirem_loss_batch(
+                profile_elevation, profile_distance, np.array(bad_offsets, dtype=np.int64),
+                **{k: np.array(v, dtype=np.float32) for k, v in params.items()},
+                polarization=np.array(polarization, dtype=np.uint8),
+                fresnel_clearance=fresnel_clearance, total_loss=total_loss, free_space_loss=free_space_loss,
+                propagation_mode=propagation_mode)
+
+
+def test_tirem_mode_codes():
+    # the batch results are read as RFModelPropagationMode codes
+    for mode in RFModelPropagationMode:
+        assert getattr(tirem3, f'MODE_{mode.name}') == mode